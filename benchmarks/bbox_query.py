@@ -0,0 +1,81 @@
+"""
+Compare the latency of bounding box queries using a spatial (STRtree) query
+on the cell geometries followed by a sort, against range scans over the
+cell-sorted grid index.
+
+Usage:
+    python -m benchmarks.bbox_query [--steps 30] [--fraction 0.1] [--queries 20]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import GLOFAS_ROI, make_roi_dataset
+from flood_api.tests.reference import get_data_for_roi
+from flood_api.utils.geospatial_operations import (
+    create_polygon_from_bounds,
+    get_data_for_bbox,
+)
+from flood_api.utils.grid_index import GridIndex
+
+
+def spatial_bbox_query(bbox, gdf):
+    roi = create_polygon_from_bounds(*bbox, buffer=0, precision=9)
+    primary_cells_df, _ = get_data_for_roi(roi=roi, gdf=gdf)
+    sort_columns = ["latitude", "longitude"]
+    if "step" in gdf.columns:
+        sort_columns.append("step")
+    return primary_cells_df.sort_values(by=sort_columns)
+
+
+def grid_bbox_query(bbox, index):
+    return get_data_for_bbox(bbox=bbox, index=index)
+
+
+def random_bboxes(n: int, size: float, seed: int = 1) -> list[tuple]:
+    rng = np.random.default_rng(seed)
+    min_lats = rng.uniform(GLOFAS_ROI["min_lat"], GLOFAS_ROI["max_lat"] - size, n)
+    min_lons = rng.uniform(GLOFAS_ROI["min_lon"], GLOFAS_ROI["max_lon"] - size, n)
+    return [
+        (min_lat, min_lat + size, min_lon, min_lon + size)
+        for min_lat, min_lon in zip(min_lats, min_lons)
+    ]
+
+
+def time_queries(query, bboxes, data) -> tuple[np.ndarray, int]:
+    timings = np.empty(len(bboxes))
+    rows = 0
+    for i, bbox in enumerate(bboxes):
+        start = time.perf_counter()
+        rows += len(query(bbox, data))
+        timings[i] = time.perf_counter() - start
+    return timings, rows
+
+
+def report(name: str, timings: np.ndarray, rows: int) -> None:
+    p50, p99 = np.percentile(timings, [50, 99]) * 1e3
+    print(f"{name:<30} p50 {p50:9.2f} ms   p99 {p99:9.2f} ms   ({rows} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=1)
+    parser.add_argument("--fraction", type=float, default=1.0)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    gdf = make_roi_dataset(steps=args.steps, fraction=args.fraction)
+    print(f"Dataset: {len(gdf)} rows")
+    gdf.sindex
+    index = GridIndex(gdf)
+
+    for size in (0.5, 5.0, 20.0):
+        bboxes = random_bboxes(args.queries, size)
+        report(f"STRtree {size} deg", *time_queries(spatial_bbox_query, bboxes, gdf))
+        report(f"Grid index {size} deg", *time_queries(grid_bbox_query, bboxes, index))
+
+
+if __name__ == "__main__":
+    main()
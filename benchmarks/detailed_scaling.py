@@ -0,0 +1,75 @@
+"""
+Measure how the cost of a date-filtered `/detailed` point query scales with
+the size of the dataset, comparing a date filter applied before a spatial
+query (which builds a new spatial index per request) against a lookup in
+the grid index with the date filter applied to the matched rows only.
+
+Usage:
+    python -m benchmarks.detailed_scaling [--fractions 0.001 0.01 0.1] [--queries 20]
+"""
+
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_roi_dataset, random_points
+from flood_api.settings import settings
+from flood_api.utils.geospatial_operations import (
+    create_polygon_from_bounds,
+    get_data_for_point,
+    get_grid_cell_bounds,
+)
+from flood_api.utils.grid_index import GridIndex
+
+GLOFAS_RESOLUTION = settings.glofas_resolution
+DATE_RANGE = (date(2023, 11, 15), date(2023, 11, 25))
+
+
+def filter_first_point_query(latitude, longitude, gdf):
+    cell_bounds = get_grid_cell_bounds(latitude, longitude)
+    roi = create_polygon_from_bounds(*cell_bounds, buffer=-GLOFAS_RESOLUTION / 2)
+    gdf = gdf[gdf["valid_for"].between(*map(pd.Timestamp, DATE_RANGE))]
+    return gdf.iloc[gdf.sindex.query(roi, predicate="intersects")]
+
+
+def grid_point_query(latitude, longitude, index):
+    return get_data_for_point(
+        latitude=latitude, longitude=longitude, index=index, date_range=DATE_RANGE
+    )
+
+
+def median_latency(query, latitudes, longitudes, data) -> float:
+    timings = []
+    for latitude, longitude in zip(latitudes, longitudes):
+        start = time.perf_counter()
+        query(latitude, longitude, data)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--fractions", type=float, nargs="+", default=[0.001, 0.01, 0.1]
+    )
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    latitudes, longitudes = random_points(args.queries)
+    print(f"{'rows':>10} {'filter first (ms)':>20} {'grid index (ms)':>20}")
+    for fraction in args.fractions:
+        gdf = make_roi_dataset(steps=args.steps, fraction=fraction)
+        index = GridIndex(gdf)
+        filter_first = median_latency(
+            filter_first_point_query, latitudes, longitudes, gdf
+        )
+        grid = median_latency(grid_point_query, latitudes, longitudes, index)
+        print(f"{len(gdf):>10} {filter_first * 1e3:>20.3f} {grid * 1e3:>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
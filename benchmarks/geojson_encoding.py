@@ -0,0 +1,83 @@
+"""
+Compare encoding a bounding box response by serializing the GeoDataFrame
+with `to_json`, parsing it back, validating it with the response model and
+serializing it again, against writing the GeoJSON directly from the columns
+and against assembling it from features pre-rendered at data load.
+
+Usage:
+    python -m benchmarks.geojson_encoding [--cells 1000 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_roi_dataset
+from flood_api.models.detailed_types import (
+    DetailedFeatureCollection,
+    DetailedProperties,
+)
+from flood_api.utils.json_utilities import FeatureFragments, dataframe_to_geojson
+
+COLUMNS = list(DetailedProperties.model_fields.keys())
+
+
+def round_trip_encoding(gdf) -> bytes:
+    gdf = gdf.reset_index(drop=True)[COLUMNS + ["geometry"]].copy()
+    for col in ["issued_on", "valid_for"]:
+        gdf[col] = gdf[col].dt.strftime("%Y-%m-%d")
+    geojson = json.loads(gdf.to_json())
+    return DetailedFeatureCollection.model_validate(geojson).model_dump_json().encode()
+
+
+def direct_encoding(gdf) -> bytes:
+    return dataframe_to_geojson(gdf, COLUMNS)
+
+
+def median_latency(encode, gdf, repeat) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(gdf)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cells", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    gdf = make_roi_dataset(steps=args.steps, fraction=max(args.cells) / 644000)
+
+    start = time.perf_counter()
+    fragments = FeatureFragments(gdf, COLUMNS)
+    print(
+        f"Pre-rendered {len(gdf)} features ({fragments.buffer.nbytes / 2**20:.0f} MiB)"
+        f" in {time.perf_counter() - start:.1f} s"
+    )
+
+    def prerendered_encoding(subset) -> bytes:
+        return fragments.feature_collection(np.arange(len(subset)))
+
+    print(
+        f"{'features':>10} {'round trip (ms)':>18} {'direct (ms)':>14}"
+        f" {'pre-rendered (ms)':>20}"
+    )
+    for cells in args.cells:
+        subset = gdf.head(cells * args.steps)
+        round_trip = median_latency(round_trip_encoding, subset, args.repeat)
+        direct = median_latency(direct_encoding, subset, args.repeat)
+        prerendered = median_latency(prerendered_encoding, subset, args.repeat)
+        print(
+            f"{len(subset):>10} {round_trip * 1e3:>18.1f} {direct * 1e3:>14.1f}"
+            f" {prerendered * 1e3:>20.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
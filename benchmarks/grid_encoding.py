@@ -0,0 +1,74 @@
+"""
+Compare the encode time and payload size of bounding box responses as
+GeoJSON against the compact grid format, for bounding boxes of increasing
+size over a dataset with one row per cell (like the summary forecast).
+
+Usage:
+    python -m benchmarks.grid_encoding [--sizes 1 5 20] [--repeat 5]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import GLOFAS_ROI, make_roi_dataset
+from flood_api.models.detailed_types import DetailedProperties
+from flood_api.routers.flood import grid_response
+from flood_api.utils.geospatial_operations import get_data_for_bbox
+from flood_api.utils.grid_index import GridIndex
+from flood_api.utils.json_utilities import dataframe_to_geojson
+
+# The synthetic dataset holds the detailed forecast columns
+COLUMNS = [
+    col
+    for col in DetailedProperties.model_fields.keys()
+    if col not in ("valid_for", "step")
+]
+
+
+def median_latency(encode, repeat) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(encode())
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--fraction", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    index = GridIndex(make_roi_dataset(steps=1, fraction=args.fraction))
+    print(
+        f"{'bbox (deg)':>10} {'cells':>8} {'geojson (ms)':>13} {'geojson (MiB)':>14}"
+        f" {'grid (ms)':>10} {'grid (MiB)':>11}"
+    )
+    for size in args.sizes:
+        bbox = (
+            GLOFAS_ROI["min_lat"],
+            GLOFAS_ROI["min_lat"] + size,
+            GLOFAS_ROI["min_lon"],
+            GLOFAS_ROI["min_lon"] + size,
+        )
+        df = get_data_for_bbox(bbox=bbox, index=index)
+
+        geojson, geojson_size = median_latency(
+            lambda: dataframe_to_geojson(df, COLUMNS), args.repeat
+        )
+        grid, grid_size = median_latency(
+            lambda: grid_response(index, bbox, df, COLUMNS).body, args.repeat
+        )
+        print(
+            f"{size:>10g} {len(df):>8} {geojson * 1e3:>13.1f}"
+            f" {geojson_size / 2**20:>14.2f} {grid * 1e3:>10.1f}"
+            f" {grid_size / 2**20:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare the latency of point queries using a spatial (STRtree) query on the
+cell geometries against a lookup in the grid index.
+
+Usage:
+    python -m benchmarks.point_query [--steps 30] [--fraction 0.1] [--queries 1000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_roi_dataset, random_points
+from flood_api.settings import settings
+from flood_api.tests.reference import get_data_for_roi
+from flood_api.utils.geospatial_operations import (
+    create_polygon_from_bounds,
+    get_data_for_point,
+    get_grid_cell_bounds,
+)
+from flood_api.utils.grid_index import GridIndex
+
+GLOFAS_RESOLUTION = settings.glofas_resolution
+
+
+def spatial_point_query(latitude, longitude, gdf, include_neighbors):
+    cell_bounds = get_grid_cell_bounds(latitude, longitude)
+    roi = create_polygon_from_bounds(*cell_bounds, buffer=-GLOFAS_RESOLUTION / 2)
+    if include_neighbors:
+        expanded_roi = create_polygon_from_bounds(
+            *cell_bounds, buffer=GLOFAS_RESOLUTION / 2
+        )
+    else:
+        expanded_roi = None
+    return get_data_for_roi(roi=roi, gdf=gdf, expanded_roi=expanded_roi)
+
+
+def grid_point_query(latitude, longitude, index, include_neighbors):
+    return get_data_for_point(
+        latitude=latitude,
+        longitude=longitude,
+        index=index,
+        include_neighbors=include_neighbors,
+    )
+
+
+def time_queries(query, latitudes, longitudes, data, include_neighbors) -> np.ndarray:
+    timings = np.empty(len(latitudes))
+    for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        start = time.perf_counter()
+        query(latitude, longitude, data, include_neighbors)
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def report(name: str, timings: np.ndarray) -> None:
+    p50, p99 = np.percentile(timings, [50, 99]) * 1e6
+    print(f"{name:<40} p50 {p50:10.1f} us   p99 {p99:10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=1)
+    parser.add_argument("--fraction", type=float, default=1.0)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    gdf = make_roi_dataset(steps=args.steps, fraction=args.fraction)
+    print(f"Dataset: {len(gdf)} rows")
+
+    start = time.perf_counter()
+    gdf.sindex
+    print(f"STRtree build: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    index = GridIndex(gdf)
+    print(f"Grid index build: {time.perf_counter() - start:.2f} s")
+
+    latitudes, longitudes = random_points(args.queries)
+    for include_neighbors in (False, True):
+        suffix = " + neighbors" if include_neighbors else ""
+        report(
+            "STRtree" + suffix,
+            time_queries(
+                spatial_point_query, latitudes, longitudes, gdf, include_neighbors
+            ),
+        )
+        report(
+            "Grid index" + suffix,
+            time_queries(
+                grid_point_query, latitudes, longitudes, index, include_neighbors
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import box
+
+from flood_api.settings import settings
+
+GLOFAS_ROI = settings.glofas_roi
+GLOFAS_RESOLUTION = settings.glofas_resolution
+GLOFAS_PRECISION = settings.glofas_precision
+
+
+def make_roi_dataset(
+    steps: int = 1, fraction: float = 1.0, seed: int = 0
+) -> gpd.GeoDataFrame:
+    """
+    Create a synthetic dataset covering the region of interest (ROI) with
+    one row per grid cell and forecast step, laid out like the GloFAS data.
+
+    Parameters:
+    - steps (int, optional): Number of forecast steps per cell. Defaults to 1.
+    - fraction (float, optional): Fraction of the ROI cells to include. Defaults to 1.
+    - seed (int, optional): Seed for the random number generator. Defaults to 0.
+
+    Returns:
+    GeoDataFrame: The synthetic dataset in random row order.
+    """
+    rng = np.random.default_rng(seed)
+
+    n_rows = round((GLOFAS_ROI["max_lat"] - GLOFAS_ROI["min_lat"]) / GLOFAS_RESOLUTION)
+    n_cols = round((GLOFAS_ROI["max_lon"] - GLOFAS_ROI["min_lon"]) / GLOFAS_RESOLUTION)
+    keys = np.arange(n_rows * n_cols)
+    if fraction < 1.0:
+        keys = np.sort(rng.choice(keys, int(keys.size * fraction), replace=False))
+
+    min_lat = np.round(
+        GLOFAS_ROI["min_lat"] + (keys // n_cols) * GLOFAS_RESOLUTION, GLOFAS_PRECISION
+    )
+    min_lon = np.round(
+        GLOFAS_ROI["min_lon"] + (keys % n_cols) * GLOFAS_RESOLUTION, GLOFAS_PRECISION
+    )
+
+    issued_on = pd.Timestamp("2023-11-10")
+    step = np.tile(np.arange(1, steps + 1), keys.size)
+    df = pd.DataFrame(
+        {
+            "latitude": np.repeat(min_lat + GLOFAS_RESOLUTION / 2, steps).round(
+                GLOFAS_PRECISION
+            ),
+            "longitude": np.repeat(min_lon + GLOFAS_RESOLUTION / 2, steps).round(
+                GLOFAS_PRECISION
+            ),
+            "issued_on": issued_on,
+            "valid_for": issued_on + pd.to_timedelta(step - 1, unit="D"),
+            "step": step,
+            **{
+                col: rng.gamma(2.0, 50.0, step.size)
+                for col in ["min_dis", "q1_dis", "median_dis", "q3_dis", "max_dis"]
+            },
+            **{
+                col: rng.random(step.size)
+                for col in ["p_above_2y", "p_above_5y", "p_above_20y"]
+            },
+        }
+    )
+    geometry = box(
+        np.repeat(min_lon, steps),
+        np.repeat(min_lat, steps),
+        np.repeat(np.round(min_lon + GLOFAS_RESOLUTION, GLOFAS_PRECISION), steps),
+        np.repeat(np.round(min_lat + GLOFAS_RESOLUTION, GLOFAS_PRECISION), steps),
+    )
+    gdf = gpd.GeoDataFrame(df, geometry=geometry)
+
+    return gdf.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def random_points(n: int, seed: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Draw random query coordinates within the region of interest (ROI).
+
+    Parameters:
+    - n (int): Number of points.
+    - seed (int, optional): Seed for the random number generator. Defaults to 1.
+
+    Returns:
+    tuple: The latitudes and longitudes of the points.
+    """
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(GLOFAS_ROI["min_lat"], GLOFAS_ROI["max_lat"], n)
+    longitudes = rng.uniform(GLOFAS_ROI["min_lon"], GLOFAS_ROI["max_lon"], n)
+    return latitudes, longitudes
@@ -6,16 +6,22 @@ from fastapi import FastAPI
 from fastapi.openapi.docs import get_redoc_html
 from prometheus_fastapi_instrumentator import Instrumentator
 
-from flood_api.dependencies.flooddata import fetch_flood_data
+from flood_api.dependencies.flooddata import (
+    fetch_flood_data,
+    schedule_flood_data_reload,
+)
 from flood_api.openapi import openapi
 from flood_api.routers import flood, healthcheck
 from flood_api.settings import settings
+from flood_api.utils.compression import CompressionMiddleware
 
 
 @asynccontextmanager
 async def lifespan(flood_app: FastAPI):
     await fetch_flood_data(flood_app)
+    reload_schedule = schedule_flood_data_reload(flood_app)
     yield
+    reload_schedule.stop()
 
 
 app = FastAPI(
@@ -25,6 +31,7 @@ app = FastAPI(
 )
 app.include_router(flood.router)
 app.include_router(healthcheck.router)
+app.add_middleware(CompressionMiddleware)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -51,5 +58,6 @@ if __name__ == "__main__":
         host=settings.uvicorn_host,
         port=settings.uvicorn_port,
         reload=settings.uvicorn_reload,
+        workers=settings.uvicorn_workers,
         proxy_headers=settings.uvicorn_proxy_headers,
     )
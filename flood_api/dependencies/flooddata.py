@@ -1,60 +1,279 @@
 import asyncio
+import itertools
 import logging
+import posixpath
+import resource
+import threading
+import time
+from datetime import timezone
 from typing import Annotated
 
+import aiocron
+import fsspec
+import fsspec.asyn
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from fastapi import Depends, FastAPI, Request
-from shapely import wkt
+from prometheus_client import Counter, Gauge, Histogram
+from pydantic import BaseModel
 
 from flood_api.models.detailed_types import DetailedProperties
 from flood_api.models.summary_types import SummaryProperties
+from flood_api.models.threshold_types import ThresholdProperties
 from flood_api.settings import settings
+from flood_api.utils.geospatial_operations import create_cell_polygons
+from flood_api.utils.grid_index import GridIndex
+from flood_api.utils.json_utilities import FeatureFragments
+from flood_api.utils.snapshots import load_snapshot, save_snapshot, snapshot_lock
 
 logger = logging.getLogger(__name__)
 
+# Every reload of the data starts a new generation, so that responses
+# cached for the previous data are never served again
+generations = itertools.count(1)
 
-def get_summary_data(request: Request) -> gpd.GeoDataFrame | None:
+# Attributes of the app holding the index of each dataset
+DATASETS = ("summary_data", "detailed_data", "threshold_data")
+
+DATA_FETCHED_BYTES = Counter(
+    "flood_api_data_fetched_bytes",
+    "Bytes of dataset files downloaded on reloads",
+    ["dataset"],
+)
+DATA_FETCHED_PARTS = Counter(
+    "flood_api_data_fetched_parts",
+    "Dataset files downloaded and decoded on reloads",
+    ["dataset"],
+)
+DATA_PENDING_PARTS = Gauge(
+    "flood_api_data_pending_parts",
+    "Dataset files of the running reload that are not downloaded and decoded yet",
+    ["dataset"],
+)
+PART_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PART_DOWNLOAD_SECONDS = Histogram(
+    "flood_api_data_part_download_seconds",
+    "Time to download a dataset file",
+    ["dataset"],
+    buckets=PART_SECONDS_BUCKETS,
+)
+PART_DECODE_SECONDS = Histogram(
+    "flood_api_data_part_decode_seconds",
+    "Time to decode the served columns of a downloaded dataset file",
+    ["dataset"],
+    buckets=PART_SECONDS_BUCKETS,
+)
+DATA_SKIPPED_BYTES = Counter(
+    "flood_api_data_skipped_bytes",
+    "Bytes of unchanged dataset files that were not downloaded on reloads",
+    ["dataset"],
+)
+DATASET_BYTES = Gauge(
+    "flood_api_dataset_bytes",
+    "Size of the columns and pre-rendered features of each dataset, in the heap or mapped",
+    ["dataset"],
+)
+DATA_LOAD_PEAK_RSS_BYTES = Gauge(
+    "flood_api_data_load_peak_rss_bytes",
+    "Peak resident memory of the process during the last load of each dataset",
+    ["dataset"],
+)
+DATA_LOAD_RSS_INCREASE_BYTES = Gauge(
+    "flood_api_data_load_rss_increase_bytes",
+    "Increase of the resident memory of the process over the last load of each dataset",
+    ["dataset"],
+)
+
+# Bounds the number of datasets that are built at the same time
+load_semaphore = threading.Semaphore(settings.data_load_concurrency)
+
+
+def get_summary_data(request: Request) -> GridIndex | None:
     return request.app.summary_data
 
 
-def get_detailed_data(request: Request) -> gpd.GeoDataFrame | None:
+def get_detailed_data(request: Request) -> GridIndex | None:
     return request.app.detailed_data
 
 
-def get_threshold_data(request: Request) -> gpd.GeoDataFrame | None:
+def get_threshold_data(request: Request) -> GridIndex | None:
     return request.app.threshold_data
 
 
-SummaryDataDep = Annotated[gpd.GeoDataFrame, Depends(get_summary_data)]
-DetailedDataDep = Annotated[gpd.GeoDataFrame, Depends(get_detailed_data)]
-ThresholdDataDep = Annotated[gpd.GeoDataFrame, Depends(get_threshold_data)]
+SummaryDataDep = Annotated[GridIndex, Depends(get_summary_data)]
+DetailedDataDep = Annotated[GridIndex, Depends(get_detailed_data)]
+ThresholdDataDep = Annotated[GridIndex, Depends(get_threshold_data)]
+
+
+def dataset_filesystem(path: str) -> fsspec.AbstractFileSystem:
+    # The datasets are public, so S3 is accessed anonymously
+    storage_options = {"anon": True} if path.startswith("s3://") else {}
+    filesystem, _ = fsspec.core.url_to_fs(path, **storage_options)
+    return filesystem
+
+
+def list_parquet_parts(path: str) -> dict[str, tuple]:
+    """
+    List the parquet files of a dataset, which is either a single file or
+    a directory of parts, along with their S3 metadata. This is a cheap
+    metadata request which tells whether the files changed since they were
+    last listed.
+
+    Parameters:
+    - path (str): The path of the dataset.
+
+    Returns:
+    dict: The `(ETag, LastModified, size)` of every file, keyed by its path.
+    """
+    filesystem = dataset_filesystem(path)
+    # Listings are cached by the file system, but the files may have changed
+    filesystem.invalidate_cache(path)
+    files = filesystem.find(path, detail=True)
+
+    return {
+        filesystem.unstrip_protocol(name): (
+            info.get("ETag"),
+            # Local files, as used in tests, only have a modification time
+            info.get("LastModified", info.get("mtime")),
+            info["size"],
+        )
+        for name, info in sorted(files.items())
+        # Skip metadata and marker files, like readers of parquet datasets do
+        if not posixpath.basename(name).startswith(("_", "."))
+    }
+
+
+async def fetch_parts(
+    path: str,
+    filesystem: fsspec.AbstractFileSystem,
+    parts: list[str],
+    columns: list[str],
+) -> list[pa.Table]:
+    """
+    Download the files of a dataset concurrently, at most
+    `settings.data_fetch_concurrency` at a time, and decode every file in a
+    thread as soon as it is downloaded, while the next ones are downloading.
+
+    Parameters:
+    - path (str): The path of the dataset, which labels the metrics.
+    - filesystem (AbstractFileSystem): The file system of the dataset.
+    - parts (list): The paths of the files to fetch.
+    - columns (list): The columns to decode.
+
+    Returns:
+    list: The decoded tables, in the order of the files.
+    """
+    semaphore = asyncio.Semaphore(settings.data_fetch_concurrency)
+
+    async def fetch_part(part: str) -> pa.Table:
+        # A file is decoded before its slot is released, so that the raw
+        # bytes of at most `data_fetch_concurrency` files are held at a time.
+        # Decoding still overlaps with the downloads of the other files.
+        async with semaphore:
+            start = time.perf_counter()
+            if filesystem.async_impl:
+                data = await filesystem._cat_file(filesystem._strip_protocol(part))
+            else:
+                data = await asyncio.to_thread(filesystem.cat_file, part)
+            download_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            # Only the given columns are decoded, on multiple threads
+            table = await asyncio.to_thread(
+                pq.read_table, pa.BufferReader(data), columns=columns, use_threads=True
+            )
+            decode_time = time.perf_counter() - start
+
+        PART_DOWNLOAD_SECONDS.labels(path).observe(download_time)
+        PART_DECODE_SECONDS.labels(path).observe(decode_time)
+        DATA_FETCHED_BYTES.labels(path).inc(len(data))
+        DATA_FETCHED_PARTS.labels(path).inc()
+        DATA_PENDING_PARTS.labels(path).dec()
+        logger.info(
+            "Fetched %s: %.1f MiB downloaded in %.2f s, decoded in %.2f s",
+            part,
+            len(data) / 2**20,
+            download_time,
+            decode_time,
+        )
+        return table
+
+    DATA_PENDING_PARTS.labels(path).set(len(parts))
+    try:
+        # The other downloads are cancelled if one of them fails
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(fetch_part(part)) for part in parts]
+    except ExceptionGroup as errors:
+        raise errors.exceptions[0]
+    finally:
+        DATA_PENDING_PARTS.labels(path).set(0)
+    return [task.result() for task in tasks]
 
 
-def fetch_parquet(path) -> gpd.GeoDataFrame | None:
+def fetch_parquet(
+    path: str, parts: list[str], columns: list[str]
+) -> gpd.GeoDataFrame | None:
     try:
-        logger.info("Reloading data from %s", path)
+        logger.info("Reloading data from %d files of %s", len(parts), path)
+        filesystem = dataset_filesystem(path)
+        if filesystem.async_impl:
+            # S3 requests run on the event loop of the file system
+            tables = fsspec.asyn.sync(
+                filesystem.loop, fetch_parts, path, filesystem, parts, columns
+            )
+        else:
+            tables = asyncio.run(fetch_parts(path, filesystem, parts, columns))
+
+        # Keep track of the file of every row, so that the rows of
+        # unchanged files can be reused on the next reload
+        tables = [
+            table.append_column(
+                "part",
+                pa.DictionaryArray.from_arrays(
+                    pa.array(np.full(len(table), code, dtype=np.int32)),
+                    pa.array(parts),
+                ),
+            )
+            for code, table in enumerate(tables)
+        ]
+        table = pa.concat_tables(tables)
+        del tables
 
-        df = pd.read_parquet(
-            path,
-            engine="fastparquet",
-            storage_options={"anon": True},
+        # Converted column by column, releasing every Arrow column once it is
+        # converted, so that the data is never held twice. Dates are converted
+        # to datetime64. Strings are kept as objects, with missing values as
+        # None, which the response encoders write as null.
+        df = table.to_pandas(
+            self_destruct=True,
+            split_blocks=True,
+            date_as_object=False,
+            coerce_temporal_nanoseconds=True,
         )
+        del table
+        pa.default_memory_pool().release_unused()
 
-        # Convert date fields to date objects
+        # Keep date fields as datetime64 truncated to the day. They are
+        # only formatted as dates when the response is serialized.
         date_fields = set(
             DetailedProperties.get_date_fields() + SummaryProperties.get_date_fields()
         )
         for col in date_fields:
-            if col in df.columns and isinstance(df[col].iloc[0], pd.Timestamp):
-                df[col] = pd.to_datetime(df[col]).dt.date
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col]).dt.normalize()
 
-        # Convert WKT strings to geometry objects
-        df["geometry"] = df["wkt"].apply(wkt.loads)
-
-        gdf = gpd.GeoDataFrame(df, geometry="geometry").drop(columns="wkt")
+        # The geometry of a row is the polygon of its cell, so it is built
+        # from the cell center instead of parsing the WKT of every row
+        gdf = gpd.GeoDataFrame(
+            df,
+            geometry=create_cell_polygons(
+                df["latitude"].to_numpy(), df["longitude"].to_numpy()
+            ),
+        )
 
-        logger.info("Done reloading data from %s", path)
+        logger.info("Done reloading data from %d files of %s", len(parts), path)
 
         return gdf
     except Exception as e:
@@ -62,22 +281,266 @@ def fetch_parquet(path) -> gpd.GeoDataFrame | None:
         return None
 
 
+def resident_bytes() -> int | None:
+    # The current resident set size, which statm reports in pages
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+def reset_peak_resident_bytes() -> bool:
+    # Writing 5 to clear_refs resets the peak resident set size of the
+    # process to its current resident set size (Linux only)
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_resident_bytes() -> int | None:
+    # The peak resident set size since it was last reset, in kilobytes
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def report_memory(
+    path: str,
+    index: GridIndex,
+    rss_before: int | None,
+    rss_after: int | None,
+    peak_rss: int | None,
+):
+    """
+    Report the size of a loaded dataset and the memory used to load it.
+
+    Parameters:
+    - path (str): The path of the dataset.
+    - index (GridIndex): The loaded index of the dataset.
+    - rss_before (int | None): The resident memory before the load.
+    - rss_after (int | None): The resident memory after the load.
+    - peak_rss (int | None): The peak resident memory during the load, or
+    None if it could not be measured.
+    """
+    dataset_bytes = index.gdf.memory_usage(index=False).sum()
+    if index.fragments is not None:
+        dataset_bytes += index.fragments.buffer.nbytes
+    DATASET_BYTES.labels(path).set(dataset_bytes)
+
+    message = "Loaded %s: %.1f MiB of data"
+    args = [path, dataset_bytes / 2**20]
+    if rss_before is not None and rss_after is not None:
+        DATA_LOAD_RSS_INCREASE_BYTES.labels(path).set(rss_after - rss_before)
+        message += ", RSS from %.1f MiB to %.1f MiB"
+        args += [rss_before / 2**20, rss_after / 2**20]
+    if peak_rss is not None:
+        DATA_LOAD_PEAK_RSS_BYTES.labels(path).set(peak_rss)
+        message += ", peak RSS of %.1f MiB during the load"
+        args.append(peak_rss / 2**20)
+    logger.info(message, *args)
+
+
+def load_grid_index(
+    path, properties: type[BaseModel], current_index: GridIndex | None = None
+) -> GridIndex | None:
+    try:
+        parts = list_parquet_parts(path)
+    except Exception as e:
+        logger.error(e)
+        return None
+    if not parts:
+        logger.error("No files found at %s", path)
+        return None
+
+    current_parts = current_index.parts if current_index is not None else {}
+    unchanged_parts = [
+        part for part, metadata in parts.items() if current_parts.get(part) == metadata
+    ]
+    changed_parts = [part for part in parts if part not in unchanged_parts]
+
+    DATA_SKIPPED_BYTES.labels(path).inc(sum(parts[part][2] for part in unchanged_parts))
+    if not changed_parts and len(parts) == len(current_parts):
+        logger.info("No changes to the files of %s", path)
+        return current_index
+
+    # Datasets are built one at a time (by default), so that the memory
+    # needed to build them adds to the served data for one dataset only.
+    # Worker processes sharing the snapshot directory take turns, and only
+    # the first one to see new files builds them. The others load the
+    # published snapshot of the same files.
+    with load_semaphore, snapshot_lock(path):
+        # The peak is reset so that it covers this load only, rather than
+        # the lifetime of the process. Datasets loaded concurrently, if
+        # allowed, share their peaks.
+        rss_before = resident_bytes()
+        peak_reset = reset_peak_resident_bytes()
+        index = restore_grid_index(path, properties, parts)
+        if index is None:
+            index = build_grid_index(
+                path, properties, parts, unchanged_parts, changed_parts, current_index
+            )
+            if index is not None:
+                index = publish_grid_index(path, properties, index)
+        peak_rss = peak_resident_bytes() if peak_reset else None
+        rss_after = resident_bytes()
+    if index is not None:
+        report_memory(path, index, rss_before, rss_after, peak_rss)
+    return index
+
+
+def publish_grid_index(
+    path: str, properties: type[BaseModel], index: GridIndex
+) -> GridIndex:
+    # Save the snapshot of the index, and serve the data from its mapped
+    # files instead of the heap, as the other worker processes will
+    try:
+        save_snapshot(path, properties, index)
+    except Exception as e:
+        logger.error("Could not save the snapshot of %s: %s", path, e)
+        return index
+    return restore_grid_index(path, properties, index.parts) or index
+
+
+def restore_grid_index(
+    path: str, properties: type[BaseModel], parts: dict[str, tuple]
+) -> GridIndex | None:
+    try:
+        index = load_snapshot(path, properties, parts)
+    except Exception as e:
+        logger.error("Could not load the snapshot of %s: %s", path, e)
+        return None
+    if index is None:
+        return None
+
+    # The snapshot may have been saved with other settings
+    if not settings.prerender_features:
+        index.fragments = None
+    elif index.fragments is None:
+        render_features(path, properties, index)
+    return index
+
+
+def build_grid_index(
+    path: str,
+    properties: type[BaseModel],
+    parts: dict[str, tuple],
+    unchanged_parts: list[str],
+    changed_parts: list[str],
+    current_index: GridIndex | None,
+) -> GridIndex | None:
+    # Only the cell centers and the served properties are read. In
+    # particular the WKT of the cell polygons is not, as the polygons are
+    # built from the cell centers.
+    columns = ["latitude", "longitude", *properties.model_fields]
+    gdf = fetch_parquet(path, changed_parts, columns) if changed_parts else None
+    if gdf is None and changed_parts:
+        return None
+
+    if unchanged_parts:
+        # Only the changed files were fetched, the other rows are reused
+        logger.info("Reusing the rows of %d unchanged files", len(unchanged_parts))
+        reused_gdf = current_index.gdf[current_index.gdf["part"].isin(unchanged_parts)]
+        gdf = pd.concat(
+            [
+                df.astype({"part": pd.CategoricalDtype(list(parts))})
+                for df in [reused_gdf, gdf]
+                if df is not None
+            ],
+            ignore_index=True,
+        )
+
+    logger.info("Building grid index for %s", path)
+    index = GridIndex(gdf)
+    index.parts = parts
+
+    if settings.prerender_features:
+        render_features(path, properties, index)
+
+    return index
+
+
+def render_features(path: str, properties: type[BaseModel], index: GridIndex):
+    # Encode the GeoJSON feature of every row once, so that responses
+    # only need to concatenate them
+    logger.info("Pre-rendering features for %s", path)
+    index.fragments = FeatureFragments(index.gdf, list(properties.model_fields.keys()))
+
+
 async def fetch_flood_data(app: FastAPI):
     loop = asyncio.get_event_loop()
-    (
-        summary_data,
-        detailed_data,
-        threshold_data,
-    ) = await asyncio.gather(
-        # loop.run_in_executor to prevent blocking the main thread
-        loop.run_in_executor(None, fetch_parquet, settings.summary_data_path),
-        loop.run_in_executor(None, fetch_parquet, settings.detailed_data_path),
-        loop.run_in_executor(None, fetch_parquet, settings.threshold_data_path),
+    loaded_data = await asyncio.gather(
+        *(
+            # loop.run_in_executor to prevent blocking the main thread
+            loop.run_in_executor(
+                None, load_grid_index, path, properties, getattr(app, name, None)
+            )
+            for name, path, properties in [
+                ("summary_data", settings.summary_data_path, SummaryProperties),
+                ("detailed_data", settings.detailed_data_path, DetailedProperties),
+                ("threshold_data", settings.threshold_data_path, ThresholdProperties),
+            ]
+        )
     )
 
-    if summary_data is not None:
-        app.summary_data = summary_data
-    if detailed_data is not None:
-        app.detailed_data = detailed_data
-    if threshold_data is not None:
-        app.threshold_data = threshold_data
+    generation = next(generations)
+    for name, index in zip(DATASETS, loaded_data):
+        current_index = getattr(app, name, None)
+        if index is None:
+            # Keep serving the current data if loading failed
+            continue
+        if current_index is index:
+            continue
+        if current_index is not None and (
+            current_index.content_hash == index.content_hash
+        ):
+            # Keep the current index, and the responses cached for it. The
+            # files were rewritten with the same content, so their new
+            # metadata is kept, or they would be downloaded on every reload.
+            current_index.parts = index.parts
+            logger.info("No changes to %s", name)
+            continue
+
+        # Swapping the index is a single assignment. Requests that already
+        # resolved the current index keep using it until they complete.
+        index.generation = generation
+        setattr(app, name, index)
+        logger.info("Swapped in %s of generation %d", name, generation)
+
+
+def schedule_flood_data_reload(app: FastAPI) -> aiocron.Cron:
+    """
+    Reload the flood data on the schedule given by `settings.data_reload_cron`
+    (in UTC), swapping in the new data without interrupting the service.
+    A reload is skipped if the previous one is still running.
+
+    Parameters:
+    - app (FastAPI): The app serving the data.
+
+    Returns:
+    Cron: The started schedule, to be stopped on shutdown.
+    """
+    reload_lock = asyncio.Lock()
+
+    async def reload_flood_data():
+        if reload_lock.locked():
+            logger.warning("Skipping the reload of the flood data, one is running")
+            return
+        async with reload_lock:
+            logger.info("Reloading flood data")
+            await fetch_flood_data(app)
+
+    return aiocron.crontab(
+        settings.data_reload_cron,
+        func=reload_flood_data,
+        start=True,
+        tz=timezone.utc,
+    )
@@ -1,11 +1,26 @@
 from datetime import date
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, Query
+import numpy as np
+from fastapi import Depends, HTTPException, Query, Request
+from pydantic import BaseModel
 
+from flood_api.models.detailed_types import DetailedLayout, DetailedProperties
+from flood_api.models.shared_types import (
+    ARROW_STREAM_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE,
+    BatchLocationQuery,
+    GeometryMode,
+    ResponseFormat,
+)
+from flood_api.models.summary_types import SummaryProperties
+from flood_api.models.threshold_types import ThresholdProperties
+from flood_api.utils.compression import parse_quality_values
 from flood_api.utils.validation_helpers import (
     validate_bounding_box,
     validate_coordinates,
+    validate_coordinates_batch,
     validate_dates,
 )
 
@@ -48,6 +63,20 @@ def location_query_dependency(
 LocationQueryDep = Annotated[LocationQuery, Depends(location_query_dependency)]
 
 
+def batch_location_query_dependency(
+    locations: BatchLocationQuery,
+) -> tuple[np.ndarray, np.ndarray]:
+    latitudes = np.asarray(locations.lat, dtype=np.float64)
+    longitudes = np.asarray(locations.lon, dtype=np.float64)
+    validate_coordinates_batch(latitudes, longitudes)
+    return latitudes, longitudes
+
+
+BatchLocationQueryDep = Annotated[
+    tuple[np.ndarray, np.ndarray], Depends(batch_location_query_dependency)
+]
+
+
 def include_neighbors(
     include_neighbors: Annotated[
         bool,
@@ -62,6 +91,37 @@ def include_neighbors(
 IncludeNeighborsDep = Annotated[bool, Depends(include_neighbors)]
 
 
+def geometry_mode(
+    geometry: Annotated[
+        GeometryMode,
+        Query(
+            description="The geometry of each cell in the response: `polygon` for the outline of the cell, "
+            "`point` for its center, or `none` to leave it out"
+        ),
+    ] = GeometryMode.POLYGON
+) -> GeometryMode:
+    return geometry
+
+
+GeometryModeDep = Annotated[GeometryMode, Depends(geometry_mode)]
+
+
+def detailed_layout(
+    layout: Annotated[
+        DetailedLayout,
+        Query(
+            description="The layout of the features. `steps` returns one feature per cell and step, while "
+            "`timeseries` returns one feature per cell with an array of values, in step order, for each "
+            "property that varies over the steps"
+        ),
+    ] = DetailedLayout.STEPS
+) -> DetailedLayout:
+    return layout
+
+
+DetailedLayoutDep = Annotated[DetailedLayout, Depends(detailed_layout)]
+
+
 def date_range(
     start_date: Annotated[
         date | None,
@@ -87,3 +147,125 @@ def date_range(
 
 
 DateRangeDep = Annotated[tuple[date, date], Depends(date_range)]
+
+
+# Formats that can be requested with the Accept header instead of `format`
+ACCEPTED_MEDIA_TYPES = {
+    NDJSON_MEDIA_TYPE: ResponseFormat.NDJSON,
+    ARROW_STREAM_MEDIA_TYPE: ResponseFormat.ARROW,
+    PARQUET_MEDIA_TYPE: ResponseFormat.PARQUET,
+}
+
+
+# Formats that lay out the cells of a bounding box and cannot
+# represent a queried cell together with its neighbors
+BBOX_ONLY_FORMATS = {ResponseFormat.NDJSON, ResponseFormat.GRID}
+
+# Media ranges of the Accept header that the default GeoJSON response satisfies
+GEOJSON_MEDIA_RANGES = {
+    "application/geo+json",
+    "application/json",
+    "application/*",
+    "*/*",
+}
+
+
+def negotiate_format(accept: str, bbox_query: bool) -> ResponseFormat:
+    """
+    Select the format of a response from the `Accept` header of the
+    request, by quality value and then by order in the header. Formats that
+    cannot represent the query are skipped, and GeoJSON is returned when no
+    other accepted format is preferred.
+
+    Parameters:
+    - accept (str): The value of the `Accept` header.
+    - bbox_query (bool): Whether the query is a bounding box query.
+
+    Returns:
+    ResponseFormat: The negotiated format.
+    """
+    candidates = []
+    for position, (media_range, quality) in enumerate(parse_quality_values(accept)):
+        if media_range in ACCEPTED_MEDIA_TYPES:
+            format = ACCEPTED_MEDIA_TYPES[media_range]
+        elif media_range in GEOJSON_MEDIA_RANGES:
+            format = ResponseFormat.GEOJSON
+        else:
+            continue
+        if quality > 0 and (bbox_query or format not in BBOX_ONLY_FORMATS):
+            candidates.append((quality, -position, format))
+    if not candidates:
+        return ResponseFormat.GEOJSON
+    _, _, format = max(candidates)
+    return format
+
+
+def response_format(
+    request: Request,
+    location_query: LocationQueryDep,
+    format: Annotated[
+        ResponseFormat | None,
+        Query(
+            description="The format of the response. `ndjson` streams the features of a bounding box query "
+            "as newline-delimited GeoJSON. `grid` returns the cells of a bounding box query as arrays: the "
+            "origin (lower left corner) of the grid of cells intersecting the bounding box, its resolution "
+            "and shape, the `row` and `col` of each cell in that grid, and one array per property. "
+            "`arrow` (Arrow IPC stream) and `parquet` (GeoParquet) return a "
+            "table with one row per feature, the cell center coordinates and the geometry as WKB; for point "
+            "queries with neighbors, the neighboring cells follow the queried cell and are flagged in the "
+            "`neighboring` column. The formats can also be requested with the `Accept` header "
+            f"(`{NDJSON_MEDIA_TYPE}`, `{ARROW_STREAM_MEDIA_TYPE}` or `{PARQUET_MEDIA_TYPE}`), in which "
+            "case the accepted format with the highest quality value that supports the query is used. "
+            "Defaults to `geojson`"
+        ),
+    ] = None,
+) -> ResponseFormat:
+    if format is None:
+        return negotiate_format(
+            request.headers.get("accept", ""), len(location_query) == 4
+        )
+
+    if format in BBOX_ONLY_FORMATS and len(location_query) != 4:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The {format.value} format is only supported for bounding box queries.",
+        )
+    return format
+
+
+ResponseFormatDep = Annotated[ResponseFormat, Depends(response_format)]
+
+
+def fields_dependency(properties: type[BaseModel]):
+    field_names = list(properties.model_fields.keys())
+
+    def fields(
+        fields: Annotated[
+            list[str],
+            Query(
+                description="The properties to include in the response, either as repeated parameters or "
+                "comma-separated. If omitted, all properties are included",
+                json_schema_extra={"items": {"type": "string", "enum": field_names}},
+            ),
+        ] = None
+    ) -> list[str]:
+        if fields is None:
+            return field_names
+        requested = {name.strip() for value in fields for name in value.split(",")}
+        unknown = requested.difference(field_names)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields {sorted(unknown)}, the available fields are {field_names}",
+            )
+        # Keep the order of the model so that the output does not depend on the query
+        return [name for name in field_names if name in requested]
+
+    return fields
+
+
+SummaryFieldsDep = Annotated[list[str], Depends(fields_dependency(SummaryProperties))]
+DetailedFieldsDep = Annotated[list[str], Depends(fields_dependency(DetailedProperties))]
+ThresholdFieldsDep = Annotated[
+    list[str], Depends(fields_dependency(ThresholdProperties))
+]
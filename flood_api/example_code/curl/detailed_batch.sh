@@ -0,0 +1,2 @@
+# Get the detailed flood forecast for several coordinates in one request, between 2023-12-01 and 2023-12-07 (inclusive)
+curl -i -X POST "$endpoint_url?start_date=2023-12-01&end_date=2023-12-07" -H "Content-Type: application/json" -d '{"lat": [4.882569, -1.375532], "lon": [22.260536, 33.575897]}'
@@ -0,0 +1,2 @@
+# Get the summary flood forecast for several coordinates in one request
+curl -i -X POST $endpoint_url -H "Content-Type: application/json" -d '{"lat": [4.882569, -1.375532], "lon": [22.260536, 33.575897]}'
@@ -0,0 +1,13 @@
+// Get the summary flood forecast for several coordinates in one request
+const response = await fetch("$endpoint_url", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+          lat: [-1.375532, 4.882569],
+          lon: [33.575897, 22.260536],
+    }),
+  });
+  const data = await response.json();
+  
+  // prints the peak_day for the second queried location
+  console.log(data.results["1"].queried_location.features[0].properties.peak_day);
@@ -0,0 +1,16 @@
+from httpx import Client
+
+with Client() as client:
+    # Get the detailed flood forecast for several coordinates in one request, between 2024-01-25 and 2024-02-03 (inclusive)
+    response = client.post(
+        url="$endpoint_url",
+        params={"start_date": "2024-01-25", "end_date": "2024-02-03"},
+        json={"lat": [-1.375532, 4.882569], "lon": [33.575897, 22.260536]},
+    )
+
+    data = response.json()
+
+    # prints the minimum discharge for the first day of the forecast at the second queried location
+    print(
+        data["results"]["1"]["queried_location"]["features"][0]["properties"]["min_dis"]
+    )
@@ -0,0 +1,17 @@
+from httpx import Client
+
+with Client() as client:
+    # Get the summary flood forecast for several coordinates in one request
+    response = client.post(
+        url="$endpoint_url",
+        json={"lat": [-1.375532, 4.882569], "lon": [33.575897, 22.260536]},
+    )
+
+    data = response.json()
+
+    # prints the peak day for the second queried location
+    print(
+        data["results"]["1"]["queried_location"]["features"][0]["properties"][
+            "peak_day"
+        ]
+    )
@@ -1,7 +1,9 @@
 from datetime import date
-from typing import List
+from enum import Enum
+from typing import Annotated, Dict, List, get_origin
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
+from pydantic.fields import FieldInfo
 
 from flood_api.models.shared_types import BaseModelWithDates, Feature, FeatureCollection
 
@@ -96,3 +98,86 @@ class DetailedResponseModel(BaseModel):
         default=None,
         description="A feature collection representing the neighboring location's detailed forecast data, potentially empty if there is no neighboring forecast data.",
     )
+
+
+class DetailedBatchResponseModel(BaseModel):
+    results: Dict[int, DetailedResponseModel] = Field(
+        ...,
+        description="The detailed forecast for each queried location, keyed by the position of the location in the request.",
+    )
+
+
+class DetailedLayout(str, Enum):
+    STEPS = "steps"
+    TIMESERIES = "timeseries"
+
+
+class TimeseriesPropertiesBase(BaseModelWithDates):
+    # Method to get the fields that hold one value per cell rather than per step
+    @classmethod
+    def get_cell_fields(cls) -> List[str]:
+        return [
+            field_name
+            for field_name, field in cls.model_fields.items()
+            if get_origin(field.annotation) is not list
+        ]
+
+
+def timeseries_field(field: FieldInfo) -> tuple:
+    # The field of the per-step properties as an array with one element per
+    # step, each element validated as the per-step field is
+    annotation = field.annotation
+    if field.metadata:
+        annotation = Annotated[annotation, *field.metadata]
+    example = (field.json_schema_extra or {}).get("example")
+    return (
+        List[annotation],
+        Field(
+            ...,
+            description=f"{field.description} One element per step, in increasing order of step.",
+            json_schema_extra=None if example is None else {"example": [example]},
+        ),
+    )
+
+
+DetailedTimeseriesProperties = create_model(
+    "DetailedTimeseriesProperties",
+    __base__=TimeseriesPropertiesBase,
+    **{
+        field_name: timeseries_field(field)
+        for field_name, field in DetailedProperties.model_fields.items()
+        if field_name not in BaseModelWithDates.model_fields
+    },
+)
+
+
+class DetailedTimeseriesFeature(Feature):
+    properties: DetailedTimeseriesProperties = Field(
+        ...,
+        description="The detailed forecast of a cell, with one array element per step.",
+    )
+
+
+class DetailedTimeseriesFeatureCollection(FeatureCollection):
+    features: List[DetailedTimeseriesFeature] = Field(
+        ...,
+        description="A collection of detailed forecasts, with one feature per cell.",
+    )
+
+
+class DetailedTimeseriesResponseModel(BaseModel):
+    queried_location: DetailedTimeseriesFeatureCollection = Field(
+        ...,
+        description="A feature collection representing the queried location's detailed forecast data.",
+    )
+    neighboring_location: DetailedTimeseriesFeatureCollection | None = Field(
+        default=None,
+        description="A feature collection representing the neighboring location's detailed forecast data, potentially empty if there is no neighboring forecast data.",
+    )
+
+
+class DetailedTimeseriesBatchResponseModel(BaseModel):
+    results: Dict[int, DetailedTimeseriesResponseModel] = Field(
+        ...,
+        description="The detailed forecast for each queried location, keyed by the position of the location in the request.",
+    )
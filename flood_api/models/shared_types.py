@@ -2,11 +2,31 @@ from datetime import date
 from enum import Enum
 from typing import List, Literal, Type
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 from flood_api.settings import settings
 
 GLOFAS_RESOLUTION = settings.glofas_resolution
+BATCH_MAX_LOCATIONS = settings.batch_max_locations
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+class ResponseFormat(str, Enum):
+    GEOJSON = "geojson"
+    NDJSON = "ndjson"
+    GRID = "grid"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+class GeometryMode(str, Enum):
+    POLYGON = "polygon"
+    POINT = "point"
+    NONE = "none"
 
 
 class GeometryType(str, Enum):
@@ -39,14 +59,27 @@ class Geometry(BaseModel):
     )
 
 
+class PointGeometry(BaseModel):
+    type: Literal["Point"] = Field(
+        ...,
+        description="The nature of the geometry type, which is 'Point' for this model.",
+        json_schema_extra={"example": "Point"},
+    )
+    coordinates: List[float] = Field(
+        ...,
+        description="Longitude and latitude of the center of the grid cell in decimal degrees.",
+        json_schema_extra={"example": [51.975, 16.975]},
+    )
+
+
 class BaseModelWithDates(BaseModel):
-    # Method to get fields of type 'date'
+    # Method to get fields of type 'date', including inherited ones
     @classmethod
     def get_date_fields(cls: Type[BaseModel]) -> List[str]:
         return [
             field_name
-            for field_name, field_type in cls.__annotations__.items()
-            if field_type == date
+            for field_name, field in cls.model_fields.items()
+            if field.annotation == date
         ]
 
     issued_on: date = Field(
@@ -64,9 +97,11 @@ class Feature(BaseModel):
         description="The type of the feature, typically 'Feature' for GeoJSON objects.",
         json_schema_extra={"example": "Feature"},
     )
-    geometry: Geometry = Field(
+    geometry: Geometry | PointGeometry | None = Field(
         ...,
-        description="The geometric details of the feature, including its type and coordinates.",
+        description="The geometric details of the feature, including its type and coordinates. "
+        "Depending on the requested geometry mode, this is the polygon of the grid cell, "
+        "its center, or null.",
     )
 
 
@@ -78,3 +113,26 @@ class FeatureCollection(BaseModel):
         ...,
         description="A list of feature objects, each containing its unique identifier, type, and geometry.",
     )
+
+
+class BatchLocationQuery(BaseModel):
+    lat: List[float] = Field(
+        ...,
+        min_length=1,
+        max_length=BATCH_MAX_LOCATIONS,
+        description=f"Latitudes of the locations to query, at most {BATCH_MAX_LOCATIONS}.",
+        json_schema_extra={"example": [-1.375532, 4.882569]},
+    )
+    lon: List[float] = Field(
+        ...,
+        min_length=1,
+        max_length=BATCH_MAX_LOCATIONS,
+        description="Longitudes of the locations to query, in the same order as the latitudes.",
+        json_schema_extra={"example": [33.575897, 22.260536]},
+    )
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if len(self.lat) != len(self.lon):
+            raise ValueError("lat and lon must have the same number of elements")
+        return self
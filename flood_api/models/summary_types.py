@@ -1,6 +1,6 @@
 from datetime import date
 from enum import Enum
-from typing import List
+from typing import Dict, List
 
 from pydantic import BaseModel, Field, field_validator
 
@@ -165,3 +165,10 @@ class SummaryResponseModel(BaseModel):
         default=None,
         description="A feature collection representing the neighboring location's summary forecast data, potentially empty if there is no neighboring forecast data.",
     )
+
+
+class SummaryBatchResponseModel(BaseModel):
+    results: Dict[int, SummaryResponseModel] = Field(
+        ...,
+        description="The summary forecast for each queried location, keyed by the position of the location in the request.",
+    )
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 
 from pydantic import BaseModel, Field
 
@@ -45,3 +45,10 @@ class ThresholdResponseModel(BaseModel):
         ...,
         description="A feature collection representing the queried location's threshold data for flood risk analysis.",
     )
+
+
+class ThresholdBatchResponseModel(BaseModel):
+    results: Dict[int, ThresholdResponseModel] = Field(
+        ...,
+        description="The threshold data for each queried location, keyed by the position of the location in the request.",
+    )
@@ -51,6 +51,9 @@ def custom_openapi(app: FastAPI, example_code_dir: Path):
                 )
 
         if code_samples:
-            openapi_schema["paths"][route.path]["get"]["x-codeSamples"] = code_samples
+            for method in route.methods:
+                openapi_schema["paths"][route.path][method.lower()][
+                    "x-codeSamples"
+                ] = code_samples
 
     return openapi_schema
@@ -1,4 +1,12 @@
-from fastapi import APIRouter
+from datetime import date
+from typing import Callable, Iterator
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
 from flood_api.dependencies.flooddata import (
     DetailedDataDep,
@@ -6,72 +14,598 @@ from flood_api.dependencies.flooddata import (
     ThresholdDataDep,
 )
 from flood_api.dependencies.queryparams import (
+    BatchLocationQueryDep,
     DateRangeDep,
+    DetailedFieldsDep,
+    DetailedLayoutDep,
+    GeometryModeDep,
     IncludeNeighborsDep,
+    LocationQuery,
     LocationQueryDep,
+    ResponseFormatDep,
+    SummaryFieldsDep,
+    ThresholdFieldsDep,
+)
+from flood_api.models.detailed_types import (
+    DetailedBatchResponseModel,
+    DetailedLayout,
+    DetailedResponseModel,
+    DetailedTimeseriesBatchResponseModel,
+    DetailedTimeseriesProperties,
+    DetailedTimeseriesResponseModel,
+)
+from flood_api.models.shared_types import (
+    ARROW_STREAM_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE,
+    GeometryMode,
+    ResponseFormat,
+)
+from flood_api.models.summary_types import (
+    SummaryBatchResponseModel,
+    SummaryResponseModel,
+)
+from flood_api.models.threshold_types import (
+    ThresholdBatchResponseModel,
+    ThresholdResponseModel,
+)
+from flood_api.settings import settings
+from flood_api.utils.arrow_utilities import (
+    cell_geometries,
+    dataframe_to_arrow,
+    table_to_arrow_stream,
+    table_to_geoparquet,
+)
+from flood_api.utils.compression import EncodedBody, negotiate_encoding, variant_etag
+from flood_api.utils.geospatial_operations import (
+    get_data_for_bbox,
+    get_data_for_point,
+    get_data_for_points,
+    get_grid_cell_bounds,
+    iter_bbox_positions,
 )
-from flood_api.models.detailed_types import DetailedProperties, DetailedResponseModel
-from flood_api.models.summary_types import SummaryProperties, SummaryResponseModel
-from flood_api.models.threshold_types import ThresholdProperties, ThresholdResponseModel
-from flood_api.utils.geospatial_operations import get_data_for_bbox, get_data_for_point
-from flood_api.utils.json_utilities import dataframe_to_geojson
+from flood_api.utils.grid_index import GridIndex
+from flood_api.utils.http_caching import (
+    entity_tag,
+    matching_etag,
+    seconds_until_next_reload,
+)
+from flood_api.utils.json_utilities import (
+    dataframe_to_geojson,
+    dataframe_to_grid,
+    dataframe_to_timeseries_geojson,
+    encode_features,
+    encode_object,
+)
+from flood_api.utils.response_cache import ResponseCache
+from flood_api.utils.single_flight import SingleFlight
+from flood_api.utils.validation_helpers import validate_layout
+
+GLOFAS_PRECISION = settings.glofas_precision
 
 router = APIRouter(tags=["flood"])
 
+# Encoded responses of the GET endpoints, keyed by their canonical query
+response_cache = ResponseCache(settings.response_cache_max_bytes)
+single_flight = SingleFlight()
 
-@router.get(
-    "/summary",
-    summary="Get summary forecast for a location",
-    description=(
-        "Returns a summary forecast of the next 30 days either for the cell "
-        "at the given coordinates or for the cells within the given bounding box"
-    ),
-)
-async def summary(
-    gdf: SummaryDataDep,
-    location_query: LocationQueryDep,
-    include_neighbors: IncludeNeighborsDep,
-) -> SummaryResponseModel:
+# Documents the alternatives to the JSON response of the GET endpoints
+FORMAT_RESPONSES = {
+    200: {
+        "content": {
+            NDJSON_MEDIA_TYPE: {
+                "schema": {
+                    "type": "string",
+                    "description": "One GeoJSON feature per line",
+                }
+            },
+            ARROW_STREAM_MEDIA_TYPE: {
+                "schema": {
+                    "type": "string",
+                    "format": "binary",
+                    "description": "Arrow IPC stream with one row per feature",
+                }
+            },
+            PARQUET_MEDIA_TYPE: {
+                "schema": {
+                    "type": "string",
+                    "format": "binary",
+                    "description": "GeoParquet file with one row per feature",
+                }
+            },
+        }
+    }
+}
+
+TABULAR_MEDIA_TYPES = {
+    ResponseFormat.ARROW: ARROW_STREAM_MEDIA_TYPE,
+    ResponseFormat.PARQUET: PARQUET_MEDIA_TYPE,
+}
+
+
+def has_fragments(index: GridIndex, columns: list[str], geometry: GeometryMode) -> bool:
+    # The pre-rendered features hold all columns and the cell polygons
+    return (
+        index.fragments is not None
+        and index.fragments.columns == columns
+        and geometry is GeometryMode.POLYGON
+    )
+
+
+def feature_collection(
+    index: GridIndex,
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> bytes:
+    # Query results are rows of index.gdf, labelled by their position
+    if has_fragments(index, columns, geometry):
+        return index.fragments.feature_collection(df.index.to_numpy())
+
+    return dataframe_to_geojson(df=df, columns=columns, geometry=geometry)
+
+
+def ndjson_lines(
+    index: GridIndex,
+    chunks: Iterator[np.ndarray],
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> Iterator[bytes]:
+    feature_id = 0
+    for positions in chunks:
+        if has_fragments(index, columns, geometry):
+            features = index.fragments.features(positions, first_id=feature_id)
+            yield b"\n".join(features) + b"\n"
+        else:
+            features = encode_features(
+                index.gdf.iloc[positions], columns, feature_id, geometry
+            )
+            yield ("\n".join(features) + "\n").encode()
+        feature_id += len(features)
+
+
+def ndjson_response(
+    index: GridIndex,
+    location_query: LocationQuery,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+    date_range: tuple[date, date] | None = None,
+) -> StreamingResponse:
+    # Features are encoded chunk by chunk while the response is sent
+    chunks = iter_bbox_positions(
+        bbox=location_query, index=index, date_range=date_range
+    )
+    return StreamingResponse(
+        ndjson_lines(index, chunks, columns, geometry), media_type=NDJSON_MEDIA_TYPE
+    )
+
+
+def grid_response(
+    index: GridIndex,
+    bbox: tuple[float, float, float, float],
+    queried_location: gpd.GeoDataFrame,
+    columns: list[str],
+) -> Response:
+    first_row, last_row, first_col, last_col = index.bbox_cells(*bbox)
+    rows, cols = index.cell_indices_from_centers(
+        queried_location["latitude"].to_numpy(),
+        queried_location["longitude"].to_numpy(),
+    )
+    origin = (
+        round(index.roi["min_lat"] + first_row * index.grid_size, GLOFAS_PRECISION),
+        round(index.roi["min_lon"] + first_col * index.grid_size, GLOFAS_PRECISION),
+    )
+
+    return Response(
+        content=dataframe_to_grid(
+            df=queried_location,
+            columns=columns,
+            rows=rows - first_row,
+            cols=cols - first_col,
+            origin=origin,
+            resolution=index.grid_size,
+            shape=(last_row - first_row + 1, last_col - first_col + 1),
+        ),
+        media_type="application/json",
+    )
+
+
+def tabular_response(
+    response_format: ResponseFormat,
+    queried_location: gpd.GeoDataFrame,
+    neighboring_location: gpd.GeoDataFrame | None,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> Response:
+    df = queried_location
+    extra_columns = None
+    if neighboring_location is not None:
+        df = pd.concat([queried_location, neighboring_location])
+        extra_columns = {
+            "neighboring": np.repeat(
+                [False, True], [len(queried_location), len(neighboring_location)]
+            )
+        }
+
+    geometries = cell_geometries(df, geometry)
+    table = dataframe_to_arrow(df, columns, extra_columns, geometries)
+    if response_format is ResponseFormat.ARROW:
+        content = table_to_arrow_stream(table)
+    else:
+        content = table_to_geoparquet(table, geometries)
+
+    return Response(content=content, media_type=TABULAR_MEDIA_TYPES[response_format])
+
+
+def summary_response(
+    index: GridIndex,
+    queried_location: gpd.GeoDataFrame,
+    neighboring_location: gpd.GeoDataFrame | None,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> bytes:
+    queried_location_geojson = feature_collection(
+        index, queried_location, columns, geometry
+    )
+
+    if neighboring_location is None:
+        neighboring_location_geojson = None
+    else:
+        neighboring_location_geojson = feature_collection(
+            index, neighboring_location, columns, geometry
+        )
+
+    return encode_object(
+        {
+            "queried_location": queried_location_geojson,
+            "neighboring_location": neighboring_location_geojson,
+        }
+    )
+
+
+def detailed_response(
+    index: GridIndex,
+    queried_location: gpd.GeoDataFrame,
+    neighboring_location: gpd.GeoDataFrame | None,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+    layout: DetailedLayout = DetailedLayout.STEPS,
+) -> bytes:
+    if layout is DetailedLayout.TIMESERIES:
+        cell_cols = DetailedTimeseriesProperties.get_cell_fields()
+
+        def encode(df: gpd.GeoDataFrame) -> bytes:
+            return dataframe_to_timeseries_geojson(df, columns, cell_cols, geometry)
+
+    else:
+
+        def encode(df: gpd.GeoDataFrame) -> bytes:
+            return feature_collection(index, df, columns, geometry)
+
+    queried_location_geojson = encode(queried_location)
+
+    if neighboring_location is None:
+        neighboring_location_geojson = None
+    else:
+        neighboring_location_geojson = encode(neighboring_location)
+
+    return encode_object(
+        {
+            "queried_location": queried_location_geojson,
+            "neighboring_location": neighboring_location_geojson,
+        }
+    )
+
+
+def threshold_response(
+    index: GridIndex,
+    queried_location: gpd.GeoDataFrame,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> bytes:
+    queried_location_geojson = feature_collection(
+        index, queried_location, columns, geometry
+    )
+
+    return encode_object({"queried_location": queried_location_geojson})
+
+
+def summary_query_response(
+    index: GridIndex,
+    location_query: LocationQuery,
+    include_neighbors: bool,
+    response_format: ResponseFormat,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> Response:
     match location_query:
         case lat, lon:
             queried_location, neighboring_location = get_data_for_point(
                 latitude=lat,
                 longitude=lon,
                 include_neighbors=include_neighbors,
-                gdf=gdf,
+                index=index,
             )
         case min_lat, max_lat, min_lon, max_lon:
             queried_location = get_data_for_bbox(
                 bbox=location_query,
-                gdf=gdf,
+                index=index,
             )
             neighboring_location = None
 
-    summary_cols = list(SummaryProperties.model_fields.keys())
+    if response_format is ResponseFormat.GRID:
+        return grid_response(index, location_query, queried_location, columns)
+    if response_format in TABULAR_MEDIA_TYPES:
+        return tabular_response(
+            response_format, queried_location, neighboring_location, columns, geometry
+        )
 
-    queried_location_geojson = dataframe_to_geojson(
-        df=queried_location, columns=summary_cols
+    return Response(
+        content=summary_response(
+            index, queried_location, neighboring_location, columns, geometry
+        ),
+        media_type="application/json",
     )
 
-    sort_columns = ["latitude", "longitude"]
 
-    if neighboring_location is None:
-        neighboring_location_geojson = None
-    else:
-        neighboring_location_geojson = dataframe_to_geojson(
-            df=neighboring_location, columns=summary_cols, sort_columns=sort_columns
+def detailed_query_response(
+    index: GridIndex,
+    location_query: LocationQuery,
+    include_neighbors: bool,
+    date_range: tuple[date, date],
+    response_format: ResponseFormat,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+    layout: DetailedLayout = DetailedLayout.STEPS,
+) -> Response:
+    match location_query:
+        case lat, lon:
+            queried_location, neighboring_location = get_data_for_point(
+                latitude=lat,
+                longitude=lon,
+                include_neighbors=include_neighbors,
+                index=index,
+                date_range=date_range,
+            )
+        case min_lat, max_lat, min_lon, max_lon:
+            queried_location = get_data_for_bbox(
+                bbox=location_query,
+                index=index,
+                date_range=date_range,
+            )
+            neighboring_location = None
+
+    if response_format is ResponseFormat.GRID:
+        return grid_response(index, location_query, queried_location, columns)
+    if response_format in TABULAR_MEDIA_TYPES:
+        return tabular_response(
+            response_format, queried_location, neighboring_location, columns, geometry
+        )
+
+    return Response(
+        content=detailed_response(
+            index, queried_location, neighboring_location, columns, geometry, layout
+        ),
+        media_type="application/json",
+    )
+
+
+def threshold_query_response(
+    index: GridIndex,
+    location_query: LocationQuery,
+    response_format: ResponseFormat,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> Response:
+    match location_query:
+        case lat, lon:
+            queried_location, _ = get_data_for_point(
+                longitude=lon, latitude=lat, index=index
+            )
+        case min_lat, max_lat, min_lon, max_lon:
+            queried_location = get_data_for_bbox(bbox=location_query, index=index)
+
+    if response_format is ResponseFormat.GRID:
+        return grid_response(index, location_query, queried_location, columns)
+    if response_format in TABULAR_MEDIA_TYPES:
+        return tabular_response(
+            response_format, queried_location, None, columns, geometry
+        )
+
+    return Response(
+        content=threshold_response(index, queried_location, columns, geometry),
+        media_type="application/json",
+    )
+
+
+def batch_response(
+    cell_of_location: np.ndarray, cell_responses: list[bytes]
+) -> Response:
+    # The results are keyed by the position of each location in the request
+    return Response(
+        content=encode_object(
+            {
+                "results": encode_object(
+                    {
+                        str(position): cell_responses[cell]
+                        for position, cell in enumerate(cell_of_location.tolist())
+                    }
+                )
+            }
+        ),
+        media_type="application/json",
+    )
+
+
+def location_key(index: GridIndex, location_query: LocationQuery) -> tuple:
+    # Responses only depend on the queried cells: the cell holding the
+    # coordinates, or the cells intersecting the bounding box
+    match location_query:
+        case lat, lon:
+            return ("cell", *get_grid_cell_bounds(lat, lon))
+        case min_lat, max_lat, min_lon, max_lon:
+            return ("bbox", *index.bbox_cells(*location_query))
+
+
+async def encode_response(
+    cache_key: tuple, compute: Callable[[], Response]
+) -> EncodedBody:
+    # Computed off the event loop, so that other requests are served meanwhile
+    response = await run_in_threadpool(compute)
+    body = EncodedBody(response.body, response.media_type)
+    # Cached once computed, so that later requests find the body in the
+    # cache. Requests arriving while it is computed are coalesced by the
+    # single-flight wrapper of the caller instead.
+    response_cache.put(cache_key, body)
+    return body
+
+
+async def conditional_response(
+    request: Request,
+    index: GridIndex,
+    key: tuple,
+    compute: Callable[[], Response],
+    cacheable: bool = True,
+) -> Response:
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    # The same data and canonical query always give the same tag, across
+    # reloads and replicas
+    etag = entity_tag(index.issued_on, index.content_hash, key)
+    headers = {
+        "Cache-Control": f"public, max-age={seconds_until_next_reload()}",
+        # The format can be negotiated with the Accept header
+        "Vary": "Accept",
+    }
+
+    # Revalidated without touching the data
+    matched_etag = matching_etag(
+        request.headers.get("If-None-Match", ""), etag, accept_encoding
+    )
+    if matched_etag is not None:
+        return Response(
+            status_code=304,
+            headers={
+                **headers,
+                "Vary": "Accept, Accept-Encoding",
+                "ETag": matched_etag,
+            },
         )
 
-    response = SummaryResponseModel(
-        queried_location=queried_location_geojson,
-        neighboring_location=neighboring_location_geojson,
+    if not cacheable:
+        # Streams are compressed by the middleware whenever the client accepts it
+        response = compute()
+        response.headers.update(
+            {**headers, "ETag": variant_etag(etag, negotiate_encoding(accept_encoding))}
+        )
+        return response
+
+    # Responses cached for replaced data are never served
+    cache_key = (index.generation, *key)
+    body = response_cache.get(cache_key)
+    if body is None:
+        # Identical concurrent requests share a single computation
+        body = await single_flight.run(
+            cache_key, lambda: encode_response(cache_key, compute)
+        )
+
+    encoding = body.negotiate(accept_encoding)
+    if encoding is not None and encoding not in body.variants:
+        # Compressed off the event loop, once for identical concurrent requests
+        body.variants[encoding] = await single_flight.run(
+            (cache_key, encoding), lambda: run_in_threadpool(body.variant, encoding)
+        )
+        # Stored again, as the compressed variant adds to the size of the body
+        response_cache.put(cache_key, body)
+
+    return body.response(accept_encoding, headers, etag)
+
+
+@router.get(
+    "/summary",
+    response_model=SummaryResponseModel,
+    responses=FORMAT_RESPONSES,
+    summary="Get summary forecast for a location",
+    description=(
+        "Returns a summary forecast of the next 30 days either for the cell "
+        "at the given coordinates or for the cells within the given bounding box"
+    ),
+)
+async def summary(
+    request: Request,
+    index: SummaryDataDep,
+    location_query: LocationQueryDep,
+    include_neighbors: IncludeNeighborsDep,
+    response_format: ResponseFormatDep,
+    fields: SummaryFieldsDep,
+    geometry: GeometryModeDep,
+) -> Response:
+    key = (
+        "summary",
+        location_key(index, location_query),
+        include_neighbors,
+        response_format,
+        tuple(fields),
+        geometry,
+    )
+    if response_format is ResponseFormat.NDJSON:
+        return await conditional_response(
+            request,
+            index,
+            key,
+            lambda: ndjson_response(index, location_query, fields, geometry),
+            cacheable=False,
+        )
+
+    return await conditional_response(
+        request,
+        index,
+        key,
+        lambda: summary_query_response(
+            index, location_query, include_neighbors, response_format, fields, geometry
+        ),
+    )
+
+
+# The batch endpoints are plain functions, so that FastAPI runs them in the
+# threadpool instead of blocking the event loop while the locations are
+# looked up and encoded
+@router.post(
+    "/summary/batch",
+    response_model=SummaryBatchResponseModel,
+    summary="Get summary forecasts for many locations",
+    description=(
+        "Returns a summary forecast of the next 30 days for the cell at each of "
+        "the given coordinates, keyed by the position of the coordinates in the request"
+    ),
+)
+def summary_batch(
+    index: SummaryDataDep,
+    locations: BatchLocationQueryDep,
+    include_neighbors: IncludeNeighborsDep,
+    fields: SummaryFieldsDep,
+    geometry: GeometryModeDep,
+) -> Response:
+    latitudes, longitudes = locations
+    cell_of_location, cells_data = get_data_for_points(
+        latitudes=latitudes,
+        longitudes=longitudes,
+        include_neighbors=include_neighbors,
+        index=index,
     )
 
-    return response
+    # Locations within the same cell share the same response
+    cell_responses = [
+        summary_response(index, *cell_data, fields, geometry)
+        for cell_data in cells_data
+    ]
+
+    return batch_response(cell_of_location, cell_responses)
 
 
 @router.get(
     "/detailed",
+    response_model=DetailedResponseModel | DetailedTimeseriesResponseModel,
+    responses=FORMAT_RESPONSES,
     summary="Get detailed forecast for a location",
     description=(
         "Returns a detailed forecast of the next 30 days either for the cell "
@@ -79,53 +613,97 @@ async def summary(
     ),
 )
 async def detailed(
-    gdf: DetailedDataDep,
+    request: Request,
+    index: DetailedDataDep,
     location_query: LocationQueryDep,
     include_neighbors: IncludeNeighborsDep,
     date_range: DateRangeDep,
-) -> DetailedResponseModel:
-    match location_query:
-        case lat, lon:
-            queried_location, neighboring_location = get_data_for_point(
-                latitude=lat,
-                longitude=lon,
-                include_neighbors=include_neighbors,
-                gdf=gdf,
-                date_range=date_range,
-            )
-        case min_lat, max_lat, min_lon, max_lon:
-            queried_location = get_data_for_bbox(
-                bbox=location_query,
-                gdf=gdf,
-                date_range=date_range,
-            )
-            neighboring_location = None
-
-    detailed_cols = list(DetailedProperties.model_fields.keys())
+    response_format: ResponseFormatDep,
+    layout: DetailedLayoutDep,
+    fields: DetailedFieldsDep,
+    geometry: GeometryModeDep,
+) -> Response:
+    validate_layout(layout, response_format)
 
-    sort_columns = ["latitude", "longitude", "step"]
+    key = (
+        "detailed",
+        location_key(index, location_query),
+        include_neighbors,
+        # Date ranges selecting the same steps share their responses
+        index.step_window(date_range) or date_range,
+        response_format,
+        tuple(fields),
+        geometry,
+        layout,
+    )
+    if response_format is ResponseFormat.NDJSON:
+        return await conditional_response(
+            request,
+            index,
+            key,
+            lambda: ndjson_response(
+                index, location_query, fields, geometry, date_range=date_range
+            ),
+            cacheable=False,
+        )
 
-    queried_location_geojson = dataframe_to_geojson(
-        df=queried_location, columns=detailed_cols, sort_columns=sort_columns
+    return await conditional_response(
+        request,
+        index,
+        key,
+        lambda: detailed_query_response(
+            index,
+            location_query,
+            include_neighbors,
+            date_range,
+            response_format,
+            fields,
+            geometry,
+            layout,
+        ),
     )
 
-    if neighboring_location is None:
-        neighboring_location_geojson = None
-    else:
-        neighboring_location_geojson = dataframe_to_geojson(
-            df=neighboring_location, columns=detailed_cols, sort_columns=sort_columns
-        )
 
-    response = DetailedResponseModel(
-        queried_location=queried_location_geojson,
-        neighboring_location=neighboring_location_geojson,
+@router.post(
+    "/detailed/batch",
+    response_model=DetailedBatchResponseModel | DetailedTimeseriesBatchResponseModel,
+    summary="Get detailed forecasts for many locations",
+    description=(
+        "Returns a detailed forecast of the next 30 days for the cell at each of "
+        "the given coordinates, keyed by the position of the coordinates in the request"
+    ),
+)
+def detailed_batch(
+    index: DetailedDataDep,
+    locations: BatchLocationQueryDep,
+    include_neighbors: IncludeNeighborsDep,
+    date_range: DateRangeDep,
+    layout: DetailedLayoutDep,
+    fields: DetailedFieldsDep,
+    geometry: GeometryModeDep,
+) -> Response:
+    latitudes, longitudes = locations
+    cell_of_location, cells_data = get_data_for_points(
+        latitudes=latitudes,
+        longitudes=longitudes,
+        include_neighbors=include_neighbors,
+        index=index,
+        date_range=date_range,
     )
 
-    return response
+    # Locations within the same cell share the same response
+    cell_responses = [
+        detailed_response(index, *cell_data, fields, geometry, layout)
+        for cell_data in cells_data
+    ]
+
+    return batch_response(cell_of_location, cell_responses)
 
 
 @router.get(
     "/threshold",
+    response_model=ThresholdResponseModel,
+    responses=FORMAT_RESPONSES,
     summary="Get return period thresholds for a location",
     description=(
         "Returns the 2-, 5-, and 20-year return period thresholds either for the cell "
@@ -133,19 +711,63 @@ async def detailed(
     ),
 )
 async def threshold(
-    gdf: ThresholdDataDep, location_query: LocationQueryDep
-) -> ThresholdResponseModel:
-    match location_query:
-        case lat, lon:
-            queried_location, _ = get_data_for_point(
-                longitude=lon, latitude=lat, gdf=gdf
-            )
-        case min_lat, max_lat, min_lon, max_lon:
-            queried_location = get_data_for_bbox(bbox=location_query, gdf=gdf)
+    request: Request,
+    index: ThresholdDataDep,
+    location_query: LocationQueryDep,
+    response_format: ResponseFormatDep,
+    fields: ThresholdFieldsDep,
+    geometry: GeometryModeDep,
+) -> Response:
+    key = (
+        "threshold",
+        location_key(index, location_query),
+        response_format,
+        tuple(fields),
+        geometry,
+    )
+    if response_format is ResponseFormat.NDJSON:
+        return await conditional_response(
+            request,
+            index,
+            key,
+            lambda: ndjson_response(index, location_query, fields, geometry),
+            cacheable=False,
+        )
+
+    return await conditional_response(
+        request,
+        index,
+        key,
+        lambda: threshold_query_response(
+            index, location_query, response_format, fields, geometry
+        ),
+    )
 
-    threshold_cols = list(ThresholdProperties.model_fields.keys())
-    queried_location_geojson = dataframe_to_geojson(
-        df=queried_location, columns=threshold_cols
+
+@router.post(
+    "/threshold/batch",
+    response_model=ThresholdBatchResponseModel,
+    summary="Get return period thresholds for many locations",
+    description=(
+        "Returns the 2-, 5-, and 20-year return period thresholds for the cell at each "
+        "of the given coordinates, keyed by the position of the coordinates in the request"
+    ),
+)
+def threshold_batch(
+    index: ThresholdDataDep,
+    locations: BatchLocationQueryDep,
+    fields: ThresholdFieldsDep,
+    geometry: GeometryModeDep,
+) -> Response:
+    latitudes, longitudes = locations
+    cell_of_location, cells_data = get_data_for_points(
+        latitudes=latitudes, longitudes=longitudes, index=index
     )
-    response = ThresholdResponseModel(queried_location=queried_location_geojson)
-    return response
+
+    # Locations within the same cell share the same response
+    cell_responses = [
+        threshold_response(index, queried_location, fields, geometry)
+        for queried_location, _ in cells_data
+    ]
+
+    return batch_response(cell_of_location, cell_responses)
@@ -7,6 +7,7 @@ class Settings(BaseSettings):
     uvicorn_port: int = 8080
     uvicorn_host: str = "0.0.0.0"
     uvicorn_reload: bool = True
+    uvicorn_workers: int = 1
     uvicorn_proxy_headers: bool = False
     dagster_data_bucket: str = environ.get("dagster_data_bucket", "placeholder-bucket")
     detailed_data_path: str = (
@@ -38,6 +39,17 @@ class Settings(BaseSettings):
     }
     glofas_resolution: float = 0.05
     glofas_precision: int = 3
+    batch_max_locations: int = 50000
+    prerender_features: bool = True
+    compression_minimum_size: int = 1024
+    gzip_level: int = 6
+    brotli_level: int = 5
+    zstd_level: int = 3
+    response_cache_max_bytes: int = 256 * 2**20
+    data_reload_cron: str = "0 12 * * *"
+    data_load_concurrency: int = 1
+    data_fetch_concurrency: int = 8
+    snapshot_dir: str | None = None
     api_domain: str = "localhost"
 
     @property
@@ -0,0 +1,68 @@
+"""
+The spatial query that served requests before the grid index: an STRtree
+query on the cell geometries. It is kept only as the reference that the
+benchmarks and the grid index tests compare the grid index against, and is
+not used by the API.
+"""
+
+from datetime import date
+
+import geopandas as gpd
+from shapely.geometry import Polygon
+
+from flood_api.utils.geospatial_operations import filter_positions_by_date
+
+
+def get_data_for_roi(
+    roi: Polygon,
+    gdf: gpd.GeoDataFrame,
+    date_range: tuple[date, date] | None = None,
+    expanded_roi: Polygon | None = None,
+) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    """
+    Given a region of interest, return the data for the grid cells
+    that it overlaps with. Optionally, include the data for neighboring cells
+    by providing an expanded region of interest. A date range can also be provided
+    to filter the data, yielding only the data within the date range (inclusive).
+    If no date range is provided, data for all dates will be returned.
+
+    Parameters:
+    - roi (Polygon): The region of interest.
+    - gdf (GeoDataFrame): The GeoDataFrame to query.
+    - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
+    - expanded_roi (Polygon, optional): The expanded region of interest. Used to get neighboring cells. Defaults to None.
+
+    Returns:
+    tuple: The primary cells and neighbors as GeoDataFrames.
+    """
+
+    neighbors_only_df = None
+
+    if expanded_roi is not None:
+        # Query the dataframe for possible matches
+        # using the expanded roi to get the primary
+        # cells and neighbors. The date range is applied
+        # to the matches only, so that the spatial index
+        # of the full dataframe is reused.
+        possible_matches_index = gdf.sindex.query(expanded_roi, predicate="intersects")
+        possible_matches_index = filter_positions_by_date(
+            possible_matches_index, gdf, date_range
+        )
+        all_cells_df = gdf.iloc[possible_matches_index]
+
+        # Define mask for distinguishing between primary cells and neighbors
+        primary_cells_mask = all_cells_df["geometry"].intersects(roi)
+
+        # Define primary cells and neighbors dataframes
+        primary_cells_df = all_cells_df[primary_cells_mask]
+        neighbors_only_df = all_cells_df[~primary_cells_mask]
+    else:
+        # Query the main dataframe for possible matches
+        # using the roi to get only the primary cells
+        possible_matches_index = gdf.sindex.query(roi, predicate="intersects")
+        possible_matches_index = filter_positions_by_date(
+            possible_matches_index, gdf, date_range
+        )
+        primary_cells_df = gdf.iloc[possible_matches_index]
+
+    return primary_cells_df, neighbors_only_df
@@ -2,6 +2,12 @@ import geopandas as gpd
 import pandas as pd
 from shapely import wkt
 
+from flood_api.models.detailed_types import DetailedProperties
+from flood_api.models.summary_types import SummaryProperties
+from flood_api.models.threshold_types import ThresholdProperties
+from flood_api.utils.grid_index import GridIndex
+from flood_api.utils.json_utilities import FeatureFragments
+
 summary_data = [
     {
         "latitude": 6.225,
@@ -1034,13 +1040,29 @@ for record in summary_data + detailed_data + threshold_data:
 
 # Summary data
 gdf_test_summary = gpd.GeoDataFrame(summary_data, geometry="geometry")
-gdf_test_summary["issued_on"] = pd.to_datetime(gdf_test_summary["issued_on"]).dt.date
-gdf_test_summary["peak_day"] = pd.to_datetime(gdf_test_summary["peak_day"]).dt.date
+gdf_test_summary["issued_on"] = pd.to_datetime(gdf_test_summary["issued_on"])
+gdf_test_summary["peak_day"] = pd.to_datetime(gdf_test_summary["peak_day"])
 
 # Detailed data
 gdf_test_detailed = gpd.GeoDataFrame(detailed_data, geometry="geometry")
-gdf_test_detailed["issued_on"] = pd.to_datetime(gdf_test_detailed["issued_on"]).dt.date
-gdf_test_detailed["valid_for"] = pd.to_datetime(gdf_test_detailed["valid_for"]).dt.date
+gdf_test_detailed["issued_on"] = pd.to_datetime(gdf_test_detailed["issued_on"])
+gdf_test_detailed["valid_for"] = pd.to_datetime(gdf_test_detailed["valid_for"])
 
 # Threshold data
 gdf_test_threshold = gpd.GeoDataFrame(threshold_data, geometry="geometry")
+
+# Grid indexed data as served by the API
+index_test_summary = GridIndex(gdf_test_summary)
+index_test_detailed = GridIndex(gdf_test_detailed)
+index_test_threshold = GridIndex(gdf_test_threshold)
+
+# Pre-rendered features, as built by the loader
+index_test_summary.fragments = FeatureFragments(
+    index_test_summary.gdf, list(SummaryProperties.model_fields.keys())
+)
+index_test_detailed.fragments = FeatureFragments(
+    index_test_detailed.gdf, list(DetailedProperties.model_fields.keys())
+)
+index_test_threshold.fragments = FeatureFragments(
+    index_test_threshold.gdf, list(ThresholdProperties.model_fields.keys())
+)
@@ -1,13 +1,23 @@
+import asyncio
+import gzip
+import json
 from datetime import date
 
+import brotli
 import geopandas as gpd
 import pandas as pd
+import pytest
+import zstandard
 from fastapi.testclient import TestClient
 
 from flood_api.__main__ import app
+from flood_api.routers import flood
 from flood_api.dependencies.flooddata import get_detailed_data
+from flood_api.models.detailed_types import DetailedTimeseriesResponseModel
 from flood_api.settings import settings
-from flood_api.tests.synthetic_data import gdf_test_detailed
+from flood_api.utils import compression
+from flood_api.tests.synthetic_data import index_test_detailed
+from flood_api.utils.response_cache import ResponseCache
 
 GLOFAS_ROI = settings.glofas_roi
 OUT_OF_BOUNDS_STATUS_CODE = 404
@@ -15,7 +25,7 @@ INVALID_STATUS_CODE = 400
 
 TOTAL_STEPS = 30
 
-app.dependency_overrides[get_detailed_data] = lambda: gdf_test_detailed
+app.dependency_overrides[get_detailed_data] = lambda: index_test_detailed
 
 client = TestClient(app)
 
@@ -28,6 +38,10 @@ def get_detailed_response_code(params):
     return get_detailed_response(params).status_code
 
 
+def get_detailed_batch_response(locations, params=None):
+    return client.post("/detailed/batch", json=locations, params=params)
+
+
 def test_detailed_arg_validity():
     # Neither lat/lon nor bbox are provided
     params = {"include_neighbors": "true"}
@@ -525,3 +539,296 @@ def test_detailed_bbox_general():
 
     # Assert that the 'geometry' column has one unique value
     assert gdf["geometry"].nunique() == 1
+
+
+@pytest.fixture
+def no_new_spatial_index(monkeypatch):
+    # Build the spatial index of the test data up front, then fail
+    # if any other spatial index is built during the test
+    index_test_detailed.gdf.sindex
+
+    def fail():
+        raise AssertionError("A spatial index was built while serving a request")
+
+    monkeypatch.setattr(gpd.array, "_get_sindex_class", fail)
+
+
+def test_detailed_date_range_reuses_index(no_new_spatial_index):
+    # Filtering by date must not force a new spatial index
+    # to be built over the filtered data
+    params = {
+        "lat": 6.2,
+        "lon": 39.05,
+        "start_date": "2023-11-29",
+        "end_date": "2023-12-01",
+        "include_neighbors": "true",
+    }
+    assert get_detailed_response_code(params) == 200
+
+    params = {
+        "min_lat": 6.225,
+        "max_lat": 6.25,
+        "min_lon": 39.0,
+        "max_lon": 40.0,
+        "start_date": "2023-11-29",
+    }
+    assert get_detailed_response_code(params) == 200
+
+
+def test_detailed_batch_general():
+    # The first two locations are in the same cell, the
+    # third is in the neighboring cell and the last has no data
+    locations = {
+        "lat": [6.2, 6.24, 6.25, 0.0],
+        "lon": [39.05, 39.09, 39.05, 0.0],
+    }
+
+    response = get_detailed_batch_response(
+        locations, params={"include_neighbors": "true"}
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+
+    # Results are keyed by the position of each location
+    assert list(data["results"]) == ["0", "1", "2", "3"]
+
+    gdfs = [
+        gpd.GeoDataFrame.from_features(result["queried_location"]["features"])
+        for result in data["results"].values()
+    ]
+
+    # Assert that row counts are correct
+    assert [len(gdf) for gdf in gdfs] == [TOTAL_STEPS, TOTAL_STEPS, TOTAL_STEPS, 0]
+
+    # Locations in the same cell get the same data
+    assert data["results"]["0"] == data["results"]["1"]
+    assert gdfs[0]["geometry"].iloc[0] != gdfs[2]["geometry"].iloc[0]
+
+    # Neighbors are included for every location with data
+    for position in ["0", "1", "2"]:
+        assert data["results"][position]["neighboring_location"]["features"]
+
+
+def test_detailed_batch_validity():
+    # One of the locations is outside the ROI
+    locations = {
+        "lat": [6.2, GLOFAS_ROI["max_lat"]],
+        "lon": [39.05, 39.05],
+    }
+    response = get_detailed_batch_response(locations)
+    assert response.status_code == OUT_OF_BOUNDS_STATUS_CODE
+    assert "[1]" in response.json()["detail"]
+
+    # Latitudes and longitudes do not match up
+    locations = {"lat": [6.2, 6.25], "lon": [39.05]}
+    assert get_detailed_batch_response(locations).status_code == 422
+
+    # No locations are provided
+    locations = {"lat": [], "lon": []}
+    assert get_detailed_batch_response(locations).status_code == 422
+
+
+def test_detailed_bbox_ndjson():
+    params = {
+        "min_lat": 6.225,
+        "max_lat": 6.25,
+        "min_lon": 39.0,
+        "max_lon": 40.0,
+        "start_date": "2023-11-29",
+        "end_date": "2023-12-01",
+    }
+    geojson_features = get_detailed_response(params).json()["queried_location"][
+        "features"
+    ]
+
+    # Requested with the query parameter or the Accept header
+    for response in [
+        get_detailed_response({**params, "format": "ndjson"}),
+        client.get(
+            "/detailed",
+            params=params,
+            headers={"Accept": "application/x-ndjson, application/json;q=0.9"},
+        ),
+    ]:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+
+        # One feature per line, the same as in the GeoJSON response
+        features = [json.loads(line) for line in response.text.splitlines()]
+        assert features == geojson_features
+        assert len(features) == 3 * 2
+
+    # Streaming is only available for bounding boxes
+    params = {"lat": 6.2, "lon": 39.05, "format": "ndjson"}
+    assert get_detailed_response_code(params) == INVALID_STATUS_CODE
+
+    # Unknown formats are rejected
+    params = {"lat": 6.2, "lon": 39.05, "format": "csv"}
+    assert get_detailed_response_code(params) == 422
+
+
+@pytest.mark.parametrize(
+    "params, accept, content_type",
+    [
+        # Streaming is skipped for point queries rather than rejected
+        (
+            {"lat": 6.2, "lon": 39.05},
+            "application/x-ndjson, application/json",
+            "application/json",
+        ),
+        (
+            {"lat": 6.2, "lon": 39.05},
+            "application/x-ndjson, application/vnd.apache.arrow.stream;q=0.5",
+            "application/vnd.apache.arrow.stream",
+        ),
+        # The highest quality value wins, whatever the order
+        (
+            {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0},
+            "application/x-ndjson;q=0.5, application/json",
+            "application/json",
+        ),
+        (
+            {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0},
+            "application/json;q=0.9, application/x-ndjson",
+            "application/x-ndjson",
+        ),
+        # Wildcards are served as GeoJSON
+        (
+            {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0},
+            "*/*",
+            "application/json",
+        ),
+    ],
+)
+def test_detailed_accept_negotiation(params, accept, content_type):
+    response = client.get("/detailed", params=params, headers={"Accept": accept})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == content_type
+
+
+def test_detailed_timeseries_layout():
+    params = {
+        "lat": 6.2,
+        "lon": 39.05,
+        "include_neighbors": "true",
+        "start_date": "2023-11-29",
+    }
+    steps_data = get_detailed_response(params).json()
+    response = get_detailed_response({**params, "layout": "timeseries"})
+    assert response.status_code == 200
+    data = DetailedTimeseriesResponseModel.model_validate_json(response.content)
+
+    # One feature per cell holding the same values as the features per step
+    for location in ["queried_location", "neighboring_location"]:
+        step_features = steps_data[location]["features"]
+        cell_features = getattr(data, location).features
+        assert len(cell_features) == 1
+        properties = cell_features[0].properties
+        assert properties.issued_on == date(2023, 11, 10)
+        assert properties.step == [f["properties"]["step"] for f in step_features]
+        assert properties.median_dis == [
+            f["properties"]["median_dis"] for f in step_features
+        ]
+        assert cell_features[0].geometry.model_dump() == step_features[0]["geometry"]
+
+    # Bounding boxes yield one feature per cell, in cell order
+    params = {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+    data = get_detailed_response({**params, "layout": "timeseries"}).json()
+    features = data["queried_location"]["features"]
+    assert [feature["id"] for feature in features] == ["0", "1"]
+    assert [len(feature["properties"]["step"]) for feature in features] == [
+        TOTAL_STEPS,
+        TOTAL_STEPS,
+    ]
+
+    # Batch queries support the layout as well
+    response = get_detailed_batch_response(
+        {"lat": [6.2], "lon": [39.05]}, params={"layout": "timeseries"}
+    )
+    features = response.json()["results"]["0"]["queried_location"]["features"]
+    assert len(features) == 1
+    assert len(features[0]["properties"]["valid_for"]) == TOTAL_STEPS
+
+    # The layout is only available as GeoJSON
+    params = {**params, "layout": "timeseries", "format": "arrow"}
+    assert get_detailed_response_code(params) == INVALID_STATUS_CODE
+
+
+def test_detailed_compression():
+    params = {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+    decompress = {
+        "gzip": gzip.decompress,
+        "br": brotli.decompress,
+        # Streamed frames do not record their size, which the one-shot API needs
+        "zstd": lambda data: zstandard.ZstdDecompressor()
+        .decompressobj()
+        .decompress(data),
+    }
+    expected = get_detailed_response({**params, "format": "ndjson"}).content
+
+    # The streamed and complete bodies are compressed as negotiated
+    for encoding in decompress:
+        for format in ["ndjson", "geojson"]:
+            with client.stream(
+                "GET",
+                "/detailed",
+                params={**params, "format": format},
+                headers={"Accept-Encoding": f"{encoding}, identity;q=0.5"},
+            ) as response:
+                assert response.status_code == 200
+                assert response.headers["content-encoding"] == encoding
+                assert "Accept-Encoding" in response.headers["vary"]
+                content = decompress[encoding](b"".join(response.iter_raw()))
+
+            if format == "ndjson":
+                assert content == expected
+            else:
+                assert json.loads(content) == get_detailed_response(params).json()
+
+    # Responses are left uncompressed when the client does not accept it
+    response = client.get(
+        "/detailed", params=params, headers={"Accept-Encoding": "identity"}
+    )
+    assert "content-encoding" not in response.headers
+
+
+def test_detailed_compression_off_event_loop(monkeypatch):
+    compressed_on_event_loop = []
+
+    def check_thread(compress):
+        def compress_in_thread(*args):
+            try:
+                asyncio.get_running_loop()
+                compressed_on_event_loop.append(compress)
+            except RuntimeError:
+                pass
+            return compress(*args)
+
+        return compress_in_thread
+
+    monkeypatch.setattr(compression, "compress", check_thread(compression.compress))
+    monkeypatch.setattr(
+        compression.StreamCompressor,
+        "compress",
+        check_thread(compression.StreamCompressor.compress),
+    )
+    monkeypatch.setattr(flood, "response_cache", ResponseCache(2**20))
+
+    params = {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+    for format in ["ndjson", "geojson"]:
+        response = client.get(
+            "/detailed",
+            params={**params, "format": format},
+            headers={"Accept-Encoding": "br"},
+        )
+        assert response.headers["content-encoding"] == "br"
+    # A body compressed by the middleware
+    response = client.post(
+        "/detailed/batch",
+        json={"lat": [6.2], "lon": [39.05]},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert response.headers["content-encoding"] == "gzip"
+
+    assert compressed_on_event_loop == []
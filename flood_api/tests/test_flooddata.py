@@ -0,0 +1,449 @@
+import asyncio
+import io
+import json
+import os
+import resource
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from flood_api.__main__ import app as flood_app
+from flood_api.dependencies import flooddata
+from flood_api.models.detailed_types import DetailedProperties
+from flood_api.models.summary_types import SummaryProperties
+from flood_api.models.threshold_types import ThresholdProperties
+from flood_api.tests.synthetic_data import (
+    detailed_data,
+    index_test_detailed,
+    index_test_summary,
+    index_test_threshold,
+    summary_data,
+    threshold_data,
+)
+from flood_api.utils.grid_index import GridIndex
+
+PARTS = ["s3://bucket/detailed/part.0.parquet", "s3://bucket/detailed/part.1.parquet"]
+
+
+def test_fetch_flood_data_swaps_changed_data(monkeypatch):
+    app = FastAPI()
+
+    def fetch(loaded_data):
+        monkeypatch.setattr(
+            flooddata,
+            "load_grid_index",
+            lambda path, properties, current_index: loaded_data[properties],
+        )
+        asyncio.run(flooddata.fetch_flood_data(app))
+
+    fetch(
+        {
+            SummaryProperties: GridIndex(index_test_summary.gdf),
+            DetailedProperties: GridIndex(index_test_detailed.gdf),
+            ThresholdProperties: GridIndex(index_test_threshold.gdf),
+        }
+    )
+    first_data = (app.summary_data, app.detailed_data, app.threshold_data)
+    generation = app.summary_data.generation
+    assert all(index.generation == generation for index in first_data)
+
+    # Reloading the same data keeps the current indices and their generation
+    fetch(
+        {
+            SummaryProperties: GridIndex(index_test_summary.gdf),
+            DetailedProperties: GridIndex(index_test_detailed.gdf),
+            ThresholdProperties: GridIndex(index_test_threshold.gdf),
+        }
+    )
+    assert (app.summary_data, app.detailed_data, app.threshold_data) == first_data
+
+    # Changed data is swapped in with a new generation, and data that
+    # failed to load is kept
+    changed_gdf = index_test_detailed.gdf.assign(
+        max_dis=index_test_detailed.gdf["max_dis"] + 1
+    )
+    fetch(
+        {
+            SummaryProperties: GridIndex(index_test_summary.gdf),
+            DetailedProperties: GridIndex(changed_gdf),
+            ThresholdProperties: None,
+        }
+    )
+    assert app.summary_data is first_data[0]
+    assert app.detailed_data is not first_data[1]
+    assert app.detailed_data.generation > generation
+    assert app.threshold_data is first_data[2]
+
+
+def test_fetch_flood_data_keeps_metadata_of_rewritten_files(tmp_path, monkeypatch):
+    app = FastAPI()
+    data_path = tmp_path / "threshold"
+    data_path.mkdir()
+    part = data_path / "part.0.parquet"
+    pd.DataFrame(threshold_data).drop(columns="geometry").to_parquet(part)
+    monkeypatch.setattr(flooddata.settings, "threshold_data_path", str(data_path))
+    monkeypatch.setattr(flooddata.settings, "summary_data_path", str(tmp_path / "x"))
+    monkeypatch.setattr(flooddata.settings, "detailed_data_path", str(tmp_path / "x"))
+
+    fetched = []
+    fetch_parquet = flooddata.fetch_parquet
+
+    def fetch_and_record(path, paths, columns):
+        fetched.append(paths)
+        return fetch_parquet(path, paths, columns)
+
+    monkeypatch.setattr(flooddata, "fetch_parquet", fetch_and_record)
+
+    asyncio.run(flooddata.fetch_flood_data(app))
+    index = app.threshold_data
+    assert len(fetched) == 1
+
+    # The file is uploaded again with the same content, so it is fetched,
+    # but the current index is kept
+    part.write_bytes(part.read_bytes())
+    os.utime(part, (part.stat().st_atime, part.stat().st_mtime + 10))
+    asyncio.run(flooddata.fetch_flood_data(app))
+    assert len(fetched) == 2
+    assert app.threshold_data is index
+
+    # The next reload fetches nothing
+    asyncio.run(flooddata.fetch_flood_data(app))
+    assert len(fetched) == 2
+    assert app.threshold_data is index
+
+
+def test_load_grid_index_fetches_changed_parts(monkeypatch):
+    # Split the test data into two files by cell
+    gdf = index_test_detailed.gdf.drop(columns="part", errors="ignore")
+    in_first_part = gdf["latitude"] < 6.25
+    part_gdfs = {
+        PARTS[0]: gdf[in_first_part].reset_index(drop=True),
+        PARTS[1]: gdf[~in_first_part].reset_index(drop=True),
+    }
+    parts = {PARTS[0]: ("etag-0", None, 100), PARTS[1]: ("etag-1", None, 200)}
+    fetched = []
+
+    def fetch_parquet(path, paths, columns):
+        fetched.append(paths)
+        return pd.concat(
+            [part_gdfs[path].assign(part=path) for path in paths], ignore_index=True
+        ).astype({"part": pd.CategoricalDtype(paths)})
+
+    monkeypatch.setattr(flooddata, "list_parquet_parts", lambda path: dict(parts))
+    monkeypatch.setattr(flooddata, "fetch_parquet", fetch_parquet)
+
+    def load(current_index=None):
+        return flooddata.load_grid_index("path", DetailedProperties, current_index)
+
+    index = load()
+    assert fetched == [PARTS]
+    assert index.parts == parts
+    assert index.content_hash == GridIndex(gdf).content_hash
+
+    # Unchanged files are not fetched again
+    assert load(index) is index
+    assert len(fetched) == 1
+
+    # Only the changed file is fetched, and the rows of the other are reused
+    part_gdfs[PARTS[1]] = part_gdfs[PARTS[1]].assign(max_dis=0.0)
+    parts[PARTS[1]] = ("etag-2", None, 200)
+    new_index = load(index)
+    assert fetched[1:] == [[PARTS[1]]]
+    assert new_index.parts == parts
+    assert len(new_index.gdf) == len(gdf)
+    changed_rows = new_index.gdf["latitude"] >= 6.25
+    assert (new_index.gdf.loc[changed_rows, "max_dis"] == 0).all()
+    pd.testing.assert_frame_equal(
+        new_index.gdf[~changed_rows].drop(columns="part"),
+        index.gdf[~changed_rows].drop(columns="part"),
+    )
+
+
+@pytest.mark.parametrize(
+    "data, index, properties",
+    [
+        (summary_data, index_test_summary, SummaryProperties),
+        (detailed_data, index_test_detailed, DetailedProperties),
+        (threshold_data, index_test_threshold, ThresholdProperties),
+    ],
+)
+def test_load_grid_index_from_parquet(tmp_path, data, index, properties):
+    # Write the test data as a directory of parts, along with a marker file
+    df = pd.DataFrame(data).drop(columns="geometry")
+    df.iloc[::2].to_parquet(tmp_path / "part.0.parquet")
+    df.iloc[1::2].to_parquet(tmp_path / "part.1.parquet")
+    (tmp_path / "_SUCCESS").touch()
+
+    loaded_index = flooddata.load_grid_index(str(tmp_path), properties)
+    assert len(loaded_index.parts) == 2
+
+    # The served columns and geometries match the test data
+    columns = ["latitude", "longitude", *properties.model_fields]
+    pd.testing.assert_frame_equal(
+        loaded_index.gdf[columns].astype(index.gdf[columns].dtypes),
+        index.gdf[columns],
+    )
+    assert loaded_index.gdf.geometry.geom_equals_exact(index.gdf.geometry, 0).all()
+    assert loaded_index.content_hash == GridIndex(index.gdf[columns]).content_hash
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/clear_refs"),
+    reason="The peak resident memory can only be reset on Linux",
+)
+def test_load_grid_index_reports_memory_of_the_load(tmp_path):
+    pd.DataFrame(detailed_data).drop(columns="geometry").to_parquet(
+        tmp_path / "part.0.parquet"
+    )
+
+    # Raise the lifetime peak of the process well above what the load needs
+    spike = np.ones(2**28, dtype=np.uint8)
+    del spike
+    lifetime_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    flooddata.load_grid_index(str(tmp_path), DetailedProperties)
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"dataset": str(tmp_path)})
+
+    # The peak covers the load only
+    peak_rss = sample("flood_api_data_load_peak_rss_bytes")
+    assert flooddata.resident_bytes() <= peak_rss < lifetime_peak - 2**27
+    assert sample("flood_api_data_load_rss_increase_bytes") is not None
+
+
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_fetch_parquet_reports_progress(tmp_path, monkeypatch, concurrency):
+    monkeypatch.setattr(flooddata.settings, "data_fetch_concurrency", concurrency)
+    df = pd.DataFrame(detailed_data).drop(columns="geometry")
+    for i in range(4):
+        df.iloc[i::4].to_parquet(tmp_path / f"part.{i}.parquet")
+    parts = list(flooddata.list_parquet_parts(str(tmp_path)))
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"dataset": str(tmp_path)}) or 0
+
+    columns = ["latitude", "longitude", *DetailedProperties.model_fields]
+    gdf = flooddata.fetch_parquet(str(tmp_path), parts, columns)
+
+    # The files are concatenated in order, whatever order they arrive in
+    assert list(gdf["part"]) == [part for part in parts for _ in range(len(df) // 4)]
+    assert (
+        gdf["max_dis"] == pd.concat(df.iloc[i::4] for i in range(4))["max_dis"].values
+    ).all()
+    assert sample("flood_api_data_fetched_parts_total") == 4
+    assert sample("flood_api_data_pending_parts") == 0
+    assert sample("flood_api_data_part_download_seconds_count") == 4
+    assert sample("flood_api_data_part_decode_seconds_count") == 4
+    assert sample("flood_api_data_fetched_bytes_total") == sum(
+        (tmp_path / f"part.{i}.parquet").stat().st_size for i in range(4)
+    )
+
+
+def test_load_grid_index_from_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(flooddata.settings, "snapshot_dir", str(tmp_path / "snapshots"))
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    df = pd.DataFrame(detailed_data).drop(columns="geometry")
+    df.iloc[::2].to_parquet(data_path / "part.0.parquet")
+    df.iloc[1::2].to_parquet(data_path / "part.1.parquet")
+
+    fetched = []
+    fetch_parquet = flooddata.fetch_parquet
+
+    def fetch_and_record(path, paths, columns):
+        fetched.append(paths)
+        return fetch_parquet(path, paths, columns)
+
+    monkeypatch.setattr(flooddata, "fetch_parquet", fetch_and_record)
+
+    def load():
+        return flooddata.load_grid_index(str(data_path), DetailedProperties)
+
+    index = load()
+    assert len(fetched) == 1
+
+    # The built index is served from the mapped files of its snapshot
+    assert not index.gdf["max_dis"].to_numpy().flags.writeable
+    assert not index.offsets.flags.writeable
+
+    # On restart, the snapshot of the unchanged files is loaded instead
+    restored_index = load()
+    assert len(fetched) == 1
+    pd.testing.assert_frame_equal(restored_index.gdf, index.gdf)
+    assert (restored_index.offsets == index.offsets).all()
+    assert restored_index.content_hash == index.content_hash
+    assert restored_index.steps.tolist() == index.steps.tolist()
+    assert restored_index.issued_on == index.issued_on
+    assert restored_index.parts == index.parts
+    assert bytes(restored_index.fragments.buffer) == bytes(index.fragments.buffer)
+    assert (restored_index.fragments.offsets == index.fragments.offsets).all()
+
+    # A snapshot of files that changed since is not loaded
+    df.iloc[1::2].assign(max_dis=0.0).to_parquet(data_path / "part.1.parquet")
+    changed_index = load()
+    assert len(fetched) == 2
+    assert changed_index.content_hash != index.content_hash
+
+    # Only the files of the latest snapshot are kept
+    (snapshot_directory,) = (tmp_path / "snapshots").iterdir()
+    snapshot_files = snapshot_directory.glob("[!.]*")
+    assert len(list(snapshot_files)) == 5
+    assert load().content_hash == changed_index.content_hash
+    assert len(fetched) == 2
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"format": response_format}
+        for response_format in ["geojson", "ndjson", "grid", "arrow", "parquet"]
+    ]
+    + [{"layout": "timeseries"}, {"geometry": "point"}],
+)
+def test_serve_mapped_snapshot(tmp_path, monkeypatch, params):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    pd.DataFrame(detailed_data).drop(columns="geometry").to_parquet(
+        data_path / "part.0.parquet"
+    )
+
+    # The same data loaded into the heap and mapped from a snapshot
+    heap_index = flooddata.load_grid_index(str(data_path), DetailedProperties)
+    monkeypatch.setattr(flooddata.settings, "snapshot_dir", str(tmp_path / "snapshots"))
+    mapped_index = flooddata.load_grid_index(str(data_path), DetailedProperties)
+    assert not mapped_index.gdf["latitude"].to_numpy().flags.writeable
+
+    def get(index):
+        # A new generation, so that responses are not served from the cache
+        index.generation = next(flooddata.generations)
+        monkeypatch.setitem(
+            flood_app.dependency_overrides,
+            flooddata.get_detailed_data,
+            lambda: index,
+        )
+        response = TestClient(flood_app).get(
+            "/detailed",
+            params={
+                "min_lat": 6.0,
+                "max_lat": 6.5,
+                "min_lon": 39.0,
+                "max_lon": 39.5,
+                **params,
+            },
+        )
+        assert response.status_code == 200
+        return response.content
+
+    assert get(mapped_index) == get(heap_index)
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_serve_missing_strings(tmp_path, monkeypatch, snapshot):
+    if snapshot:
+        monkeypatch.setattr(
+            flooddata.settings, "snapshot_dir", str(tmp_path / "snapshots")
+        )
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+
+    # One missing tendency, and no intensity at all
+    df = pd.DataFrame(summary_data).drop(columns="geometry")
+    df["tendency"] = [None, "D"]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.set_column(
+        table.schema.get_field_index("intensity"),
+        "intensity",
+        pa.nulls(len(df), pa.string()),
+    )
+    pq.write_table(table, data_path / "part.0.parquet")
+    index = flooddata.load_grid_index(str(data_path), SummaryProperties)
+    monkeypatch.setitem(
+        flood_app.dependency_overrides, flooddata.get_summary_data, lambda: index
+    )
+
+    def get(**params):
+        response = TestClient(flood_app).get(
+            "/summary",
+            params={
+                "min_lat": 6.2,
+                "max_lat": 6.3,
+                "min_lon": 39.05,
+                "max_lon": 39.1,
+                "fields": "tendency,intensity",
+                **params,
+            },
+        )
+        assert response.status_code == 200
+        return response
+
+    expected = [
+        {"tendency": None, "intensity": None},
+        {"tendency": "D", "intensity": None},
+    ]
+    features = get().json()["queried_location"]["features"]
+    assert [feature["properties"] for feature in features] == expected
+    lines = get(format="ndjson").text.splitlines()
+    assert [json.loads(line)["properties"] for line in lines] == expected
+
+    for table in [
+        pa.ipc.open_stream(get(format="arrow").content).read_all(),
+        pq.read_table(io.BytesIO(get(format="parquet").content)),
+    ]:
+        assert table.schema.field("tendency").type == pa.string()
+        assert table.schema.field("intensity").type == pa.string()
+        assert table.select(["tendency", "intensity"]).to_pylist() == expected
+
+
+def test_workers_share_published_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(flooddata.settings, "snapshot_dir", str(tmp_path / "snapshots"))
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    df = pd.DataFrame(detailed_data).drop(columns="geometry")
+    df.to_parquet(data_path / "part.0.parquet")
+
+    fetched = []
+    fetch_parquet = flooddata.fetch_parquet
+
+    def fetch_and_record(path, paths, columns):
+        fetched.append(paths)
+        return fetch_parquet(path, paths, columns)
+
+    monkeypatch.setattr(flooddata, "fetch_parquet", fetch_and_record)
+
+    def load(current_index=None):
+        return flooddata.load_grid_index(
+            str(data_path), DetailedProperties, current_index
+        )
+
+    # Two worker processes start, and only the first one fetches the data
+    first_worker_index = load()
+    second_worker_index = load()
+    assert len(fetched) == 1
+    served_values = second_worker_index.gdf["max_dis"].copy()
+
+    # On a reload, the first worker to see the new files publishes them,
+    # and the other maps the published files
+    df.assign(max_dis=0.0).to_parquet(data_path / "part.0.parquet")
+    new_first_worker_index = load(first_worker_index)
+    new_second_worker_index = load(second_worker_index)
+    assert len(fetched) == 2
+    assert (
+        new_second_worker_index.content_hash
+        == new_first_worker_index.content_hash
+        != second_worker_index.content_hash
+    )
+    assert (new_second_worker_index.gdf["max_dis"] == 0).all()
+
+    # The previous generation stays mapped for the requests still using it
+    pd.testing.assert_series_equal(second_worker_index.gdf["max_dis"], served_values)
+    assert bytes(second_worker_index.fragments.buffer) == bytes(
+        first_worker_index.fragments.buffer
+    )
@@ -0,0 +1,168 @@
+from datetime import date
+
+import geopandas as gpd
+import numpy as np
+from shapely import box
+
+from flood_api.settings import settings
+from flood_api.tests.reference import get_data_for_roi
+from flood_api.tests.synthetic_data import index_test_detailed
+from flood_api.utils.geospatial_operations import (
+    create_polygon_from_bounds,
+    filter_positions_by_date,
+    get_data_for_point,
+    get_grid_cell_bounds,
+    iter_bbox_positions,
+)
+from flood_api.utils.grid_index import GridIndex
+
+GLOFAS_RESOLUTION = settings.glofas_resolution
+GLOFAS_PRECISION = settings.glofas_precision
+
+# A small grid in the lower left corner of the ROI with a few holes
+ROI = {"min_lat": -6.0, "max_lat": -5.7, "min_lon": -18.0, "max_lon": -17.6}
+
+
+def make_test_index() -> GridIndex:
+    rng = np.random.default_rng(0)
+    rows, cols = np.meshgrid(np.arange(6), np.arange(8), indexing="ij")
+    rows, cols = rows.ravel(), cols.ravel()
+    keep = rng.random(rows.size) > 0.2
+    rows, cols = rows[keep], cols[keep]
+
+    min_lat = ROI["min_lat"] + rows * GLOFAS_RESOLUTION
+    min_lon = ROI["min_lon"] + cols * GLOFAS_RESOLUTION
+    gdf = gpd.GeoDataFrame(
+        {
+            "latitude": np.round(min_lat + GLOFAS_RESOLUTION / 2, GLOFAS_PRECISION),
+            "longitude": np.round(min_lon + GLOFAS_RESOLUTION / 2, GLOFAS_PRECISION),
+            "value": rng.random(rows.size),
+        },
+        geometry=box(
+            np.round(min_lon, GLOFAS_PRECISION),
+            np.round(min_lat, GLOFAS_PRECISION),
+            np.round(min_lon + GLOFAS_RESOLUTION, GLOFAS_PRECISION),
+            np.round(min_lat + GLOFAS_RESOLUTION, GLOFAS_PRECISION),
+        ),
+    )
+    # Shuffle the rows to make sure the index does not rely on the input order
+    return GridIndex(gdf.sample(frac=1, random_state=0), roi=ROI)
+
+
+def test_grid_index_layout():
+    index = make_test_index()
+
+    assert (index.n_rows, index.n_cols) == (6, 8)
+    assert len(index.offsets) == index.n_rows * index.n_cols + 1
+    assert (
+        index.gdf[["latitude", "longitude"]]
+        .apply(tuple, axis=1)
+        .is_monotonic_increasing
+    )
+
+    # Every cell slice only holds rows for that cell
+    for row in range(index.n_rows):
+        for col in range(index.n_cols):
+            cell_df = index.gdf.iloc[index.cell_slice(row, col)]
+            assert len(cell_df) <= 1
+            if not cell_df.empty:
+                assert index.cell_indices_from_centers(
+                    cell_df["latitude"].to_numpy(), cell_df["longitude"].to_numpy()
+                ) == ([row], [col])
+
+    # Cells outside the grid are empty
+    assert index.cell_slice(-1, 0) == slice(0, 0)
+    assert index.cell_slice(0, index.n_cols) == slice(0, 0)
+
+
+def test_grid_index_matches_spatial_query():
+    index = make_test_index()
+    rng = np.random.default_rng(1)
+
+    latitudes = rng.uniform(ROI["min_lat"], ROI["max_lat"], 200)
+    longitudes = rng.uniform(ROI["min_lon"], ROI["max_lon"], 200)
+    # Include points on the cell boundaries
+    latitudes[:20] = np.round(latitudes[:20] / GLOFAS_RESOLUTION) * GLOFAS_RESOLUTION
+    longitudes[:20] = np.round(longitudes[:20] / GLOFAS_RESOLUTION) * GLOFAS_RESOLUTION
+
+    for latitude, longitude in zip(latitudes, longitudes):
+        primary_df, neighbors_df = get_data_for_point(
+            latitude=latitude,
+            longitude=longitude,
+            index=index,
+            include_neighbors=True,
+        )
+
+        # Compare against a spatial query on the cell geometries
+        cell_bounds = get_grid_cell_bounds(latitude, longitude)
+        expected_primary_df, expected_neighbors_df = get_data_for_roi(
+            roi=create_polygon_from_bounds(*cell_bounds, buffer=-GLOFAS_RESOLUTION / 2),
+            expanded_roi=create_polygon_from_bounds(
+                *cell_bounds, buffer=GLOFAS_RESOLUTION / 2
+            ),
+            gdf=index.gdf,
+        )
+
+        assert set(primary_df.index) == set(expected_primary_df.index)
+        assert set(neighbors_df.index) == set(expected_neighbors_df.index)
+
+
+def test_grid_index_bbox_matches_spatial_query():
+    index = make_test_index()
+    rng = np.random.default_rng(2)
+
+    for _ in range(200):
+        lats = np.sort(rng.uniform(ROI["min_lat"], ROI["max_lat"], 2))
+        lons = np.sort(rng.uniform(ROI["min_lon"], ROI["max_lon"], 2))
+        if rng.random() < 0.3:
+            # Snap the bounding box to the cell boundaries
+            lats = np.round(lats / GLOFAS_RESOLUTION) * GLOFAS_RESOLUTION
+            lons = np.round(lons / GLOFAS_RESOLUTION) * GLOFAS_RESOLUTION
+        bbox = (lats[0], lats[1], lons[0], lons[1])
+
+        positions = index.bbox_positions(*bbox)
+        expected_df, _ = get_data_for_roi(
+            roi=create_polygon_from_bounds(*bbox, precision=9), gdf=index.gdf
+        )
+
+        # Positions are ordered by cell and match the spatial query
+        assert np.all(np.diff(positions) > 0)
+        assert set(positions) == set(expected_df.index)
+
+        # Streaming the positions in chunks yields the same positions
+        chunks = list(iter_bbox_positions(bbox, index, chunk_size=2))
+        assert all(0 < len(chunk) <= 2 for chunk in chunks)
+        assert np.array_equal(np.concatenate([[], *chunks]), positions)
+
+
+def test_grid_index_step_window():
+    index = index_test_detailed
+    assert index.issued_on == date(2023, 11, 10)
+    all_positions = np.arange(len(index.gdf))
+
+    date_ranges = [
+        (date(2023, 11, 29), date(2023, 12, 1)),
+        (date(2023, 11, 10), date(2023, 11, 10)),
+        (date.min, date(2023, 11, 20)),
+        (date(2023, 12, 1), date.max),
+        (date(2024, 1, 1), date.max),
+    ]
+    for date_range in date_ranges:
+        step_window = index.step_window(date_range)
+
+        # Comparing steps is equivalent to comparing dates
+        assert np.array_equal(
+            filter_positions_by_date(all_positions, index.gdf, date_range),
+            filter_positions_by_date(all_positions, index.gdf, date_range, step_window),
+        )
+
+        # The step window of a cell is a sub-slice of its rows
+        row, col = index.cell_index(latitude=6.2, longitude=39.05)
+        cell = index.cell_slice(row, col)
+        cell_step_slice = index.cell_step_slice(row, col, *step_window)
+        assert np.array_equal(
+            np.arange(cell_step_slice.start, cell_step_slice.stop),
+            filter_positions_by_date(
+                np.arange(cell.start, cell.stop), index.gdf, date_range
+            ),
+        )
@@ -1,16 +1,25 @@
+import asyncio
+import io
+import time
+
 import geopandas as gpd
+import httpx
+import pyarrow as pa
 from fastapi.testclient import TestClient
 
 from flood_api.__main__ import app
 from flood_api.dependencies.flooddata import get_summary_data
+from flood_api.models.summary_types import SummaryProperties
+from flood_api.routers.flood import response_cache
 from flood_api.settings import settings
-from flood_api.tests.synthetic_data import gdf_test_summary
+from flood_api.utils import compression
+from flood_api.tests.synthetic_data import index_test_summary
 
 GLOFAS_ROI = settings.glofas_roi
 OUT_OF_BOUNDS_STATUS_CODE = 404
 INVALID_STATUS_CODE = 400
 
-app.dependency_overrides[get_summary_data] = lambda: gdf_test_summary
+app.dependency_overrides[get_summary_data] = lambda: index_test_summary
 
 client = TestClient(app)
 
@@ -23,6 +32,10 @@ def get_summary_response_code(params):
     return get_summary_response(params).status_code
 
 
+def get_summary_batch_response(locations, params=None):
+    return client.post("/summary/batch", json=locations, params=params)
+
+
 def test_summary_arg_validity():
     # Neither lat/lon nor bbox are provided
     params = {"include_neighbors": "true"}
@@ -314,3 +327,240 @@ def test_summary_bbox_general():
 
     # Assert that row count is correct
     assert len(gdf) == 1
+
+
+def test_summary_batch_general():
+    # The first two locations are in the same cell, the
+    # third is in the neighboring cell and the last has no data
+    locations = {
+        "lat": [6.2, 6.24, 6.25, 0.0],
+        "lon": [39.05, 39.09, 39.05, 0.0],
+    }
+
+    response = get_summary_batch_response(
+        locations, params={"include_neighbors": "true"}
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+
+    # Results are keyed by the position of each location
+    assert list(data["results"]) == ["0", "1", "2", "3"]
+
+    gdfs = [
+        gpd.GeoDataFrame.from_features(result["queried_location"]["features"])
+        for result in data["results"].values()
+    ]
+
+    # Assert that row counts are correct
+    assert [len(gdf) for gdf in gdfs] == [1, 1, 1, 0]
+
+    # Locations in the same cell get the same data
+    assert data["results"]["0"] == data["results"]["1"]
+    assert gdfs[0]["geometry"].iloc[0] != gdfs[2]["geometry"].iloc[0]
+
+    # Neighbors are included for every location with data
+    for position in ["0", "1", "2"]:
+        assert data["results"][position]["neighboring_location"]["features"]
+
+
+def test_summary_batch_validity():
+    # One of the locations is outside the ROI
+    locations = {
+        "lat": [6.2, GLOFAS_ROI["max_lat"]],
+        "lon": [39.05, 39.05],
+    }
+    response = get_summary_batch_response(locations)
+    assert response.status_code == OUT_OF_BOUNDS_STATUS_CODE
+    assert "[1]" in response.json()["detail"]
+
+    # Latitudes and longitudes do not match up
+    locations = {"lat": [6.2, 6.25], "lon": [39.05]}
+    assert get_summary_batch_response(locations).status_code == 422
+
+    # No locations are provided
+    locations = {"lat": [], "lon": []}
+    assert get_summary_batch_response(locations).status_code == 422
+
+
+def test_summary_tabular_formats():
+    params = {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+    gdf_geojson = gpd.GeoDataFrame.from_features(
+        get_summary_response(params).json()["queried_location"]["features"]
+    )
+    columns = ["latitude", "longitude"] + list(SummaryProperties.model_fields.keys())
+
+    # Arrow IPC stream, requested with the Accept header
+    response = client.get(
+        "/summary",
+        params=params,
+        headers={"Accept": "application/vnd.apache.arrow.stream"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column_names == columns + ["geometry"]
+    assert table.num_rows == 2
+    assert table["intensity"].to_pylist() == gdf_geojson["intensity"].tolist()
+    assert table["peak_day"].type == pa.date32()
+
+    # GeoParquet, requested with the query parameter
+    response = get_summary_response({**params, "format": "parquet"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+
+    gdf = gpd.read_parquet(io.BytesIO(response.content))
+    assert gdf["geometry"].equals(gdf_geojson["geometry"])
+    assert gdf["max_median_dis"].tolist() == gdf_geojson["max_median_dis"].tolist()
+
+    # Neighboring cells follow the queried cell and are flagged
+    params = {"lat": 6.2, "lon": 39.05, "include_neighbors": "true", "format": "arrow"}
+    response = get_summary_response(params)
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table["neighboring"].to_pylist() == [False, True]
+
+
+def test_summary_grid_format():
+    params = {"min_lat": 6.2, "max_lat": 6.3, "min_lon": 39.0, "max_lon": 39.1}
+    gdf_geojson = gpd.GeoDataFrame.from_features(
+        get_summary_response(params).json()["queried_location"]["features"]
+    )
+
+    response = get_summary_response({**params, "format": "grid"})
+    assert response.status_code == 200
+    data = response.json()
+
+    # The grid covers the cells touching the bounding box
+    assert data["origin"] == {"latitude": 6.15, "longitude": 38.95}
+    assert data["resolution"] == 0.05
+    assert data["shape"] == [4, 4]
+
+    # The cells are located by row and column in the grid
+    assert list(zip(data["row"], data["col"])) == [(1, 2), (2, 2)]
+    for row, col, geometry in zip(data["row"], data["col"], gdf_geojson["geometry"]):
+        min_lon, min_lat, _, _ = geometry.bounds
+        assert round(data["origin"]["latitude"] + row * 0.05, 3) == min_lat
+        assert round(data["origin"]["longitude"] + col * 0.05, 3) == min_lon
+
+    # One array per property
+    assert list(data["properties"]) == list(SummaryProperties.model_fields.keys())
+    assert data["properties"]["intensity"] == gdf_geojson["intensity"].tolist()
+    assert data["properties"]["peak_day"] == gdf_geojson["peak_day"].tolist()
+
+    # The grid format is only available for bounding boxes
+    params = {"lat": 6.2, "lon": 39.05, "format": "grid"}
+    assert get_summary_response_code(params) == INVALID_STATUS_CODE
+
+
+def test_summary_fields():
+    params = {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+    expected_features = get_summary_response(params).json()["queried_location"][
+        "features"
+    ]
+
+    # Fields can be comma-separated or repeated, and are returned in model order
+    for fields in ["intensity,peak_step", ["intensity", "peak_step"]]:
+        response = get_summary_response({**params, "fields": fields})
+        assert response.status_code == 200
+        features = response.json()["queried_location"]["features"]
+        assert [feature["properties"] for feature in features] == [
+            {
+                "peak_step": feature["properties"]["peak_step"],
+                "intensity": feature["properties"]["intensity"],
+            }
+            for feature in expected_features
+        ]
+
+    # Columnar formats only hold the requested fields
+    response = get_summary_response(
+        {**params, "fields": "intensity", "format": "arrow"}
+    )
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["latitude", "longitude", "intensity", "geometry"]
+
+    # Batch queries support the projection as well
+    response = get_summary_batch_response(
+        {"lat": [6.2], "lon": [39.05]}, params={"fields": "tendency"}
+    )
+    features = response.json()["results"]["0"]["queried_location"]["features"]
+    assert list(features[0]["properties"]) == ["tendency"]
+
+    # Unknown fields are rejected
+    params = {"lat": 6.2, "lon": 39.05, "fields": "intensity,valid_for"}
+    response = get_summary_response(params)
+    assert response.status_code == INVALID_STATUS_CODE
+    assert "valid_for" in response.json()["detail"]
+
+
+def test_summary_concurrent_requests_compress_once(monkeypatch):
+    response_cache.clear()
+    compressed = []
+    compress = compression.compress
+
+    def slow_compress(content, encoding):
+        compressed.append(encoding)
+        # Keep the compression in flight while the other requests arrive
+        time.sleep(0.2)
+        return compress(content, encoding)
+
+    monkeypatch.setattr(compression, "compress", slow_compress)
+    monkeypatch.setattr(settings, "compression_minimum_size", 0)
+
+    async def get_concurrently(params, encodings):
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(
+                    client.get(
+                        "/summary",
+                        params=params,
+                        headers={"Accept-Encoding": encoding},
+                    )
+                    for encoding in encodings
+                )
+            )
+
+    # Identical cache misses compute and compress the body once
+    params = {"min_lat": 6.0, "max_lat": 6.5, "min_lon": 39.0, "max_lon": 39.5}
+    responses = asyncio.run(get_concurrently(params, ["br"] * 8))
+    assert compressed == ["br"]
+    assert len({response.content for response in responses}) == 1
+    assert all(response.headers["content-encoding"] == "br" for response in responses)
+
+    # Each encoding is compressed once, and then served from the cache
+    responses = asyncio.run(get_concurrently(params, ["gzip", "br"] * 4))
+    assert compressed == ["br", "gzip"]
+    assert [response.headers["content-encoding"] for response in responses] == [
+        "gzip",
+        "br",
+    ] * 4
+
+
+def test_summary_response_cache():
+    response_cache.clear()
+
+    # Coordinates in the same cell share the same cached response
+    params = {"lat": 6.21, "lon": 39.06, "include_neighbors": "true"}
+    response = get_summary_response(params)
+    assert response.status_code == 200
+    assert len(response_cache) == 1
+
+    cached_response = get_summary_response({**params, "lat": 6.24, "lon": 39.09})
+    assert cached_response.content == response.content
+    assert len(response_cache) == 1
+
+    # As do bounding boxes intersecting the same cells
+    bbox = {"min_lat": 6.21, "max_lat": 6.26, "min_lon": 39.06, "max_lon": 39.07}
+    response = get_summary_response(bbox)
+    cached_response = get_summary_response({**bbox, "min_lat": 6.22})
+    assert cached_response.content == response.content
+    assert len(response_cache) == 2
+
+    # Other parameters are part of the key
+    response = get_summary_response({**params, "include_neighbors": "false"})
+    assert response.json()["neighboring_location"] is None
+    response = get_summary_response({**params, "fields": "intensity"})
+    assert list(response.json()["queried_location"]["features"][0]["properties"]) == [
+        "intensity"
+    ]
+    assert len(response_cache) == 4
@@ -1,16 +1,19 @@
+import io
+
 import geopandas as gpd
+import pyarrow as pa
 from fastapi.testclient import TestClient
 
 from flood_api.__main__ import app
 from flood_api.dependencies.flooddata import get_threshold_data
 from flood_api.settings import settings
-from flood_api.tests.synthetic_data import gdf_test_threshold
+from flood_api.tests.synthetic_data import index_test_threshold
 
 GLOFAS_ROI = settings.glofas_roi
 OUT_OF_BOUNDS_STATUS_CODE = 404
 INVALID_STATUS_CODE = 400
 
-app.dependency_overrides[get_threshold_data] = lambda: gdf_test_threshold
+app.dependency_overrides[get_threshold_data] = lambda: index_test_threshold
 
 client = TestClient(app)
 
@@ -23,6 +26,10 @@ def get_threshold_response_code(params):
     return get_threshold_response(params).status_code
 
 
+def get_threshold_batch_response(locations, params=None):
+    return client.post("/threshold/batch", json=locations, params=params)
+
+
 def test_threshold_arg_validity():
     # Neither lat/lon nor bbox are provided
     params = {"include_neighbors": "true"}
@@ -296,3 +303,148 @@ def test_summary_bbox_general():
 
     # Assert that row count is correct
     assert len(gdf) == 1
+
+
+def test_threshold_batch_general():
+    # The first two locations are in the same cell, the
+    # third is in the neighboring cell and the last has no data
+    locations = {
+        "lat": [6.2, 6.24, 6.25, 0.0],
+        "lon": [39.05, 39.09, 39.05, 0.0],
+    }
+
+    response = get_threshold_batch_response(locations)
+    data = response.json()
+
+    assert response.status_code == 200
+
+    # Results are keyed by the position of each location
+    assert list(data["results"]) == ["0", "1", "2", "3"]
+
+    gdfs = [
+        gpd.GeoDataFrame.from_features(result["queried_location"]["features"])
+        for result in data["results"].values()
+    ]
+
+    # Assert that row counts are correct
+    assert [len(gdf) for gdf in gdfs] == [1, 1, 1, 0]
+
+    # Locations in the same cell get the same data
+    assert data["results"]["0"] == data["results"]["1"]
+    assert gdfs[0]["geometry"].iloc[0] != gdfs[2]["geometry"].iloc[0]
+
+
+def test_threshold_batch_validity():
+    # One of the locations is outside the ROI
+    locations = {
+        "lat": [6.2, GLOFAS_ROI["max_lat"]],
+        "lon": [39.05, 39.05],
+    }
+    response = get_threshold_batch_response(locations)
+    assert response.status_code == OUT_OF_BOUNDS_STATUS_CODE
+    assert "[1]" in response.json()["detail"]
+
+    # Latitudes and longitudes do not match up
+    locations = {"lat": [6.2, 6.25], "lon": [39.05]}
+    assert get_threshold_batch_response(locations).status_code == 422
+
+    # No locations are provided
+    locations = {"lat": [], "lon": []}
+    assert get_threshold_batch_response(locations).status_code == 422
+
+
+def test_threshold_geometry_modes():
+    params = {"min_lat": 6.225, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+
+    # Polygons are computed from the cell centers and match the stored shapes
+    features = get_threshold_response({**params, "geometry": "polygon"}).json()[
+        "queried_location"
+    ]["features"]
+    gdf = gpd.GeoDataFrame.from_features(features)
+    assert gdf["geometry"].equals(index_test_threshold.gdf["geometry"])
+    assert features[0]["geometry"]["coordinates"] == [
+        [[39.05, 6.2], [39.05, 6.25], [39.1, 6.25], [39.1, 6.2], [39.05, 6.2]]
+    ]
+
+    # Points are the cell centers
+    features = get_threshold_response({**params, "geometry": "point"}).json()[
+        "queried_location"
+    ]["features"]
+    assert [feature["geometry"] for feature in features] == [
+        {"type": "Point", "coordinates": [39.075, 6.225]},
+        {"type": "Point", "coordinates": [39.075, 6.275]},
+    ]
+
+    # Geometries can be left out
+    features = get_threshold_response({**params, "geometry": "none"}).json()[
+        "queried_location"
+    ]["features"]
+    assert [feature["geometry"] for feature in features] == [None, None]
+    assert features[0]["properties"]["threshold_2y"] is not None
+
+    response = get_threshold_response({**params, "geometry": "none", "format": "arrow"})
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert "geometry" not in table.column_names
+
+    response = get_threshold_response(
+        {**params, "geometry": "point", "format": "parquet"}
+    )
+    gdf = gpd.read_parquet(io.BytesIO(response.content))
+    assert gdf["geometry"].geom_type.tolist() == ["Point", "Point"]
+
+    # Batch queries support the geometry modes as well
+    response = get_threshold_batch_response(
+        {"lat": [6.2], "lon": [39.05]}, params={"geometry": "point"}
+    )
+    features = response.json()["results"]["0"]["queried_location"]["features"]
+    assert features[0]["geometry"]["type"] == "Point"
+
+
+def test_threshold_conditional_requests():
+    params = {"lat": 6.21, "lon": 39.06}
+    response = client.get(
+        "/threshold", params=params, headers={"Accept-Encoding": "identity"}
+    )
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+    assert response.headers["cache-control"].startswith("public, max-age=")
+
+    # The tag depends on the data and the canonical query only
+    response = client.get(
+        "/threshold",
+        params={"lat": 6.24, "lon": 39.09},
+        headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    for headers in [
+        {"If-None-Match": f'"other", W/{etag}'},
+        {"If-None-Match": "*"},
+    ]:
+        response = client.get("/threshold", params=params, headers=headers)
+        assert response.status_code == 304
+
+    # Other queries and formats have other tags
+    for other_params in [
+        {"lat": 6.26, "lon": 39.06},
+        {**params, "geometry": "point"},
+        {**params, "format": "arrow"},
+    ]:
+        response = client.get(
+            "/threshold", params=other_params, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    # Streams are tagged as well
+    bbox = {"min_lat": 6.2, "max_lat": 6.25, "min_lon": 39.0, "max_lon": 40.0}
+    response = get_threshold_response({**bbox, "format": "ndjson"})
+    assert response.status_code == 200
+    response = client.get(
+        "/threshold",
+        params={**bbox, "format": "ndjson"},
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
@@ -1,5 +1,31 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from decimal import Decimal, DefaultContext, getcontext, localcontext
+from math import floor
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from hypothesis import given
+from hypothesis import strategies as st
+from prometheus_client import REGISTRY
+
+from flood_api.models.detailed_types import (
+    DetailedFeatureCollection,
+    DetailedProperties,
+)
 from flood_api.settings import settings
-from flood_api.utils.geospatial_operations import get_grid_cell_bounds
+from flood_api.tests.synthetic_data import index_test_detailed
+from flood_api.utils.compression import EncodedBody, negotiate_encoding
+from flood_api.utils.http_caching import matching_etag, seconds_until_next_reload
+from flood_api.utils.geospatial_operations import (
+    create_cell_polygons,
+    get_grid_cell_bounds,
+)
+from flood_api.utils.json_utilities import FeatureFragments, dataframe_to_geojson
+from flood_api.utils.response_cache import ResponseCache
+from flood_api.utils.single_flight import SingleFlight
 
 GLOFAS_RESOLUTION = settings.glofas_resolution
 GLOFAS_PRECISION = settings.glofas_precision
@@ -49,3 +75,260 @@ def test_get_grid_cell_bounds():
         lat, lon, GLOFAS_RESOLUTION, GLOFAS_PRECISION
     )
     assert obtained_bounds == (*expected_lat_bounds, *expected_lon_bounds)
+
+
+def decimal_grid_cell_bounds(
+    latitude: float,
+    longitude: float,
+    grid_size: float = GLOFAS_RESOLUTION,
+    precision: int = GLOFAS_PRECISION,
+) -> tuple[float, float, float, float]:
+    # Reference implementation using Decimal arithmetic with a
+    # precision of 9 significant digits
+    with localcontext() as context:
+        context.prec = 9
+        latitude = Decimal(str(latitude))
+        longitude = Decimal(str(longitude))
+        grid_size = Decimal(str(grid_size))
+
+        min_lon_cell = floor(longitude / grid_size) * grid_size
+        min_lat_cell = floor(latitude / grid_size) * grid_size
+        max_lon_cell = min_lon_cell + grid_size
+        max_lat_cell = min_lat_cell + grid_size
+
+        return (
+            float(round(min_lat_cell, precision)),
+            float(round(max_lat_cell, precision)),
+            float(round(min_lon_cell, precision)),
+            float(round(max_lon_cell, precision)),
+        )
+
+
+# Coordinates with up to 5 decimal places, for which the quotients in the
+# reference implementation are exact within 9 significant digits
+latitudes = st.decimals(min_value=-90, max_value=90, places=5).map(float)
+longitudes = st.decimals(min_value=-180, max_value=180, places=5).map(float)
+
+
+@given(latitude=latitudes, longitude=longitudes)
+def test_get_grid_cell_bounds_matches_decimal(latitude, longitude):
+    assert get_grid_cell_bounds(latitude, longitude) == decimal_grid_cell_bounds(
+        latitude, longitude
+    )
+
+
+@given(
+    latitude=latitudes,
+    longitude=longitudes,
+    grid_size=st.sampled_from([0.05, 0.1, 0.25, 1.0]),
+)
+def test_get_grid_cell_bounds_grid_sizes(latitude, longitude, grid_size):
+    assert get_grid_cell_bounds(
+        latitude, longitude, grid_size
+    ) == decimal_grid_cell_bounds(latitude, longitude, grid_size)
+
+
+@given(coordinates=st.lists(st.tuples(latitudes, longitudes), min_size=1, max_size=50))
+def test_get_grid_cell_bounds_arrays(coordinates):
+    latitude, longitude = map(np.array, zip(*coordinates))
+
+    obtained_bounds = get_grid_cell_bounds(latitude, longitude)
+
+    expected_bounds = [decimal_grid_cell_bounds(*point) for point in coordinates]
+    assert np.array_equal(np.column_stack(obtained_bounds), expected_bounds)
+
+
+def test_get_grid_cell_bounds_decimal_context():
+    # Snapping must not change the global Decimal context
+    get_grid_cell_bounds(6.2, 39.05)
+    assert getcontext().prec == DefaultContext.prec
+
+
+def test_dataframe_to_geojson():
+    columns = list(DetailedProperties.model_fields.keys())
+    gdf = index_test_detailed.gdf
+
+    geojson = dataframe_to_geojson(gdf, columns)
+
+    # The GeoJSON is valid according to the response model
+    feature_collection = DetailedFeatureCollection.model_validate_json(geojson)
+    assert len(feature_collection.features) == len(gdf)
+
+    # The GeoJSON holds the same data as the GeoDataFrame
+    gdf_from_geojson = gpd.GeoDataFrame.from_features(json.loads(geojson))
+    assert gdf_from_geojson["geometry"].equals(gdf["geometry"])
+    assert (
+        gdf_from_geojson["valid_for"].tolist()
+        == gdf["valid_for"].dt.strftime("%Y-%m-%d").tolist()
+    )
+    assert gdf_from_geojson["median_dis"].tolist() == gdf["median_dis"].tolist()
+
+    # Non-finite numbers are encoded as null
+    gdf = gdf.head(2).copy()
+    gdf["median_dis"] = [np.nan, np.inf]
+    features = json.loads(dataframe_to_geojson(gdf, columns))["features"]
+    assert [feature["properties"]["median_dis"] for feature in features] == [
+        None,
+        None,
+    ]
+
+    # Empty GeoDataFrames yield an empty feature collection
+    assert json.loads(dataframe_to_geojson(gdf.head(0), columns)) == {
+        "type": "FeatureCollection",
+        "features": [],
+    }
+
+
+def test_feature_fragments():
+    columns = list(DetailedProperties.model_fields.keys())
+    gdf = index_test_detailed.gdf
+
+    # Encode in several chunks to cover the chunk boundaries
+    fragments = FeatureFragments(gdf, columns, chunk_size=7)
+    assert len(fragments.offsets) == len(gdf) + 1
+
+    # Assembled features match encoding the rows directly
+    rng = np.random.default_rng(0)
+    for positions in [
+        np.arange(len(gdf)),
+        np.arange(5, 12),
+        np.sort(rng.choice(len(gdf), 10, replace=False)),
+        np.empty(0, dtype=np.int64),
+    ]:
+        assert fragments.feature_collection(positions) == dataframe_to_geojson(
+            gdf.iloc[positions], columns
+        )
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    # Ties are broken by the server preference
+    assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_encoding("*") == "zstd"
+    # Quality values take precedence
+    assert negotiate_encoding("zstd;q=0.5, br;q=0.8, gzip") == "gzip"
+    assert negotiate_encoding("*, zstd;q=0, br;q=0") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+
+
+def test_encoded_body():
+    content = json.dumps([{"value": i} for i in range(1000)]).encode()
+    body = EncodedBody(content, "application/json")
+
+    # Variants are compressed once and kept
+    compressed = body.variant("br")
+    assert body.variant("br") is compressed
+    assert body.size == len(content) + len(compressed)
+
+    response = body.response("br, gzip")
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.body is compressed
+
+    # Small bodies are sent uncompressed
+    response = EncodedBody(b"{}", "application/json").response("br, gzip")
+    assert "content-encoding" not in response.headers
+    assert response.body == b"{}"
+
+
+def test_response_cache():
+    cache = ResponseCache(max_bytes=250)
+    bodies = [EncodedBody(bytes(100), "application/json") for _ in range(3)]
+
+    cache.put("a", bodies[0])
+    cache.put("b", bodies[1])
+    assert cache.get("a") is bodies[0]
+    assert cache.get("c") is None
+
+    # The least recently used body is evicted
+    cache.put("c", bodies[2])
+    assert cache.get("b") is None
+    assert cache.size == 200
+
+    # Storing a body again accounts for its compressed variants
+    bodies[0].variant("gzip")
+    cache.put("a", bodies[0])
+    assert cache.size == bodies[0].size + 100
+    assert cache.get("a") is bodies[0]
+
+    # Bodies larger than the cache are not stored
+    cache.put("d", EncodedBody(bytes(300), "application/json"))
+    assert cache.get("d") is None
+    assert len(cache) == 2
+
+
+def test_single_flight():
+    def coalesced_requests():
+        return REGISTRY.get_sample_value("flood_api_coalesced_requests_total")
+
+    async def run():
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await release.wait()
+            if value is None:
+                raise ValueError("No value")
+            return value
+
+        # Concurrent callers with the same key share the first computation
+        tasks = [
+            asyncio.create_task(single_flight.run(key, lambda v=value: compute(v)))
+            for key, value in [("a", 1), ("a", 2), ("b", 3), ("a", 4), ("c", None)]
+        ]
+        await asyncio.sleep(0)
+        assert len(single_flight) == 3
+
+        # Cancelling the caller that started a computation does not cancel it
+        tasks[0].cancel()
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert results[1:4] == [1, 3, 1]
+        assert isinstance(results[4], ValueError)
+        assert calls == [1, 3, None]
+        assert len(single_flight) == 0
+
+        # Completed computations are not reused
+        assert await single_flight.run("a", lambda: compute(5)) == 5
+
+    before = coalesced_requests()
+    asyncio.run(run())
+    assert coalesced_requests() - before == 2
+
+
+def test_matching_etag():
+    assert matching_etag("", "abc", "gzip") is None
+    assert matching_etag('"abc"', "abc", "") == '"abc"'
+    assert matching_etag('"xyz", "abc-gzip"', "abc", "gzip") == '"abc-gzip"'
+    assert matching_etag('W/"abc-br"', "abc", "br;q=0.5, gzip") is None
+    assert matching_etag("*", "abc", "br") == '"abc-br"'
+
+
+def test_seconds_until_next_reload():
+    # Reloaded daily at 12:00 UTC by default
+    assert settings.data_reload_cron == "0 12 * * *"
+    now = datetime(2023, 11, 10, 11, 30, tzinfo=timezone.utc)
+    assert seconds_until_next_reload(now) == 30 * 60
+    now = datetime(2023, 11, 10, 12, 0, tzinfo=timezone.utc)
+    assert seconds_until_next_reload(now) == 24 * 60 * 60
+
+
+def test_create_cell_polygons():
+    gdf = index_test_detailed.gdf
+    polygons = create_cell_polygons(
+        gdf["latitude"].to_numpy(), gdf["longitude"].to_numpy()
+    )
+
+    # The polygons match the cell geometries of the source data
+    assert shapely.equals_exact(polygons, gdf.geometry.to_numpy()).all()
+    assert shapely.to_wkt(polygons[0]) == shapely.to_wkt(gdf.geometry.iloc[0])
+
+    # Rows in the same cell share the same polygon object
+    assert polygons[0] is polygons[1]
+    assert len({id(polygon) for polygon in polygons}) == 2
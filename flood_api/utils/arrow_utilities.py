@@ -0,0 +1,188 @@
+import io
+import json
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from flood_api.models.shared_types import GeometryMode
+from flood_api.utils.geospatial_operations import get_grid_cell_bounds
+
+# Cell centers are included in every table, so that clients that know the
+# grid do not need to decode the geometries
+COORDINATE_COLUMNS = ["latitude", "longitude"]
+
+# Names of the geometry types in the GeoParquet metadata
+GEOMETRY_TYPE_NAMES = {
+    shapely.GeometryType.POINT: "Point",
+    shapely.GeometryType.LINESTRING: "LineString",
+    shapely.GeometryType.POLYGON: "Polygon",
+    shapely.GeometryType.MULTIPOINT: "MultiPoint",
+    shapely.GeometryType.MULTILINESTRING: "MultiLineString",
+    shapely.GeometryType.MULTIPOLYGON: "MultiPolygon",
+    shapely.GeometryType.GEOMETRYCOLLECTION: "GeometryCollection",
+}
+
+# Marks the WKB geometry column as a GeoArrow extension type
+GEOARROW_WKB_METADATA = {
+    b"ARROW:extension:name": b"geoarrow.wkb",
+    b"ARROW:extension:metadata": b"{}",
+}
+
+
+def column_to_arrow(values: pd.Series) -> pa.Array:
+    """
+    Convert a column to an Arrow array. Numeric columns are wrapped
+    without copying, dates are converted to Arrow dates, and other columns
+    are converted to strings.
+
+    Parameters:
+    - values (Series): The column to convert.
+
+    Returns:
+    Array: The Arrow array.
+    """
+    array = values.to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(array.dtype):
+        return pa.array(array.astype("datetime64[D]"), type=pa.date32())
+
+    if pd.api.types.is_float_dtype(array.dtype):
+        # Non-finite numbers are encoded as nulls, as in the GeoJSON responses
+        return pa.array(array, mask=~np.isfinite(array))
+
+    if array.dtype == object:
+        # Missing values are nulls, and a column of missing values is still
+        # typed as strings
+        return pa.array(array, type=pa.string(), from_pandas=True)
+
+    return pa.array(array)
+
+
+def cell_geometries(
+    df: gpd.GeoDataFrame, geometry: GeometryMode = GeometryMode.POLYGON
+) -> np.ndarray | None:
+    """
+    Build the geometries of a GeoDataFrame of grid cells from the cell
+    centers in the `latitude` and `longitude` columns: either the polygons
+    of the cells, their center points, or None.
+
+    Parameters:
+    - df (GeoDataFrame): The grid cells.
+    - geometry (GeometryMode, optional): The geometry to build. Defaults to polygon.
+
+    Returns:
+    ndarray | None: The geometries, one per row.
+    """
+    if geometry is GeometryMode.NONE:
+        return None
+
+    latitude, longitude = df["latitude"].to_numpy(), df["longitude"].to_numpy()
+    if geometry is GeometryMode.POINT:
+        return shapely.points(longitude, latitude)
+
+    # Clockwise rings starting at the lower left corner, as in the GeoJSON
+    min_lat, max_lat, min_lon, max_lon = get_grid_cell_bounds(latitude, longitude)
+    rings = np.stack(
+        [
+            np.stack([min_lon, min_lon, max_lon, max_lon, min_lon], axis=-1),
+            np.stack([min_lat, max_lat, max_lat, min_lat, min_lat], axis=-1),
+        ],
+        axis=-1,
+    )
+    return shapely.polygons(rings)
+
+
+def dataframe_to_arrow(
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    extra_columns: dict[str, np.ndarray] | None = None,
+    geometries: np.ndarray | None = None,
+) -> pa.Table:
+    """
+    Convert a GeoDataFrame to an Arrow table holding the cell centers,
+    the given columns and, if given, the geometries encoded as WKB.
+
+    Parameters:
+    - df (GeoDataFrame): The GeoDataFrame to convert.
+    - columns (list): The columns to include as properties.
+    - extra_columns (dict, optional): Additional columns to append before
+    the geometry, keyed by name. Defaults to None.
+    - geometries (ndarray, optional): The geometries of the rows, as built by
+    `cell_geometries`. Defaults to None, in which case no geometry is included.
+
+    Returns:
+    Table: The Arrow table.
+    """
+    arrays = {col: column_to_arrow(df[col]) for col in COORDINATE_COLUMNS + columns}
+    for name, values in (extra_columns or {}).items():
+        arrays[name] = pa.array(values)
+
+    fields = [pa.field(name, array.type) for name, array in arrays.items()]
+    if geometries is not None:
+        fields.append(pa.field("geometry", pa.binary(), metadata=GEOARROW_WKB_METADATA))
+        arrays["geometry"] = pa.array(shapely.to_wkb(geometries), type=pa.binary())
+
+    return pa.Table.from_arrays(list(arrays.values()), schema=pa.schema(fields))
+
+
+def table_to_arrow_stream(table: pa.Table) -> bytes:
+    """
+    Serialize an Arrow table in the Arrow IPC streaming format.
+
+    Parameters:
+    - table (Table): The table to serialize.
+
+    Returns:
+    bytes: The Arrow IPC stream.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def table_to_geoparquet(table: pa.Table, geometries: np.ndarray | None) -> bytes:
+    """
+    Serialize an Arrow table with a WKB `geometry` column as GeoParquet.
+    Tables without geometries are written as plain Parquet.
+
+    Parameters:
+    - table (Table): The table to serialize.
+    - geometries (ndarray | None): The geometries of the rows, used to describe
+    the geometry column in the GeoParquet metadata.
+
+    Returns:
+    bytes: The GeoParquet file.
+    """
+    sink = io.BytesIO()
+    if geometries is None:
+        pq.write_table(table, sink)
+        return sink.getvalue()
+
+    geometry_metadata = {
+        "encoding": "WKB",
+        "geometry_types": sorted(
+            {
+                GEOMETRY_TYPE_NAMES[type_id]
+                for type_id in shapely.get_type_id(geometries).tolist()
+            }
+        ),
+    }
+    if len(geometries):
+        geometry_metadata["bbox"] = shapely.total_bounds(geometries).tolist()
+
+    geo_metadata = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": geometry_metadata},
+    }
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), b"geo": json.dumps(geo_metadata).encode()}
+    )
+
+    pq.write_table(table, sink)
+    return sink.getvalue()
@@ -0,0 +1,300 @@
+import gzip
+import zlib
+
+import brotli
+import zstandard
+from anyio.to_thread import run_sync
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from flood_api.settings import settings
+
+# Supported content codings, in order of preference when a client accepts
+# several of them with the same quality
+ENCODINGS = ("zstd", "br", "gzip")
+
+
+def parse_quality_values(header: str) -> list[tuple[str, float]]:
+    """
+    Parse a header listing values with optional quality values, such as
+    `Accept` or `Accept-Encoding`.
+
+    Parameters:
+    - header (str): The value of the header.
+
+    Returns:
+    list: The lowercase values and their quality, in the order of the header.
+    """
+    values = []
+    for item in header.split(","):
+        value, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, param_value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+        if value:
+            values.append((value.lower(), quality))
+    return values
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """
+    Select the content coding of a response from the `Accept-Encoding`
+    header of the request.
+
+    Parameters:
+    - accept_encoding (str): The value of the `Accept-Encoding` header.
+
+    Returns:
+    str | None: The preferred supported coding, or None for an uncompressed response.
+    """
+    qualities = dict(parse_quality_values(accept_encoding))
+    wildcard = qualities.get("*", 0.0)
+    candidates = [
+        (qualities.get(encoding, wildcard), -rank, encoding)
+        for rank, encoding in enumerate(ENCODINGS)
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body with the given content coding, at the
+    compression level configured in the settings.
+
+    Parameters:
+    - content (bytes): The body to compress.
+    - encoding (str): One of the supported content codings.
+
+    Returns:
+    bytes: The compressed body.
+    """
+    match encoding:
+        case "zstd":
+            return zstandard.ZstdCompressor(level=settings.zstd_level).compress(content)
+        case "br":
+            return brotli.compress(content, quality=settings.brotli_level)
+        case "gzip":
+            # A fixed modification time keeps the output deterministic
+            return gzip.compress(content, compresslevel=settings.gzip_level, mtime=0)
+    raise ValueError(f"Unsupported content coding {encoding}")
+
+
+def variant_etag(etag: str, encoding: str | None) -> str:
+    """
+    Derive the entity tag of a compressed variant of a response. Variants are
+    different representations, so each one has its own strong entity tag.
+
+    Parameters:
+    - etag (str): The unquoted entity tag of the uncompressed response.
+    - encoding (str | None): The content coding, or None for the uncompressed response.
+
+    Returns:
+    str: The quoted entity tag of the variant.
+    """
+    if encoding is None:
+        return f'"{etag}"'
+    return f'"{etag}-{encoding}"'
+
+
+class StreamCompressor:
+    """
+    Incrementally compresses a streamed response body. Every chunk is
+    flushed, so that clients can decode the chunks as they arrive.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        match encoding:
+            case "zstd":
+                self.compressor = zstandard.ZstdCompressor(
+                    level=settings.zstd_level
+                ).compressobj()
+            case "br":
+                self.compressor = brotli.Compressor(quality=settings.brotli_level)
+            case "gzip":
+                self.compressor = zlib.compressobj(
+                    settings.gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16
+                )
+            case _:
+                raise ValueError(f"Unsupported content coding {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        match self.encoding:
+            case "zstd":
+                return self.compressor.compress(chunk) + self.compressor.flush(
+                    zstandard.COMPRESSOBJ_FLUSH_BLOCK
+                )
+            case "br":
+                return self.compressor.process(chunk) + self.compressor.flush()
+            case "gzip":
+                return self.compressor.compress(chunk) + self.compressor.flush(
+                    zlib.Z_SYNC_FLUSH
+                )
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class EncodedBody:
+    """
+    The body of a response along with its compressed variants. Each variant
+    is compressed on first use and kept, so that a body which is served
+    repeatedly is compressed at most once per content coding.
+    """
+
+    def __init__(self, content: bytes, media_type: str):
+        self.content = content
+        self.media_type = media_type
+        self.variants: dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(map(len, self.variants.values()))
+
+    def variant(self, encoding: str | None) -> bytes:
+        """
+        Get the body compressed with the given content coding.
+
+        Parameters:
+        - encoding (str | None): The content coding, or None for the uncompressed body.
+
+        Returns:
+        bytes: The encoded body.
+        """
+        if encoding is None:
+            return self.content
+        if encoding not in self.variants:
+            self.variants[encoding] = compress(self.content, encoding)
+        return self.variants[encoding]
+
+    def negotiate(self, accept_encoding: str) -> str | None:
+        """
+        Select the content coding of the body from the `Accept-Encoding`
+        header of a request. Bodies smaller than the configured minimum size
+        are sent uncompressed.
+
+        Parameters:
+        - accept_encoding (str): The value of the `Accept-Encoding` header.
+
+        Returns:
+        str | None: The content coding, or None for the uncompressed body.
+        """
+        if len(self.content) < settings.compression_minimum_size:
+            return None
+        return negotiate_encoding(accept_encoding)
+
+    def response(
+        self,
+        accept_encoding: str,
+        headers: dict[str, str] | None = None,
+        etag: str | None = None,
+    ) -> Response:
+        """
+        Build a response holding the variant of the body negotiated from the
+        `Accept-Encoding` header of the request (see `negotiate`). The variant
+        is compressed here if it was not compressed before.
+
+        Parameters:
+        - accept_encoding (str): The value of the `Accept-Encoding` header.
+        - headers (dict, optional): Additional response headers. Defaults to None.
+        - etag (str, optional): The unquoted entity tag of the body, from which
+        the tag of the variant is derived. Defaults to None.
+
+        Returns:
+        Response: The response.
+        """
+        headers = dict(headers or {})
+        headers["Vary"] = ", ".join(
+            filter(None, [headers.get("Vary"), "Accept-Encoding"])
+        )
+        encoding = self.negotiate(accept_encoding)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if etag is not None:
+            headers["ETag"] = variant_etag(etag, encoding)
+
+        return Response(
+            content=self.variant(encoding),
+            media_type=self.media_type,
+            headers=headers,
+        )
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses that are not already encoded with the content
+    coding negotiated from the `Accept-Encoding` header of the request.
+    Complete bodies are only compressed from the configured minimum size on,
+    while streamed bodies are always compressed chunk by chunk. Compression
+    runs in a worker thread, so that it does not block the event loop.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("Accept-Encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        compressor: StreamCompressor | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                passthrough = "content-encoding" in Headers(raw=message["headers"])
+                if passthrough:
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(raw=start_message["headers"])
+
+            if compressor is None:
+                if not more_body:
+                    # The whole body is known upfront
+                    if len(body) >= settings.compression_minimum_size:
+                        body = await run_sync(compress, body, encoding)
+                        headers["Content-Encoding"] = encoding
+                        headers["Content-Length"] = str(len(body))
+                        headers.add_vary_header("Accept-Encoding")
+                    await send(start_message)
+                    await send({**message, "body": body})
+                    return
+
+                compressor = StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(start_message)
+
+            body = await run_sync(compressor.compress, body)
+            if not more_body:
+                body += compressor.finish()
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
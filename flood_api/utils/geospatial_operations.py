@@ -1,26 +1,29 @@
 from datetime import date
-from decimal import Decimal, getcontext
-from math import floor
+from typing import Iterator
 
 import geopandas as gpd
+import numpy as np
+import shapely
 from shapely.geometry import Polygon
 
-# Set the precision high enough to handle the arithmetic correctly
-# API users should not need more than 9 decimal places of precision
-getcontext().prec = 9
-
 from flood_api.settings import settings
+from flood_api.utils.grid_index import (
+    FIXED_POINT_PRECISION,
+    GridIndex,
+    snap_to_grid,
+    to_fixed_point,
+)
 
 GLOFAS_RESOLUTION = settings.glofas_resolution
 GLOFAS_PRECISION = settings.glofas_precision
 
 
 def get_grid_cell_bounds(
-    latitude: float,
-    longitude: float,
+    latitude: float | np.ndarray,
+    longitude: float | np.ndarray,
     grid_size: float = GLOFAS_RESOLUTION,
     precision: int = GLOFAS_PRECISION,
-) -> tuple[float, float, float, float]:
+) -> tuple[float, float, float, float] | tuple[np.ndarray, ...]:
     """
     Given a latitude and longitude, find the bounding box of the grid cell
     it falls into.
@@ -35,36 +38,65 @@ def get_grid_cell_bounds(
       * An input latitude of -5.81 and longitude of 37.7501 would result in a
         bounding box from latitude -5.85 to -5.8 and longitude 37.75 to 37.8.
 
+    The arithmetic is done exactly on integers in units of 1e-9 degrees,
+    and both scalars and arrays of coordinates are accepted.
+
     Parameters:
-    - latitude (float): The latitude of the point.
-    - longitude (float): The longitude of the point.
+    - latitude (float | ndarray): The latitude of the point(s).
+    - longitude (float | ndarray): The longitude of the point(s).
     - grid_size (float, optional): The size of each grid cell. Defaults to 0.05.
     - precision (int, optional): Number of decimal places to round to. Defaults to 3.
 
     Returns:
     tuple: Bounding box of the grid cell as (min_latitude, max_latitude, min_longitude, max_longitude).
+    Each element is an array if arrays of coordinates were given.
+    """
+    # Calculate lower boundaries in fixed-point units
+    grid_units = to_fixed_point(grid_size)
+    min_lat_cell = snap_to_grid(latitude, grid_size) * grid_units
+    min_lon_cell = snap_to_grid(longitude, grid_size) * grid_units
+
+    # Calculate the upper boundaries and convert back to degrees
+    scale = 10**FIXED_POINT_PRECISION
+    bounds = tuple(
+        np.round(cell_bound / scale, precision)
+        for cell_bound in (
+            min_lat_cell,
+            min_lat_cell + grid_units,
+            min_lon_cell,
+            min_lon_cell + grid_units,
+        )
+    )
+
+    if np.ndim(latitude) == 0 and np.ndim(longitude) == 0:
+        return tuple(float(cell_bound) for cell_bound in bounds)
+    return bounds
+
+
+def create_cell_polygons(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """
+    Build the polygons of the grid cells holding the given points in one
+    vectorized call. Each polygon is only built once per distinct cell and
+    shared by all points in that cell, such as the steps of a forecast.
+
+    Parameters:
+    - latitude (ndarray): The latitudes of the points.
+    - longitude (ndarray): The longitudes of the points.
+
+    Returns:
+    ndarray: The polygon of the cell of every point, as clockwise rings
+    starting at the lower left corner.
     """
-    # Convert to Decimal for precise arithmetic
-    # Without this, the results can be incorrect
-    latitude = Decimal(str(latitude))
-    longitude = Decimal(str(longitude))
-    grid_size = Decimal(str(grid_size))
-
-    # Calculate lower boundaries using precise decimal division and multiplication
-    min_lon_cell = floor(longitude / grid_size) * grid_size
-    min_lat_cell = floor(latitude / grid_size) * grid_size
-
-    # Calculate the upper boundaries
-    max_lon_cell = min_lon_cell + grid_size
-    max_lat_cell = min_lat_cell + grid_size
-
-    # Round the results
-    return (
-        float(round(min_lat_cell, precision)),
-        float(round(max_lat_cell, precision)),
-        float(round(min_lon_cell, precision)),
-        float(round(max_lon_cell, precision)),
+    cell_keys = (snap_to_grid(latitude).astype(np.int64) << 32) + snap_to_grid(
+        longitude
     )
+    _, first, inverse = np.unique(cell_keys, return_index=True, return_inverse=True)
+
+    min_lat, max_lat, min_lon, max_lon = get_grid_cell_bounds(
+        np.asarray(latitude)[first], np.asarray(longitude)[first]
+    )
+    polygons = shapely.box(min_lon, min_lat, max_lon, max_lat, ccw=False)
+    return polygons[inverse.reshape(-1)]
 
 
 def create_polygon_from_bounds(
@@ -106,61 +138,46 @@ def create_polygon_from_bounds(
     return Polygon([bottom_left, top_left, top_right, bottom_right, bottom_left])
 
 
-def get_data_for_roi(
-    roi: Polygon,
+def filter_positions_by_date(
+    positions: np.ndarray,
     gdf: gpd.GeoDataFrame,
     date_range: tuple[date, date] | None = None,
-    expanded_roi: Polygon | None = None,
-) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    step_window: tuple[int, int] | None = None,
+) -> np.ndarray:
     """
-    Given a region of interest, return the data for the grid cells
-    that it overlaps with. Optionally, include the data for neighboring cells
-    by providing an expanded region of interest. A date range can also be provided
-    to filter the data, yielding only the data within the date range (inclusive).
-    If no date range is provided, data for all dates will be returned.
+    Given the positions of some rows in a GeoDataFrame, return the positions
+    of the rows that are valid within the date range (inclusive). Only the
+    given rows are compared, so the cost does not depend on the size of
+    the GeoDataFrame. If the date range has been translated into a window
+    of steps, the integer steps are compared instead of the dates.
+    If no date range is provided, the positions are returned unchanged.
 
     Parameters:
-    - roi (Polygon): The region of interest.
-    - gdf (GeoDataFrame): The GeoDataFrame to query.
-    - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
-    - expanded_roi (Polygon, optional): The expanded region of interest. Used to get neighboring cells. Defaults to None.
+    - positions (ndarray): The positions of the rows to filter.
+    - gdf (GeoDataFrame): The GeoDataFrame the positions refer to.
+    - date_range (tuple, optional): The date range to filter by (inclusive). Defaults to None.
+    - step_window (tuple, optional): The equivalent steps (inclusive). Defaults to None.
 
     Returns:
-    tuple: The primary cells and neighbors as GeoDataFrames.
+    ndarray: The positions of the rows within the date range.
     """
+    if date_range is None:
+        return positions
 
-    neighbors_only_df = None
-
-    if date_range is not None:
-        # Filter the dataframe for the date range
-        gdf = gdf[gdf["valid_for"].between(*date_range)]
-
-    if expanded_roi is not None:
-        # Query the dataframe for possible matches
-        # using the expanded roi to get the primary
-        # cells and neighbors
-        possible_matches_index = gdf.sindex.query(expanded_roi, predicate="intersects")
-        all_cells_df = gdf.iloc[possible_matches_index]
-
-        # Define mask for distinguishing between primary cells and neighbors
-        primary_cells_mask = all_cells_df["geometry"].intersects(roi)
-
-        # Define primary cells and neighbors dataframes
-        primary_cells_df = all_cells_df[primary_cells_mask]
-        neighbors_only_df = all_cells_df[~primary_cells_mask]
-    else:
-        # Query the main dataframe for possible matches
-        # using the roi to get only the primary cells
-        possible_matches_index = gdf.sindex.query(roi, predicate="intersects")
-        primary_cells_df = gdf.iloc[possible_matches_index]
+    if step_window is not None:
+        first_step, last_step = step_window
+        steps = gdf["step"].to_numpy()[positions]
+        return positions[(first_step <= steps) & (steps <= last_step)]
 
-    return primary_cells_df, neighbors_only_df
+    valid_for = gdf["valid_for"].to_numpy()[positions].astype("datetime64[D]")
+    start_date, end_date = (np.datetime64(day, "D") for day in date_range)
+    return positions[(start_date <= valid_for) & (valid_for <= end_date)]
 
 
 def get_data_for_point(
     latitude: float,
     longitude: float,
-    gdf: gpd.GeoDataFrame,
+    index: GridIndex,
     include_neighbors: bool = False,
     date_range: tuple[date, date] | None = None,
 ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
@@ -181,48 +198,126 @@ def get_data_for_point(
         * An input latitude of -5.81 and longitude of 37.7501 would result in a
             bounding box from latitude -5.85 to -5.8 and longitude 37.75 to 37.8.
 
+    The cell and its neighbors are looked up in the grid index, so no
+    geometric operations are performed.
+
     Parameters:
     - latitude (float): The latitude of the point.
     - longitude (float): The longitude of the point.
-    - gdf (GeoDataFrame): The GeoDataFrame to query.
+    - index (GridIndex): The grid indexed data to query.
     - include_neighbors (bool): Whether to include neighboring cells. Defaults to False.
     - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
 
     Returns:
     tuple: The primary cell and neighbors as GeoDataFrames.
     """
-    # Get the bounds for the queryed cell
-    cell_bounds = get_grid_cell_bounds(
-        latitude=latitude,
-        longitude=longitude,
-        grid_size=GLOFAS_RESOLUTION,
-        precision=GLOFAS_PRECISION,
+    # Get the grid cell of the queried point
+    row, col = index.cell_index(latitude=latitude, longitude=longitude)
+
+    return get_data_for_cell(
+        row=row,
+        col=col,
+        index=index,
+        include_neighbors=include_neighbors,
+        date_range=date_range,
     )
 
-    # Get the deflated geometry to find primary cell
-    reduced_geometry = create_polygon_from_bounds(
-        *cell_bounds, buffer=-GLOFAS_RESOLUTION / 2, precision=GLOFAS_PRECISION
-    )
 
-    # Get the inflated geometry to find primary cell and neighbors
+def get_data_for_points(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    index: GridIndex,
+    include_neighbors: bool = False,
+    date_range: tuple[date, date] | None = None,
+) -> tuple[np.ndarray, list[tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]]]:
+    """
+    Given arrays of latitudes and longitudes, return the data for the grid
+    cells the points fall into, following the same rules as
+    `get_data_for_point`. All points are snapped to the grid in one pass,
+    and the data are looked up once per distinct cell.
+
+    Parameters:
+    - latitudes (ndarray): The latitudes of the points.
+    - longitudes (ndarray): The longitudes of the points.
+    - index (GridIndex): The grid indexed data to query.
+    - include_neighbors (bool): Whether to include neighboring cells. Defaults to False.
+    - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
+
+    Returns:
+    tuple: The position of each point's cell in the list of distinct cells,
+    and the primary cell and neighbors of every distinct cell as GeoDataFrames.
+    """
+    rows, cols = index.cell_index(latitude=latitudes, longitude=longitudes)
+
+    keys = rows * index.n_cols + cols
+    unique_keys, cell_of_point = np.unique(keys, return_inverse=True)
+
+    cells_data = [
+        get_data_for_cell(
+            row=key // index.n_cols,
+            col=key % index.n_cols,
+            index=index,
+            include_neighbors=include_neighbors,
+            date_range=date_range,
+        )
+        for key in unique_keys
+    ]
+
+    return cell_of_point, cells_data
+
+
+def get_data_for_cell(
+    row: int,
+    col: int,
+    index: GridIndex,
+    include_neighbors: bool = False,
+    date_range: tuple[date, date] | None = None,
+) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    """
+    Given the row and column of a grid cell, return the data for the cell
+    and, optionally, for its neighboring cells. A date range can also be
+    provided to filter the data (inclusive).
+
+    Parameters:
+    - row (int): The row (latitude index) of the cell.
+    - col (int): The column (longitude index) of the cell.
+    - index (GridIndex): The grid indexed data to query.
+    - include_neighbors (bool): Whether to include neighboring cells. Defaults to False.
+    - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
+
+    Returns:
+    tuple: The primary cell and neighbors as GeoDataFrames.
+    """
+    step_window = index.step_window(date_range) if date_range else None
+
+    if step_window is not None:
+        # The steps of a cell are ordered, so the
+        # date range is a sub-slice of the cell
+        primary_cell_rows = index.cell_step_slice(row, col, *step_window)
+    else:
+        primary_cell_rows = index.cell_slice(row, col)
+        if date_range is not None:
+            primary_cell_rows = filter_positions_by_date(
+                np.arange(primary_cell_rows.start, primary_cell_rows.stop),
+                index.gdf,
+                date_range,
+            )
+    primary_cell_df = index.gdf.iloc[primary_cell_rows]
+
     if include_neighbors:
-        expanded_geometry = create_polygon_from_bounds(
-            *cell_bounds, buffer=GLOFAS_RESOLUTION / 2, precision=GLOFAS_PRECISION
+        neighbors_positions = filter_positions_by_date(
+            index.neighbor_positions(row, col), index.gdf, date_range, step_window
         )
+        neighbors_df = index.gdf.iloc[neighbors_positions]
     else:
-        expanded_geometry = None
+        neighbors_df = None
 
-    return get_data_for_roi(
-        roi=reduced_geometry,
-        gdf=gdf,
-        date_range=date_range,
-        expanded_roi=expanded_geometry,
-    )
+    return primary_cell_df, neighbors_df
 
 
 def get_data_for_bbox(
     bbox: tuple[float, float, float, float],
-    gdf: gpd.GeoDataFrame,
+    index: GridIndex,
     date_range: tuple[date, date] | None = None,
 ) -> gpd.GeoDataFrame:
     """
@@ -232,20 +327,62 @@ def get_data_for_bbox(
     range (inclusive). If no date range is provided, data for
     all dates will be returned.
 
+    Cells that touch the bounding box are included. The cells are
+    looked up in the grid index, so no geometric operations are
+    performed, and the data are ordered by cell and step.
+
     Parameters:
     - bbox (tuple[float, float, float, float]): The bounding box to query with
     the following elements: `(min_lat, max_lat, min_lon, max_lon)`.
-    - gdf (GeoDataFrame): The GeoDataFrame to query.
+    - index (GridIndex): The grid indexed data to query.
     - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
 
     Returns:
     GeoDataFrame: The queried data as a GeoDataFrame.
     """
-    # Get the deflated geometry to find primary cells
-    reduced_bbox = create_polygon_from_bounds(*bbox, buffer=0, precision=9)
-
-    primary_cells_df, _ = get_data_for_roi(
-        roi=reduced_bbox, gdf=gdf, date_range=date_range
+    # The cells intersecting the bounding box are one range
+    # of rows per grid row in the cell-sorted data
+    positions = filter_positions_by_date(
+        index.bbox_positions(*bbox),
+        index.gdf,
+        date_range,
+        index.step_window(date_range) if date_range else None,
     )
 
-    return primary_cells_df
+    return index.gdf.iloc[positions]
+
+
+def iter_bbox_positions(
+    bbox: tuple[float, float, float, float],
+    index: GridIndex,
+    date_range: tuple[date, date] | None = None,
+    chunk_size: int = 10_000,
+) -> Iterator[np.ndarray]:
+    """
+    Given a bounding box, yield the positions in `index.gdf` of the data
+    for the grid cells that fall into it, as selected by `get_data_for_bbox`,
+    in chunks of at most `chunk_size` rows. The chunks are produced lazily
+    in cell order, so the memory used does not grow with the bounding box.
+
+    Parameters:
+    - bbox (tuple[float, float, float, float]): The bounding box to query with
+    the following elements: `(min_lat, max_lat, min_lon, max_lon)`.
+    - index (GridIndex): The grid indexed data to query.
+    - date_range (tuple, optional): The date range to query (inclusive). Defaults to None.
+    - chunk_size (int, optional): The maximum number of rows per chunk. Defaults to 10000.
+
+    Returns:
+    Iterator: The positions of the queried rows, chunk by chunk.
+    """
+    step_window = index.step_window(date_range) if date_range else None
+
+    for start, stop in index.bbox_ranges(*bbox):
+        for chunk_start in range(start, stop, chunk_size):
+            positions = filter_positions_by_date(
+                np.arange(chunk_start, min(chunk_start + chunk_size, stop)),
+                index.gdf,
+                date_range,
+                step_window,
+            )
+            if len(positions):
+                yield positions
@@ -0,0 +1,441 @@
+import hashlib
+import logging
+from datetime import date
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from flood_api.settings import settings
+
+logger = logging.getLogger(__name__)
+
+GLOFAS_ROI = settings.glofas_roi
+GLOFAS_RESOLUTION = settings.glofas_resolution
+
+# Coordinates are snapped to the grid in fixed-point arithmetic with
+# units of 1e-9 degrees. API users should not need more than 9 decimal
+# places of precision.
+FIXED_POINT_PRECISION = 9
+
+# Columns that do not hold data values: the geometry is derived from the
+# cell center, and the part records the file a row was read from
+METADATA_COLUMNS = ["geometry", "part"]
+
+
+def to_fixed_point(
+    value: float | np.ndarray, precision: int = FIXED_POINT_PRECISION
+) -> np.int64 | np.ndarray:
+    """
+    Convert coordinates to an integer number of `10**-precision` degrees.
+
+    Parameters:
+    - value (float | ndarray): The coordinates in degrees.
+    - precision (int, optional): Number of decimal places to keep. Defaults to 9.
+
+    Returns:
+    int64 | ndarray: The coordinates in fixed-point units.
+    """
+    return np.rint(np.multiply(value, 10**precision)).astype(np.int64)
+
+
+def snap_to_grid(
+    value: float | np.ndarray, grid_size: float = GLOFAS_RESOLUTION
+) -> np.int64 | np.ndarray:
+    """
+    Return the number of the grid cell each coordinate falls into, counted
+    from zero. A coordinate on the boundary between two cells belongs to
+    the cell above it, i.e. the result is `floor(value / grid_size)`
+    computed exactly in fixed-point arithmetic.
+
+    Parameters:
+    - value (float | ndarray): The coordinates in degrees.
+    - grid_size (float, optional): The size of each grid cell. Defaults to 0.05.
+
+    Returns:
+    int64 | ndarray: The cell numbers.
+    """
+    return to_fixed_point(value) // to_fixed_point(grid_size)
+
+
+class GridIndex:
+    """
+    A dataset sorted by grid cell together with a lookup table from
+    grid cells to the rows that belong to them.
+
+    The GloFAS cells form a regular grid of `grid_size` degrees anchored
+    at the lower left corner of the region of interest (ROI). Each cell is
+    identified by its row (latitude index) and column (longitude index) in
+    that grid, and the cell key `row * n_cols + col` orders the cells from
+    south to north and, within a row, from west to east. The rows of the
+    dataset are sorted by cell key (and by `step`, if present) so that the
+    data for a cell is a contiguous slice, and `offsets` holds the start of
+    every such slice (with `offsets[key + 1]` being its end). A cell lookup
+    is therefore two array reads, and a band of adjacent cells in one grid
+    row is a single range of rows, so neither touches the geometries.
+
+    For forecasts from a single issue, `valid_for = issued_on + step - 1`,
+    so a date range is equivalent to a window of steps. Since the rows of
+    each cell are ordered by step, that window is a sub-slice of the cell.
+
+    Attributes:
+    - gdf (GeoDataFrame): The data sorted by cell key and step.
+    - n_rows (int): The number of grid rows (latitude cells) in the ROI.
+    - n_cols (int): The number of grid columns (longitude cells) in the ROI.
+    - offsets (ndarray): Start row of every cell, of length `n_rows * n_cols + 1`.
+    - steps (ndarray | None): The step of every row as int32, if present.
+    - issued_on (date | None): The issue date shared by all rows, if any.
+    - fragments (FeatureFragments | None): The pre-rendered GeoJSON features
+      of the rows of `gdf`, if set by the loader.
+    - content_hash (str): A hash of the values of `gdf`, which identifies the
+      data independently of when and where it was loaded.
+    - parts (dict): The metadata of the files the data was read from, keyed
+      by path, if set by the loader. The loader records the file of every
+      row in a `part` column of `gdf`.
+    - generation (int): The generation of the loaded data the index was built
+      from, set by the loader. Cached responses are keyed on it.
+    """
+
+    def __init__(
+        self,
+        gdf: gpd.GeoDataFrame,
+        roi: dict = GLOFAS_ROI,
+        grid_size: float = GLOFAS_RESOLUTION,
+    ):
+        self.set_grid(roi, grid_size)
+
+        rows, cols = self.cell_indices_from_centers(
+            gdf["latitude"].to_numpy(), gdf["longitude"].to_numpy()
+        )
+
+        # Cells outside the ROI can never be queried
+        within_roi = (
+            (0 <= rows) & (rows < self.n_rows) & (0 <= cols) & (cols < self.n_cols)
+        )
+        if not within_roi.all():
+            logger.warning(
+                "Dropping %d rows outside the region of interest", (~within_roi).sum()
+            )
+            gdf, rows, cols = gdf[within_roi], rows[within_roi], cols[within_roi]
+
+        keys = rows * self.n_cols + cols
+        if "step" in gdf.columns:
+            order = np.lexsort((gdf["step"].to_numpy(), keys))
+        else:
+            order = np.argsort(keys, kind="stable")
+
+        gdf = gdf.iloc[order].reset_index(drop=True)
+        offsets = np.searchsorted(keys[order], np.arange(self.n_rows * self.n_cols + 1))
+
+        hasher = hashlib.blake2b(digest_size=16)
+        for col in gdf.columns.drop(METADATA_COLUMNS, errors="ignore"):
+            hasher.update(col.encode())
+            hasher.update(pd.util.hash_array(gdf[col].to_numpy()).tobytes())
+
+        self.set_sorted_data(gdf, offsets, hasher.hexdigest())
+
+    @classmethod
+    def from_sorted(
+        cls,
+        gdf: gpd.GeoDataFrame,
+        offsets: np.ndarray,
+        content_hash: str,
+        roi: dict = GLOFAS_ROI,
+        grid_size: float = GLOFAS_RESOLUTION,
+    ) -> "GridIndex":
+        """
+        Restore an index from the `gdf`, `offsets` and `content_hash` of an
+        index with the same grid, e.g. as saved in a snapshot, without
+        sorting or hashing the data again.
+
+        Parameters:
+        - gdf (GeoDataFrame): The data sorted by cell key and step.
+        - offsets (ndarray): Start row of every cell.
+        - content_hash (str): The hash of the values of `gdf`.
+        - roi (dict, optional): The region of interest of the grid. Defaults to the GloFAS ROI.
+        - grid_size (float, optional): The size of each grid cell. Defaults to 0.05.
+
+        Returns:
+        GridIndex: The restored index.
+        """
+        index = cls.__new__(cls)
+        index.set_grid(roi, grid_size)
+        if len(offsets) != index.n_rows * index.n_cols + 1 or offsets[-1] != len(gdf):
+            raise ValueError("The offsets do not match the grid and the data")
+        index.set_sorted_data(gdf, offsets, content_hash)
+        return index
+
+    def set_grid(self, roi: dict, grid_size: float):
+        self.roi = roi
+        self.grid_size = grid_size
+        self.n_rows = round((roi["max_lat"] - roi["min_lat"]) / grid_size)
+        self.n_cols = round((roi["max_lon"] - roi["min_lon"]) / grid_size)
+
+    def set_sorted_data(
+        self, gdf: gpd.GeoDataFrame, offsets: np.ndarray, content_hash: str
+    ):
+        self.gdf = gdf
+        self.offsets = offsets
+        self.content_hash = content_hash
+
+        self.steps = None
+        if "step" in self.gdf.columns:
+            self.steps = self.gdf["step"].to_numpy(dtype=np.int32)
+
+        self.issued_on = None
+        if "issued_on" in self.gdf.columns:
+            issue_dates = self.gdf["issued_on"].unique()
+            if len(issue_dates) == 1:
+                self.issued_on = pd.Timestamp(issue_dates[0]).date()
+
+        self.fragments = None
+        self.generation = 0
+        self.parts = {}
+
+    def cell_indices_from_centers(
+        self, latitude: np.ndarray, longitude: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Given the latitudes and longitudes of cell centers, return the row
+        and column of each cell in the grid.
+
+        Parameters:
+        - latitude (ndarray): The latitudes of the cell centers.
+        - longitude (ndarray): The longitudes of the cell centers.
+
+        Returns:
+        tuple: The rows and columns of the cells as integer arrays.
+        """
+        rows = np.floor((latitude - self.roi["min_lat"]) / self.grid_size)
+        cols = np.floor((longitude - self.roi["min_lon"]) / self.grid_size)
+        return rows.astype(np.int64), cols.astype(np.int64)
+
+    def cell_index(
+        self, latitude: float | np.ndarray, longitude: float | np.ndarray
+    ) -> tuple[np.int64 | np.ndarray, np.int64 | np.ndarray]:
+        """
+        Given the latitudes and longitudes of points, return the row and
+        column of the cell each point falls into. Points on the boundary
+        between two cells are assigned to the cell to their east or north,
+        as in `get_grid_cell_bounds`.
+
+        Parameters:
+        - latitude (float | ndarray): The latitudes of the points.
+        - longitude (float | ndarray): The longitudes of the points.
+
+        Returns:
+        tuple: The rows and columns of the cells.
+        """
+        row = snap_to_grid(latitude, self.grid_size) - snap_to_grid(
+            self.roi["min_lat"], self.grid_size
+        )
+        col = snap_to_grid(longitude, self.grid_size) - snap_to_grid(
+            self.roi["min_lon"], self.grid_size
+        )
+        return row, col
+
+    def cell_slice(self, row: int, col: int) -> slice:
+        """
+        Return the slice of rows holding the data for the given cell.
+        Cells outside the grid yield an empty slice.
+
+        Parameters:
+        - row (int): The row (latitude index) of the cell.
+        - col (int): The column (longitude index) of the cell.
+
+        Returns:
+        slice: The rows of the cell in `gdf`.
+        """
+        if not (0 <= row < self.n_rows and 0 <= col < self.n_cols):
+            return slice(0, 0)
+        key = row * self.n_cols + col
+        return slice(self.offsets[key], self.offsets[key + 1])
+
+    def step_window(self, date_range: tuple[date, date]) -> tuple[int, int] | None:
+        """
+        Translate a range of `valid_for` dates (inclusive) into the
+        equivalent range of steps (inclusive). This is only possible if
+        all rows share the same issue date, otherwise None is returned.
+
+        Parameters:
+        - date_range (tuple): The date range (inclusive).
+
+        Returns:
+        tuple | None: The first and last step of the window.
+        """
+        if self.steps is None or self.issued_on is None:
+            return None
+        start_date, end_date = date_range
+        return (
+            (start_date - self.issued_on).days + 1,
+            (end_date - self.issued_on).days + 1,
+        )
+
+    def cell_step_slice(
+        self, row: int, col: int, first_step: int, last_step: int
+    ) -> slice:
+        """
+        Return the slice of rows holding the data for the given cell
+        and steps between `first_step` and `last_step` (inclusive).
+
+        Parameters:
+        - row (int): The row (latitude index) of the cell.
+        - col (int): The column (longitude index) of the cell.
+        - first_step (int): The first step of the window.
+        - last_step (int): The last step of the window.
+
+        Returns:
+        slice: The rows of the cell and steps in `gdf`.
+        """
+        cell = self.cell_slice(row, col)
+        cell_steps = self.steps[cell.start : cell.stop]
+        start = cell.start + np.searchsorted(cell_steps, first_step, side="left")
+        stop = cell.start + np.searchsorted(cell_steps, last_step, side="right")
+        return slice(start, max(start, stop))
+
+    def band_range(self, row: int, first_col: int, last_col: int) -> tuple[int, int]:
+        """
+        Return the range of rows holding the data for the cells of one
+        grid row between two columns (inclusive). The columns are clipped
+        to the grid.
+
+        Parameters:
+        - row (int): The row (latitude index) of the cells.
+        - first_col (int): The first column (longitude index) of the band.
+        - last_col (int): The last column (longitude index) of the band.
+
+        Returns:
+        tuple: The start and stop of the rows of the band in `gdf`.
+        """
+        first_col, last_col = max(first_col, 0), min(last_col, self.n_cols - 1)
+        if not (0 <= row < self.n_rows) or first_col > last_col:
+            return 0, 0
+        row_key = row * self.n_cols
+        return self.offsets[row_key + first_col], self.offsets[row_key + last_col + 1]
+
+    def neighbor_positions(self, row: int, col: int) -> np.ndarray:
+        """
+        Return the positions of the rows holding the data for the (up to)
+        eight cells surrounding the given cell, ordered by cell key.
+
+        Parameters:
+        - row (int): The row (latitude index) of the cell.
+        - col (int): The column (longitude index) of the cell.
+
+        Returns:
+        ndarray: The positions of the neighboring rows in `gdf`.
+        """
+        ranges = []
+        for neighbor_row in range(max(row - 1, 0), min(row + 2, self.n_rows)):
+            if neighbor_row == row:
+                column_bands = [(col - 1, col - 1), (col + 1, col + 1)]
+            else:
+                column_bands = [(col - 1, col + 1)]
+
+            ranges += [
+                self.band_range(neighbor_row, first_col, last_col)
+                for first_col, last_col in column_bands
+            ]
+
+        return ranges_to_positions(ranges)
+
+    def bbox_cells(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> tuple[int, int, int, int]:
+        """
+        Return the first and last row and column (inclusive) of the cells
+        that intersect the given bounding box, clipped to the grid. Cells
+        that only touch the bounding box are included. If no cell of the
+        grid intersects the bounding box, the last row or column is before
+        the first.
+
+        Parameters:
+        - min_lat (float): The minimum latitude of the bounding box.
+        - max_lat (float): The maximum latitude of the bounding box.
+        - min_lon (float): The minimum longitude of the bounding box.
+        - max_lon (float): The maximum longitude of the bounding box.
+
+        Returns:
+        tuple: The `(first_row, last_row, first_col, last_col)` of the cells.
+        """
+        grid_size = to_fixed_point(self.grid_size)
+        origin_lat = to_fixed_point(self.roi["min_lat"])
+        origin_lon = to_fixed_point(self.roi["min_lon"])
+
+        # A cell intersects the bounding box if its upper bound is at or
+        # above the lower bound of the box, and its lower bound is at or
+        # below the upper bound of the box
+        first_row = -((origin_lat - to_fixed_point(min_lat)) // grid_size) - 1
+        last_row = (to_fixed_point(max_lat) - origin_lat) // grid_size
+        first_col = -((origin_lon - to_fixed_point(min_lon)) // grid_size) - 1
+        last_col = (to_fixed_point(max_lon) - origin_lon) // grid_size
+
+        return (
+            int(max(first_row, 0)),
+            int(min(last_row, self.n_rows - 1)),
+            int(max(first_col, 0)),
+            int(min(last_col, self.n_cols - 1)),
+        )
+
+    def bbox_ranges(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> list[tuple[int, int]]:
+        """
+        Return the ranges of rows holding the data for the cells that
+        intersect the given bounding box (see `bbox_cells`), ordered by
+        cell key.
+
+        The bounding box covers a rectangle of grid rows and columns, so
+        the result is one contiguous range of rows per grid row.
+
+        Parameters:
+        - min_lat (float): The minimum latitude of the bounding box.
+        - max_lat (float): The maximum latitude of the bounding box.
+        - min_lon (float): The minimum longitude of the bounding box.
+        - max_lon (float): The maximum longitude of the bounding box.
+
+        Returns:
+        list: The `(start, stop)` ranges of the rows in `gdf`.
+        """
+        first_row, last_row, first_col, last_col = self.bbox_cells(
+            min_lat, max_lat, min_lon, max_lon
+        )
+        return [
+            self.band_range(row, first_col, last_col)
+            for row in range(first_row, last_row + 1)
+        ]
+
+    def bbox_positions(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> np.ndarray:
+        """
+        Return the positions of the rows holding the data for the cells
+        that intersect the given bounding box, ordered by cell key.
+        See `bbox_ranges`.
+
+        Parameters:
+        - min_lat (float): The minimum latitude of the bounding box.
+        - max_lat (float): The maximum latitude of the bounding box.
+        - min_lon (float): The minimum longitude of the bounding box.
+        - max_lon (float): The maximum longitude of the bounding box.
+
+        Returns:
+        ndarray: The positions of the rows in `gdf`.
+        """
+        return ranges_to_positions(self.bbox_ranges(min_lat, max_lat, min_lon, max_lon))
+
+
+def ranges_to_positions(ranges: list[tuple[int, int]]) -> np.ndarray:
+    """
+    Concatenate ranges of row positions into a single array.
+
+    Parameters:
+    - ranges (list): The `(start, stop)` ranges.
+
+    Returns:
+    ndarray: The positions covered by the ranges, in order.
+    """
+    return np.concatenate(
+        [np.arange(start, stop, dtype=np.int64) for start, stop in ranges]
+        or [np.empty(0, dtype=np.int64)]
+    )
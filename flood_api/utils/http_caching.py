@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime, timezone
+
+from croniter import croniter
+
+from flood_api.settings import settings
+from flood_api.utils.compression import negotiate_encoding, variant_etag
+
+
+def entity_tag(*parts) -> str:
+    """
+    Derive an entity tag from the values that determine a response.
+
+    Parameters:
+    - parts: Values with a stable `repr`, such as the version of the data
+    and the canonical query.
+
+    Returns:
+    str: The unquoted entity tag.
+    """
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def matching_etag(if_none_match: str, etag: str, accept_encoding: str) -> str | None:
+    """
+    Check the `If-None-Match` header of a request against the entity tag of
+    the response, without computing the response. The tags of the uncompressed
+    variant and of the variant negotiated from `Accept-Encoding` both match,
+    as the variant that is sent depends on the size of the body.
+
+    Parameters:
+    - if_none_match (str): The value of the `If-None-Match` header.
+    - etag (str): The unquoted entity tag of the response.
+    - accept_encoding (str): The value of the `Accept-Encoding` header.
+
+    Returns:
+    str | None: The matching quoted entity tag, or None if the response was modified.
+    """
+    variants = {
+        variant_etag(etag, None),
+        variant_etag(etag, negotiate_encoding(accept_encoding)),
+    }
+    for tag in if_none_match.split(","):
+        # If-None-Match uses the weak comparison
+        tag = tag.strip().removeprefix("W/")
+        if tag == "*":
+            return variant_etag(etag, negotiate_encoding(accept_encoding))
+        if tag in variants:
+            return tag
+    return None
+
+
+def seconds_until_next_reload(now: datetime | None = None) -> int:
+    """
+    Compute how long responses stay fresh, i.e. the time until the next
+    scheduled reload of the data.
+
+    Parameters:
+    - now (datetime, optional): The current time. Defaults to now in UTC.
+
+    Returns:
+    int: The number of seconds until the next reload.
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    next_reload = croniter(settings.data_reload_cron, now).get_next(datetime)
+    return max(int((next_reload - now).total_seconds()), 0)
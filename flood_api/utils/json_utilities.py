@@ -1,54 +1,431 @@
 import json
-from datetime import date
 
 import geopandas as gpd
+import numpy as np
+import orjson
 import pandas as pd
 
+from flood_api.models.shared_types import GeometryMode
+from flood_api.utils.geospatial_operations import get_grid_cell_bounds
 
-def custom_date_handler(obj: object) -> str:
+EMPTY_FEATURE_COLLECTION = b'{"type":"FeatureCollection","features":[]}'
+
+# The cell polygons are written as a clockwise ring starting at the lower
+# left corner, as in the source data
+POLYGON_TEMPLATE = (
+    '{"type":"Polygon","coordinates":[[[%s,%s],[%s,%s],[%s,%s],[%s,%s],[%s,%s]]]}'
+)
+POINT_TEMPLATE = '{"type":"Point","coordinates":[%s,%s]}'
+
+
+def encode_column(values: pd.Series) -> list[str]:
+    """
+    Encode a column as a list of JSON values, one per row. Dates are
+    formatted as ISO dates and non-finite numbers are encoded as null.
+
+    Parameters:
+    - values (Series): The column to encode.
+
+    Returns:
+    list: The JSON encoded values.
+    """
+    array = values.to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(array.dtype):
+        days = np.datetime_as_string(array.astype("datetime64[D]"))
+        return [f'"{day}"' for day in days.tolist()]
+
+    if pd.api.types.is_bool_dtype(array.dtype):
+        return ["true" if value else "false" for value in array.tolist()]
+
+    if pd.api.types.is_integer_dtype(array.dtype):
+        return list(map(str, array.tolist()))
+
+    if pd.api.types.is_float_dtype(array.dtype):
+        encoded = list(map(float.__repr__, array.tolist()))
+        for position in np.flatnonzero(~np.isfinite(array)).tolist():
+            encoded[position] = "null"
+        return encoded
+
+    return list(map(json.dumps, array.tolist()))
+
+
+def column_values(values: pd.Series) -> np.ndarray | list:
+    """
+    Convert a column to values that orjson can serialize as a JSON array,
+    following the same rules as `encode_column`. Numeric and boolean
+    columns are returned as contiguous arrays, which orjson serializes
+    without converting them to Python objects, and encodes non-finite
+    numbers as null.
+
+    Parameters:
+    - values (Series): The column to convert.
+
+    Returns:
+    ndarray | list: The values.
+    """
+    array = values.to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(array.dtype):
+        return np.datetime_as_string(array.astype("datetime64[D]")).tolist()
+
+    if pd.api.types.is_bool_dtype(array.dtype) or pd.api.types.is_numeric_dtype(
+        array.dtype
+    ):
+        return np.ascontiguousarray(array)
+
+    return array.tolist()
+
+
+def encode_coordinates(coordinates: np.ndarray) -> np.ndarray:
+    """
+    Encode an array of coordinates as JSON numbers. Grid coordinates take
+    few distinct values, so each distinct value is only formatted once.
+
+    Parameters:
+    - coordinates (ndarray): The coordinates to encode.
+
+    Returns:
+    ndarray: The encoded coordinates, as strings of the same shape.
+    """
+    values, inverse = np.unique(coordinates, return_inverse=True)
+    encoded = np.array(list(map(float.__repr__, values.tolist())), dtype=object)
+    return encoded[inverse.reshape(coordinates.shape)]
+
+
+def encode_geometries(
+    df: gpd.GeoDataFrame, geometry: GeometryMode = GeometryMode.POLYGON
+) -> list[str]:
+    """
+    Encode the geometry of each row of a GeoDataFrame of grid cells as
+    GeoJSON. The geometries are computed from the cell centers in the
+    `latitude` and `longitude` columns rather than from the stored shapes:
+    either the polygon of the cell, its center point, or null.
+
+    Parameters:
+    - df (GeoDataFrame): The GeoDataFrame to encode.
+    - geometry (GeometryMode, optional): The geometry to write. Defaults to polygon.
+
+    Returns:
+    list: The encoded geometries, one per row.
+    """
+    if geometry is GeometryMode.NONE:
+        return ["null"] * len(df)
+
+    latitude, longitude = df["latitude"].to_numpy(), df["longitude"].to_numpy()
+    if geometry is GeometryMode.POINT:
+        x, y = encode_coordinates(np.stack([longitude, latitude])).tolist()
+        return [POINT_TEMPLATE % point for point in zip(x, y)]
+
+    y0, y1, x0, x1 = encode_coordinates(
+        np.stack(get_grid_cell_bounds(latitude, longitude))
+    ).tolist()
+    return [
+        POLYGON_TEMPLATE % (a, c, a, d, b, d, b, c, a, c)
+        for c, d, a, b in zip(y0, y1, x0, x1)
+    ]
+
+
+def encode_feature_fragments(
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> list[str]:
+    """
+    Encode each row of a GeoDataFrame as a GeoJSON feature without its
+    opening brace and `id` member, so that the feature can be completed
+    with any id as `'{"id":"<id>",' + fragment`.
+
+    The features are written column by column straight from the underlying
+    arrays, without building intermediate dictionaries.
+
+    Parameters:
+    - df (GeoDataFrame): The GeoDataFrame to encode.
+    - columns (list): The columns to include as properties.
+    - geometry (GeometryMode, optional): The geometry to write. Defaults to polygon.
+
+    Returns:
+    list: The encoded feature fragments, one per row.
+    """
+    encoded_columns = [encode_column(df[col]) for col in columns]
+    geometries = encode_geometries(df, geometry)
+
+    fragment_template = (
+        '"type":"Feature","geometry":%s,"properties":{'
+        + ",".join(f'"{col}":%s' for col in columns)
+        + "}}"
+    )
+    return [fragment_template % row for row in zip(geometries, *encoded_columns)]
+
+
+def encode_features(
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    first_id: int = 0,
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> list[str]:
     """
-    Custom date handler for converting dates to ISO format.
+    Encode each row of a GeoDataFrame as a GeoJSON feature, with the
+    features numbered in the order of the rows starting from `first_id`.
 
     Parameters:
-    - obj (object): The object to convert.
+    - df (GeoDataFrame): The GeoDataFrame to encode.
+    - columns (list): The columns to include as properties.
+    - first_id (int, optional): The id of the first feature. Defaults to 0.
+    - geometry (GeometryMode, optional): The geometry to write. Defaults to polygon.
 
     Returns:
-    str: The ISO formatted date string.
+    list: The encoded features, one per row.
     """
-    if isinstance(obj, date) or isinstance(obj, pd.Timestamp):
-        return obj.isoformat()
-    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return [
+        f'{{"id":"{feature_id}",{fragment}'
+        for feature_id, fragment in enumerate(
+            encode_feature_fragments(df, columns, geometry), start=first_id
+        )
+    ]
 
 
 def dataframe_to_geojson(
-    df: gpd.GeoDataFrame, columns: list[str], sort_columns: list[str] | None = None
-) -> dict:
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> bytes:
+    """
+    Encode a GeoDataFrame as a GeoJSON feature collection, with the
+    features numbered in the order of the rows.
+
+    Parameters:
+    - df (GeoDataFrame): The GeoDataFrame to encode.
+    - columns (list): The columns to include as properties.
+    - geometry (GeometryMode, optional): The geometry to write. Defaults to polygon.
+
+    Returns:
+    bytes: The GeoJSON.
+    """
+    if df.empty:
+        return EMPTY_FEATURE_COLLECTION
+
+    features = ",".join(encode_features(df, columns, geometry=geometry))
+
+    return f'{{"type":"FeatureCollection","features":[{features}]}}'.encode()
+
+
+def dataframe_to_timeseries_geojson(
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    cell_columns: list[str],
+    geometry: GeometryMode = GeometryMode.POLYGON,
+) -> bytes:
     """
-    Convert a GeoDataFrame to a GeoJSON.
+    Encode a GeoDataFrame sorted by cell and step as a GeoJSON feature
+    collection with one feature per cell, numbered in the order of the
+    cells. Each property holds the array of the cell's values, in step
+    order, except for the `cell_columns`, which hold the same value for
+    every step of a cell and are written once.
+
+    The rows of a cell are consecutive, so the cells are delimited by
+    comparing the coordinates of adjacent rows and the arrays are slices
+    of the encoded columns.
 
     Parameters:
-    - df (GeoDataFrame): The GeoDataFrame to convert.
-    - columns (list): The columns to include in the GeoJSON.
-    - sort_columns (list): The columns to sort by.
+    - df (GeoDataFrame): The GeoDataFrame to encode.
+    - columns (list): The columns to include as properties.
+    - cell_columns (list): The columns holding one value per cell.
+    - geometry (GeometryMode, optional): The geometry to write. Defaults to polygon.
 
     Returns:
-    dict: The GeoJSON.
+    bytes: The GeoJSON.
     """
-    # Check if the dataframe is empty. If it is, return an
-    # empty GeoJSON where we only assume the geometry column
-    # is present.
     if df.empty:
-        return json.loads(df.to_json())
+        return EMPTY_FEATURE_COLLECTION
+
+    latitude, longitude = df["latitude"].to_numpy(), df["longitude"].to_numpy()
+    new_cell = np.empty(len(df), dtype=bool)
+    new_cell[0] = True
+    new_cell[1:] = (latitude[1:] != latitude[:-1]) | (longitude[1:] != longitude[:-1])
+    starts = np.flatnonzero(new_cell)
+    bounds = list(zip(starts.tolist(), starts[1:].tolist() + [len(df)]))
+
+    encoded_columns = []
+    for col in columns:
+        if col in cell_columns:
+            encoded_columns.append(encode_column(df[col].iloc[starts]))
+        else:
+            encoded = encode_column(df[col])
+            encoded_columns.append(
+                [f"[{','.join(encoded[start:stop])}]" for start, stop in bounds]
+            )
+    geometries = encode_geometries(df.iloc[starts], geometry)
+
+    feature_template = (
+        '{"id":"%d","type":"Feature","geometry":%s,"properties":{'
+        + ",".join(f'"{col}":%s' for col in columns)
+        + "}}"
+    )
+    features = ",".join(
+        [
+            feature_template % (feature_id, *row)
+            for feature_id, row in enumerate(zip(geometries, *encoded_columns))
+        ]
+    )
+
+    return f'{{"type":"FeatureCollection","features":[{features}]}}'.encode()
+
+
+def dataframe_to_grid(
+    df: gpd.GeoDataFrame,
+    columns: list[str],
+    rows: np.ndarray,
+    cols: np.ndarray,
+    origin: tuple[float, float],
+    resolution: float,
+    shape: tuple[int, int],
+) -> bytes:
+    """
+    Encode a GeoDataFrame of grid cells as a JSON object with one array per
+    column instead of one feature per row. The cells are located by their
+    row and column in a grid of the given shape and resolution, whose lower
+    left corner is at `origin`, so no geometries are written.
+
+    Parameters:
+    - df (GeoDataFrame): The GeoDataFrame to encode.
+    - columns (list): The columns to include as properties.
+    - rows (ndarray): The grid row of the cell of each row of `df`.
+    - cols (ndarray): The grid column of the cell of each row of `df`.
+    - origin (tuple): The latitude and longitude of the lower left corner of the grid.
+    - resolution (float): The size of each grid cell.
+    - shape (tuple): The number of rows and columns of the grid.
+
+    Returns:
+    bytes: The JSON object.
+    """
+    grid = {
+        "origin": {"latitude": origin[0], "longitude": origin[1]},
+        "resolution": resolution,
+        "shape": list(shape),
+        "row": np.ascontiguousarray(rows),
+        "col": np.ascontiguousarray(cols),
+        "properties": {col: column_values(df[col]) for col in columns},
+    }
+
+    return orjson.dumps(grid, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class FeatureFragments:
+    """
+    The GeoJSON features of every row of a dataset, with polygon geometries,
+    encoded once and stored back to back in a single buffer. The fragment of row `i` (as returned by
+    `encode_feature_fragments`) is `buffer[offsets[i]:offsets[i + 1]]`, so
+    the features of consecutive rows are one contiguous range of bytes.
+
+    Attributes:
+    - columns (list): The columns included as properties.
+    - buffer (memoryview): The encoded fragments.
+    - offsets (ndarray): Start of every fragment, of length `len(df) + 1`.
+    """
+
+    def __init__(
+        self,
+        df: gpd.GeoDataFrame,
+        columns: list[str],
+        chunk_size: int = 100_000,
+    ):
+        self.columns = columns
+
+        # Encode in chunks to bound the memory used by intermediate strings
+        buffer = bytearray()
+        lengths = np.empty(len(df), dtype=np.int64)
+        for start in range(0, len(df), chunk_size):
+            fragments = encode_feature_fragments(
+                df.iloc[start : start + chunk_size], columns
+            )
+            # The encoded features are pure ASCII, so string lengths are byte lengths
+            lengths[start : start + len(fragments)] = list(map(len, fragments))
+            buffer += "".join(fragments).encode("ascii")
+
+        self.buffer = memoryview(buffer).toreadonly()
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    @classmethod
+    def from_buffer(
+        cls, columns: list[str], buffer: bytes, offsets: np.ndarray
+    ) -> "FeatureFragments":
+        """
+        Restore the fragments from their buffer and offsets, e.g. as saved
+        in a snapshot, without encoding them again.
+
+        Parameters:
+        - columns (list): The columns included as properties.
+        - buffer (bytes): The encoded fragments.
+        - offsets (ndarray): Start of every fragment.
+
+        Returns:
+        FeatureFragments: The restored fragments.
+        """
+        fragments = cls.__new__(cls)
+        fragments.columns = columns
+        fragments.buffer = memoryview(buffer).toreadonly()
+        fragments.offsets = offsets
+        return fragments
 
-    # Sort the columns if a list of columns is provided
-    if sort_columns is not None:
-        df = df.sort_values(by=sort_columns)
+    def features(self, positions: np.ndarray, first_id: int = 0) -> list[bytes]:
+        """
+        Complete the fragments of the given rows into GeoJSON features,
+        numbered in the order of the rows starting from `first_id`.
 
-    # Reset the index to make response cleaner
-    df = df.reset_index(drop=True)
+        Parameters:
+        - positions (ndarray): The positions of the rows.
+        - first_id (int, optional): The id of the first feature. Defaults to 0.
 
-    # Serialize the dataframe as a string
-    geojson_as_string = df[columns + ["geometry"]].to_json(default=custom_date_handler)
+        Returns:
+        list: The encoded features, one per row.
+        """
+        starts = self.offsets[positions].tolist()
+        stops = self.offsets[np.asarray(positions) + 1].tolist()
+        buffer = self.buffer
 
-    # Use json library to convert from serialized string to json
-    return json.loads(geojson_as_string)
+        return [
+            b'{"id":"%d",' % feature_id + buffer[start:stop]
+            for feature_id, (start, stop) in enumerate(
+                zip(starts, stops), start=first_id
+            )
+        ]
+
+    def feature_collection(self, positions: np.ndarray) -> bytes:
+        """
+        Assemble a GeoJSON feature collection from the fragments of the
+        given rows, with the features numbered in the order of the rows.
+
+        Parameters:
+        - positions (ndarray): The positions of the rows.
+
+        Returns:
+        bytes: The GeoJSON.
+        """
+        if len(positions) == 0:
+            return EMPTY_FEATURE_COLLECTION
+
+        features = b",".join(self.features(positions))
+
+        return b'{"type":"FeatureCollection","features":[' + features + b"]}"
+
+
+def encode_object(members: dict[str, bytes | None]) -> bytes:
+    """
+    Combine already encoded JSON values into a JSON object. Members
+    given as None are encoded as null.
+
+    Parameters:
+    - members (dict): The encoded values, keyed by member name.
+
+    Returns:
+    bytes: The JSON object.
+    """
+    return (
+        b"{"
+        + b",".join(
+            json.dumps(name).encode() + b":" + (b"null" if value is None else value)
+            for name, value in members.items()
+        )
+        + b"}"
+    )
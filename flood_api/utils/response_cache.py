@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import Hashable
+
+from prometheus_client import Counter, Gauge
+
+from flood_api.utils.compression import EncodedBody
+
+CACHE_HITS = Counter(
+    "flood_api_response_cache_hits", "Responses served from the response cache"
+)
+CACHE_MISSES = Counter(
+    "flood_api_response_cache_misses", "Responses not found in the response cache"
+)
+CACHE_EVICTIONS = Counter(
+    "flood_api_response_cache_evictions",
+    "Responses evicted from the response cache to stay within its size",
+)
+CACHE_SIZE = Gauge(
+    "flood_api_response_cache_bytes",
+    "Size of the cached response bodies and their compressed variants",
+)
+
+
+class ResponseCache:
+    """
+    A least recently used cache of encoded response bodies, bounded by the
+    total size of the bodies and of their compressed variants.
+
+    Attributes:
+    - max_bytes (int): The maximum total size of the cached bodies. A size
+      of 0 disables the cache.
+    - size (int): The current total size of the cached bodies.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[Hashable, tuple[EncodedBody, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> EncodedBody | None:
+        """
+        Look up a body, marking it as the most recently used.
+
+        Parameters:
+        - key (Hashable): The canonical key of the response.
+
+        Returns:
+        EncodedBody | None: The cached body, or None if it is not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            CACHE_MISSES.inc()
+            return None
+
+        CACHE_HITS.inc()
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, body: EncodedBody):
+        """
+        Store a body as the most recently used one, evicting the least
+        recently used bodies to stay within the maximum size. Storing a body
+        again updates its size, which grows as compressed variants are added.
+
+        Parameters:
+        - key (Hashable): The canonical key of the response.
+        - body (EncodedBody): The body to store.
+        """
+        self.discard(key)
+
+        size = body.size
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (body, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            CACHE_EVICTIONS.inc()
+
+        CACHE_SIZE.set(self.size)
+
+    def discard(self, key: Hashable):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+            CACHE_SIZE.set(self.size)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        CACHE_SIZE.set(self.size)
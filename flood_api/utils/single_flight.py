@@ -0,0 +1,57 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from prometheus_client import Counter
+
+T = TypeVar("T")
+
+COALESCED_REQUESTS = Counter(
+    "flood_api_coalesced_requests",
+    "Requests that shared the computation of an identical concurrent request",
+)
+
+
+class SingleFlight:
+    """
+    Runs a computation once for all concurrent callers with the same key.
+    The first caller starts the computation, and callers arriving while it
+    is in flight wait for its result (or exception) instead of starting
+    their own.
+
+    The computation runs as a separate task, so that it completes for the
+    remaining callers even if the caller that started it is cancelled.
+    """
+
+    def __init__(self):
+        self.tasks: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a computation, or join the computation in flight for the same key.
+
+        Parameters:
+        - key (Hashable): The canonical key of the computation.
+        - compute (Callable): Creates the awaitable to run if none is in flight.
+
+        Returns:
+        The result of the computation.
+        """
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self.tasks[key] = task
+            task.add_done_callback(lambda _: self.finish(key, task))
+        else:
+            COALESCED_REQUESTS.inc()
+
+        return await asyncio.shield(task)
+
+    def finish(self, key: Hashable, task: asyncio.Task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        # Mark the exception as retrieved in case all callers were cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,237 @@
+import fcntl
+import json
+import logging
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+from pydantic import BaseModel
+
+from flood_api.settings import settings
+from flood_api.utils.geospatial_operations import create_cell_polygons
+from flood_api.utils.grid_index import GridIndex
+from flood_api.utils.json_utilities import FeatureFragments
+
+logger = logging.getLogger(__name__)
+
+# Snapshots written in another format, or by a version of the API that
+# encodes features differently, are never loaded
+SNAPSHOT_VERSION = 2
+
+MANIFEST = "manifest.json"
+LOCK = ".lock"
+
+
+def snapshot_directory(path: str) -> Path | None:
+    """
+    Return the directory holding the snapshot of a dataset, if snapshots are
+    enabled by setting `settings.snapshot_dir`.
+
+    Parameters:
+    - path (str): The path of the dataset.
+
+    Returns:
+    Path | None: The snapshot directory of the dataset.
+    """
+    if not settings.snapshot_dir:
+        return None
+    return Path(settings.snapshot_dir) / re.sub(r"[^\w.-]+", "_", path)
+
+
+def parts_metadata(parts: dict[str, tuple]) -> dict[str, list]:
+    # The listing of the files as stored in the manifest, in which the
+    # modification times are strings
+    return json.loads(json.dumps(parts, default=str))
+
+
+@contextmanager
+def snapshot_lock(path: str):
+    """
+    Hold an exclusive lock on the snapshot of a dataset, which is shared by
+    all the processes that use the same snapshot directory. Nothing is
+    locked if snapshots are disabled.
+
+    Parameters:
+    - path (str): The path of the dataset.
+    """
+    directory = snapshot_directory(path)
+    if directory is None:
+        yield
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK, "w") as lock_file:
+        # The lock is released when the file is closed
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def serving_table(gdf: gpd.GeoDataFrame) -> pa.Table:
+    # Missing floats are kept as NaN rather than converted to nulls, so
+    # that float columns can be mapped without being copied
+    table = pa.Table.from_pandas(gdf.drop(columns="geometry"), preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            table = table.set_column(
+                i, field, pa.array(gdf[field.name].to_numpy(), from_pandas=False)
+            )
+    return table
+
+
+def write_atomically(path: Path, write):
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(temporary_path, "wb") as file:
+        write(file)
+    os.replace(temporary_path, path)
+
+
+def save_snapshot(path: str, properties: type[BaseModel], index: GridIndex):
+    """
+    Save the serving layout of a dataset to its snapshot directory, tagged
+    with the metadata of the files it was read from. The data is saved as it
+    is served: sorted by cell, along with the offsets of the cells and the
+    pre-rendered features, if any. The geometries are not saved, as they are
+    rebuilt from the cell centers.
+
+    Every file is written under a temporary name and then renamed, and the
+    manifest is written last, so that an interrupted save leaves the
+    previous snapshot intact. Processes that mapped the files of the
+    previous snapshot keep them mapped after they are removed.
+
+    Parameters:
+    - path (str): The path of the dataset.
+    - properties (type[BaseModel]): The properties of the dataset.
+    - index (GridIndex): The index built from the files of the dataset.
+    """
+    directory = snapshot_directory(path)
+    if directory is None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # The files are named after the data, which never changes in place
+    files = {
+        "columns": f"{index.content_hash}.arrow",
+        "offsets": f"{index.content_hash}.offsets.npy",
+    }
+    write_atomically(
+        directory / files["columns"],
+        lambda file: feather.write_feather(
+            serving_table(index.gdf),
+            file,
+            compression="uncompressed",
+            # Columns of several chunks would be concatenated into the heap
+            # when converted, so every column is a single chunk
+            chunksize=max(len(index.gdf), 1),
+        ),
+    )
+    write_atomically(
+        directory / files["offsets"], lambda file: np.save(file, index.offsets)
+    )
+    if index.fragments is not None:
+        files["fragments"] = f"{index.content_hash}.fragments"
+        files["fragment_offsets"] = f"{index.content_hash}.fragment_offsets.npy"
+        write_atomically(
+            directory / files["fragments"],
+            lambda file: file.write(index.fragments.buffer),
+        )
+        write_atomically(
+            directory / files["fragment_offsets"],
+            lambda file: np.save(file, index.fragments.offsets),
+        )
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "parts": parts_metadata(index.parts),
+        "fields": list(properties.model_fields),
+        "roi": index.roi,
+        "grid_size": index.grid_size,
+        "content_hash": index.content_hash,
+        "files": files,
+    }
+    write_atomically(
+        directory / MANIFEST, lambda file: file.write(json.dumps(manifest).encode())
+    )
+
+    # Remove the files of previous snapshots, but not the temporary files
+    # of a save in progress
+    for file in directory.iterdir():
+        if not file.name.startswith(".") and file.name not in [
+            MANIFEST,
+            *files.values(),
+        ]:
+            file.unlink(missing_ok=True)
+
+    logger.info("Saved snapshot of %s to %s", path, directory)
+
+
+def load_snapshot(
+    path: str, properties: type[BaseModel], parts: dict[str, tuple]
+) -> GridIndex | None:
+    """
+    Load the snapshot of a dataset, if it was saved from the same files.
+
+    The files are memory-mapped read-only rather than read, so the columns,
+    offsets and pre-rendered features are not copied into the heap, and
+    all processes that load the same snapshot share one copy of them in
+    the page cache. Only the geometries, which are rebuilt from the cell
+    centers, and small columns such as booleans are held by each process.
+
+    Parameters:
+    - path (str): The path of the dataset.
+    - properties (type[BaseModel]): The properties of the dataset.
+    - parts (dict): The current metadata of the files of the dataset, as
+    listed by `list_parquet_parts`.
+
+    Returns:
+    GridIndex | None: The index of the dataset, or None if there is no
+    snapshot of the current files.
+    """
+    directory = snapshot_directory(path)
+    if directory is None or not (directory / MANIFEST).exists():
+        return None
+
+    manifest = json.loads((directory / MANIFEST).read_text())
+    if manifest != {
+        **manifest,
+        "version": SNAPSHOT_VERSION,
+        "parts": parts_metadata(parts),
+        "fields": list(properties.model_fields),
+        "roi": settings.glofas_roi,
+        "grid_size": settings.glofas_resolution,
+    }:
+        logger.info("The snapshot of %s is out of date", path)
+        return None
+
+    files = {name: directory / file for name, file in manifest["files"].items()}
+    with pa.memory_map(str(files["columns"])) as source:
+        # The table keeps the file mapped after it is closed
+        df = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+    gdf = gpd.GeoDataFrame(
+        df,
+        geometry=create_cell_polygons(
+            df["latitude"].to_numpy(), df["longitude"].to_numpy()
+        ),
+        # Keep the mapped columns instead of copying them
+        copy=False,
+    )
+
+    index = GridIndex.from_sorted(
+        gdf, np.load(files["offsets"], mmap_mode="r"), manifest["content_hash"]
+    )
+    index.parts = parts
+    if "fragments" in files:
+        with pa.memory_map(str(files["fragments"])) as source:
+            buffer = source.read_buffer()
+        index.fragments = FeatureFragments.from_buffer(
+            list(properties.model_fields),
+            buffer,
+            np.load(files["fragment_offsets"], mmap_mode="r"),
+        )
+
+    logger.info("Loaded snapshot of %s from %s", path, directory)
+    return index
@@ -1,7 +1,10 @@
 from datetime import date
 
+import numpy as np
 from fastapi import HTTPException
 
+from flood_api.models.detailed_types import DetailedLayout
+from flood_api.models.shared_types import ResponseFormat
 from flood_api.settings import settings
 
 GLOFAS_ROI = settings.glofas_roi
@@ -31,6 +34,42 @@ def validate_coordinates(latitude: float, longitude: float) -> None:
         )
 
 
+def validate_coordinates_batch(latitudes: np.ndarray, longitudes: np.ndarray) -> None:
+    """
+    Check if all the given points are within the region of interest (ROI),
+    following the same rules as `validate_coordinates`. If not, raise an
+    HTTPException with status code 404 listing the offending positions.
+
+    Parameters:
+    - latitudes (ndarray): The latitudes of the points.
+    - longitudes (ndarray): The longitudes of the points.
+
+    Returns:
+    None
+    """
+    points_within_roi = (
+        (GLOFAS_ROI["min_lat"] <= latitudes)
+        & (latitudes < GLOFAS_ROI["max_lat"])
+        & (GLOFAS_ROI["min_lon"] <= longitudes)
+        & (longitudes < GLOFAS_ROI["max_lon"])
+    )
+
+    if not points_within_roi.all():
+        outside_roi = np.flatnonzero(~points_within_roi)
+        raise HTTPException(
+            status_code=404,
+            detail=(
+                "Queried coordinates are outside the region of interest "
+                f"at positions {outside_roi[:10].tolist()}"
+                + (
+                    f" and {len(outside_roi) - 10} more"
+                    if len(outside_roi) > 10
+                    else ""
+                )
+            ),
+        )
+
+
 def validate_bounding_box(
     min_lat: float,
     max_lat: float,
@@ -88,3 +127,24 @@ def validate_dates(start_date: date, end_date: date) -> None:
 
     if not date_range_is_valid:
         raise HTTPException(status_code=400, detail="Invalid date range")
+
+
+def validate_layout(layout: DetailedLayout, response_format: ResponseFormat) -> None:
+    """
+    Check if the given layout can be produced in the given response format.
+    The time series layout is only available as GeoJSON. If not, raise an
+    HTTPException with status code 400.
+
+    Parameters:
+    - layout (DetailedLayout): The requested layout.
+    - response_format (ResponseFormat): The requested response format.
+
+    Returns:
+    None
+    """
+    timeseries = layout is DetailedLayout.TIMESERIES
+    if timeseries and response_format is not ResponseFormat.GEOJSON:
+        raise HTTPException(
+            status_code=400,
+            detail="The timeseries layout is only supported for the geojson format.",
+        )